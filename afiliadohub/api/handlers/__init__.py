@@ -21,6 +21,13 @@ from .commission import CommissionSystem
 from .competition_analysis import CompetitionAnalyzer
 from .advanced_analytics import AdvancedAnalytics
 from .export_reports import ReportExporter
+from .rollups import DailyRollups, update_daily_rollups
+from .sketch_metrics import SketchMetrics
+from .commission_ledger import CommissionLedger
+from .analytics_snapshot import AnalyticsSnapshot, SnapshotReader, update_analytics_snapshot
+from .price_refresh import PriceRefreshEngine, refresh_prices
+from .refresh_priority import RefreshPriorityQueue
+from .product_archival import ProductArchiver, archive_old_products
 from .api_extensions import router as extensions_router
 
 __all__ = [
@@ -41,5 +48,17 @@ __all__ = [
     'CompetitionAnalyzer',
     'AdvancedAnalytics',
     'ReportExporter',
+    'DailyRollups',
+    'update_daily_rollups',
+    'SketchMetrics',
+    'CommissionLedger',
+    'AnalyticsSnapshot',
+    'SnapshotReader',
+    'update_analytics_snapshot',
+    'PriceRefreshEngine',
+    'refresh_prices',
+    'RefreshPriorityQueue',
+    'ProductArchiver',
+    'archive_old_products',
     'extensions_router'
 ]
@@ -1,16 +1,27 @@
+import os
 import pandas as pd
-import numpy as np
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 import plotly.graph_objects as go
 import plotly.express as px
 
+from ..utils.cache import analytics_cache
+
 class AdvancedAnalytics:
     def __init__(self):
-        self.cache = {}
+        self.cache = analytics_cache
+        self._breakdowns = {}
     
     async def get_sales_funnel_analysis(self, days: int = 30) -> Dict:
-        """Analisa funil de vendas/vendas"""
+        """Analisa funil de vendas/vendas (cacheado por período)"""
+        return await self.cache.get_or_compute(
+            "funnel",
+            {"days": days},
+            lambda: self._compute_sales_funnel(days)
+        )
+    
+    async def _compute_sales_funnel(self, days: int) -> Dict:
+        """Calcula o funil a partir das tabelas"""
         try:
             from api.utils.supabase_client import get_supabase_manager
             supabase = get_supabase_manager()
@@ -148,44 +159,27 @@ class AdvancedAnalytics:
         return summary
     
     async def generate_performance_report(self, start_date: str, end_date: str) -> Dict:
-        """Gera relatório completo de performance"""
+        """Gera relatório completo de performance (cacheado por período, resolução de dia)"""
+        return await self.cache.get_or_compute(
+            "performance",
+            {"start_date": self.cache.day_key(start_date), "end_date": self.cache.day_key(end_date)},
+            lambda: self._compute_performance_report(start_date, end_date)
+        )
+    
+    async def _compute_performance_report(self, start_date: str, end_date: str) -> Dict:
+        """Monta o relatório de performance a partir das tabelas"""
         try:
-            from api.utils.supabase_client import get_supabase_manager
-            supabase = get_supabase_manager()
-            
-            # Busca todos os dados
-            products = supabase.client.table("products")\
-                .select("*")\
-                .gte("created_at", start_date)\
-                .lte("created_at", end_date)\
-                .execute()
-            
-            stats = supabase.client.table("product_stats")\
-                .select("*")\
-                .execute()
-            
-            commissions = supabase.client.table("commissions")\
-                .select("*")\
-                .gte("calculated_at", start_date)\
-                .lte("calculated_at", end_date)\
-                .execute()
-            
-            telegram_logs = supabase.client.table("product_stats")\
-                .select("product_id, telegram_send_count, last_sent")\
-                .gte("last_sent", start_date)\
-                .lte("last_sent", end_date)\
-                .execute()
+            # Agregações por loja/categoria valem só para este relatório
+            self._breakdowns = {}
             
-            products_data = products.data if products.data else []
-            stats_data = stats.data if stats.data else []
-            commissions_data = commissions.data if commissions.data else []
-            telegram_data = telegram_logs.data if telegram_logs.data else []
+            # Snapshot Parquet local quando habilitado e já exportado; senão, banco
+            frames = None
+            if os.getenv("ANALYTICS_SOURCE") == "snapshot":
+                frames = self._load_frames_from_snapshot(start_date, end_date)
+            if frames is None:
+                frames = self._load_frames_from_database(start_date, end_date)
             
-            # Processa para DataFrame
-            df_products = pd.DataFrame(products_data)
-            df_stats = pd.DataFrame(stats_data)
-            df_commissions = pd.DataFrame(commissions_data)
-            df_telegram = pd.DataFrame(telegram_data)
+            df_products, df_stats, df_commissions, df_telegram = frames
             
             # Merge data
             if not df_products.empty:
@@ -251,6 +245,70 @@ class AdvancedAnalytics:
         except Exception as e:
             return {"error": str(e)}
     
+    def _load_frames_from_database(self, start_date: str, end_date: str):
+        """Busca produtos, estatísticas, comissões e envios via PostgREST"""
+        from api.utils.supabase_client import get_supabase_manager
+        supabase = get_supabase_manager()
+        
+        # Busca todos os dados
+        products = supabase.client.table("products")\
+            .select("*")\
+            .gte("created_at", start_date)\
+            .lte("created_at", end_date)\
+            .execute()
+        
+        stats = supabase.client.table("product_stats")\
+            .select("*")\
+            .execute()
+        
+        commissions = supabase.client.table("commissions")\
+            .select("*")\
+            .gte("calculated_at", start_date)\
+            .lte("calculated_at", end_date)\
+            .execute()
+        
+        telegram_logs = supabase.client.table("product_stats")\
+            .select("product_id, telegram_send_count, last_sent")\
+            .gte("last_sent", start_date)\
+            .lte("last_sent", end_date)\
+            .execute()
+        
+        products_data = products.data if products.data else []
+        stats_data = stats.data if stats.data else []
+        commissions_data = commissions.data if commissions.data else []
+        telegram_data = telegram_logs.data if telegram_logs.data else []
+        
+        # Processa para DataFrame
+        df_products = pd.DataFrame(products_data)
+        df_stats = pd.DataFrame(stats_data)
+        df_commissions = pd.DataFrame(commissions_data)
+        df_telegram = pd.DataFrame(telegram_data)
+        
+        return df_products, df_stats, df_commissions, df_telegram
+    
+    def _load_frames_from_snapshot(self, start_date: str, end_date: str):
+        """Lê do snapshot Parquet local apenas as colunas/partições usadas no relatório"""
+        from api.handlers.analytics_snapshot import SnapshotReader
+        reader = SnapshotReader()
+        
+        if not all(reader.available(t) for t in ("products", "product_stats", "commissions")):
+            return None
+        
+        df_products = reader.read(
+            "products",
+            ["id", "name", "store", "category", "current_price", "discount_percentage", "is_active"],
+            start_date, end_date
+        )
+        df_stats = reader.read("product_stats", ["product_id", "view_count", "click_count", "telegram_send_count"])
+        df_commissions = reader.read(
+            "commissions",
+            ["id", "product_id", "sale_amount", "commission_amount"],
+            start_date, end_date
+        )
+        df_telegram = reader.read("product_stats", ["product_id", "telegram_send_count", "last_sent"], start_date, end_date)
+        
+        return df_products, df_stats, df_commissions, df_telegram
+    
     def _calculate_summary_metrics(self, df: pd.DataFrame) -> Dict:
         """Calcula métricas resumidas"""
         metrics = {
@@ -320,77 +378,84 @@ class AdvancedAnalytics:
                         'view_count', 'click_count', 
                         'engagement_score']].to_dict('records')
     
+    def _group_metrics(self, df: pd.DataFrame, column: str) -> pd.DataFrame:
+        """Calcula todas as métricas por grupo em um único groupby (memoizado por relatório)"""
+        memo_key = (id(df), column)
+        if memo_key in self._breakdowns:
+            return self._breakdowns[memo_key]
+        
+        def col(name: str) -> pd.Series:
+            return df[name] if name in df.columns else pd.Series(0, index=df.index)
+        
+        frame = pd.DataFrame({
+            column: df[column],
+            "current_price": col("current_price"),
+            "view_count": col("view_count"),
+            "click_count": col("click_count"),
+            "sales_count": col("sales_count"),
+            "sale_amount": col("sale_amount"),
+            "discount_percentage": col("discount_percentage")
+        })
+        
+        grouped = frame.groupby(column, sort=False).agg(
+            product_count=("current_price", "size"),
+            avg_price=("current_price", "mean"),
+            total_views=("view_count", "sum"),
+            total_clicks=("click_count", "sum"),
+            total_sales=("sales_count", "sum"),
+            total_revenue=("sale_amount", "sum"),
+            avg_discount=("discount_percentage", "mean")
+        )
+        
+        views = grouped["total_views"]
+        grouped["click_through_rate"] = (grouped["total_clicks"] / views.where(views > 0) * 100).fillna(0)
+        
+        self._breakdowns[memo_key] = grouped
+        return grouped
+    
     def _analyze_by_store(self, df: pd.DataFrame) -> Dict:
         """Analisa performance por loja"""
         if df.empty or 'store' not in df.columns:
             return {}
         
-        store_analysis = {}
+        grouped = self._group_metrics(df, 'store')
         
-        for store in df['store'].unique():
-            store_df = df[df['store'] == store]
-            
-            store_analysis[store] = {
-                "product_count": len(store_df),
-                "avg_price": store_df['current_price'].mean(),
-                "total_views": store_df['view_count'].sum(),
-                "total_clicks": store_df['click_count'].sum(),
-                "total_sales": store_df['sales_count'].sum() if 'sales_count' in store_df.columns else 0,
-                "total_revenue": store_df['sale_amount'].sum() if 'sale_amount' in store_df.columns else 0,
-                "click_through_rate": (store_df['click_count'].sum() / store_df['view_count'].sum() * 100) if store_df['view_count'].sum() > 0 else 0
-            }
-        
-        return store_analysis
+        return grouped[[
+            "product_count", "avg_price", "total_views", "total_clicks",
+            "total_sales", "total_revenue", "click_through_rate"
+        ]].to_dict('index')
     
     def _analyze_by_category(self, df: pd.DataFrame) -> Dict:
         """Analisa performance por categoria"""
         if df.empty or 'category' not in df.columns:
             return {}
         
-        category_analysis = {}
-        
-        for category in df['category'].dropna().unique():
-            cat_df = df[df['category'] == category]
-            
-            category_analysis[category] = {
-                "product_count": len(cat_df),
-                "avg_price": cat_df['current_price'].mean(),
-                "total_views": cat_df['view_count'].sum(),
-                "total_clicks": cat_df['click_count'].sum(),
-                "avg_discount": cat_df['discount_percentage'].mean()
-            }
+        grouped = self._group_metrics(df, 'category')
         
-        return category_analysis
+        return grouped[[
+            "product_count", "avg_price", "total_views", "total_clicks", "avg_discount"
+        ]].to_dict('index')
     
     async def _generate_daily_trends(self, start_date: str, end_date: str) -> Dict:
         """Gera dados para gráfico de tendências diárias"""
         try:
+            from api.handlers.rollups import DailyRollups
+            
+            # Série pré-agregada (rollups diários)
+            trends = await DailyRollups().get_daily_series(start_date, end_date)
+            if trends:
+                return trends
+            
             from api.utils.supabase_client import get_supabase_manager
             supabase = get_supabase_manager()
             
-            # Busca dados diários
+            # Fallback: função do banco sobre as tabelas brutas
             response = supabase.client.rpc("get_daily_trends", {
                 "p_start_date": start_date,
                 "p_end_date": end_date
             }).execute()
             
-            if response.data:
-                return response.data
-            else:
-                # Fallback: gera dados mock
-                dates = pd.date_range(start_date, end_date, freq='D')
-                
-                trends = []
-                for date in dates:
-                    trends.append({
-                        "date": date.strftime('%Y-%m-%d'),
-                        "products_added": np.random.randint(0, 50),
-                        "products_sold": np.random.randint(0, 20),
-                        "total_sales": np.random.randint(0, 1000),
-                        "telegram_sends": np.random.randint(0, 100)
-                    })
-                
-                return trends
+            return response.data if response.data else []
                 
         except Exception as e:
             return {"error": str(e)}
@@ -400,12 +465,12 @@ class AdvancedAnalytics:
         if df.empty:
             return {}
         
-        store_data = self._analyze_by_store(df)
+        grouped = self._group_metrics(df, 'store')
         
-        stores = list(store_data.keys())
-        revenues = [store_data[store]["total_revenue"] for store in stores]
-        products = [store_data[store]["product_count"] for store in stores]
-        conversion = [store_data[store]["click_through_rate"] for store in stores]
+        stores = grouped.index.tolist()
+        revenues = grouped["total_revenue"].tolist()
+        products = grouped["product_count"].tolist()
+        conversion = grouped["click_through_rate"].tolist()
         
         return {
             "stores": stores,
@@ -0,0 +1,412 @@
+"""
+Snapshot colunar local (Parquet) das tabelas usadas pelos relatórios
+
+Layout (particionamento hive):
+    <dir>/commissions/date=YYYY-MM-DD/part-*.parquet
+    <dir>/product_logs/date=YYYY-MM-DD/part-*.parquet
+    <dir>/products/store=<loja>/part-*.parquet
+    <dir>/product_stats/part-full.parquet
+
+commissions e product_logs são só de inserção e seguem por watermark
+(commissions pela data de inserção, created_at: vendas importadas com
+calculated_at antigo ficariam atrás do watermark).
+products é mutável: cada execução anexa as linhas alteradas desde o último
+`updated_at` e a leitura mantém a versão mais recente de cada id (a compactação
+reescreve a partição). product_stats não tem coluna de alteração e é
+regravada inteira, só com as colunas numéricas.
+"""
+import asyncio
+import json
+import logging
+import os
+import shutil
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+from ..utils.supabase_client import get_supabase_manager
+from ..utils.pagination import keyset_paginate
+
+logger = logging.getLogger(__name__)
+
+# Journal da compactação em andamento em cada partição
+COMPACTION_JOURNAL = "_compaction.json"
+
+DEFAULT_SNAPSHOT_DIR = os.getenv("ANALYTICS_SNAPSHOT_DIR", "snapshots")
+
+# Colunas e tipos por tabela; "partition" indica a coluna de partição
+SNAPSHOT_TABLES = {
+    "products": {
+        "columns": {
+            "id": "string", "store": "string", "name": "string", "category": "string",
+            "current_price": "float64", "original_price": "float64",
+            "discount_percentage": "float64", "is_active": "bool",
+            "created_at": "timestamp", "updated_at": "timestamp"
+        },
+        "time_column": "updated_at",
+        "report_time_column": "created_at",
+        "key": "id",
+        "partition": ("store", "store")
+    },
+    "commissions": {
+        "columns": {
+            "id": "string", "product_id": "string", "user_id": "string", "store": "string",
+            "sale_amount": "float64", "commission_rate": "float64",
+            "commission_amount": "float64", "status": "string", "calculated_at": "timestamp"
+        },
+        "time_column": "created_at",
+        "report_time_column": "calculated_at",
+        "key": "id",
+        "partition": ("date", "calculated_at")
+    },
+    "product_logs": {
+        "columns": {
+            "id": "string", "product_id": "string", "old_price": "float64",
+            "new_price": "float64", "change_type": "string", "created_at": "timestamp"
+        },
+        "time_column": "created_at",
+        "report_time_column": "created_at",
+        "key": "id",
+        "partition": ("date", "created_at")
+    },
+    "product_stats": {
+        "columns": {
+            "product_id": "string", "view_count": "float64", "click_count": "float64",
+            "telegram_send_count": "float64", "last_sent": "timestamp"
+        },
+        "time_column": None,
+        "report_time_column": "last_sent",
+        "key": "product_id",
+        "partition": None
+    }
+}
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise ImportError("pyarrow é necessário para o snapshot analítico (pip install pyarrow)")
+
+
+def _arrow_schema(table: str):
+    import pyarrow as pa
+
+    types = {
+        "string": pa.string(),
+        "float64": pa.float64(),
+        "bool": pa.bool_(),
+        "timestamp": pa.timestamp("us", tz="UTC")
+    }
+    return pa.schema([(name, types[kind]) for name, kind in SNAPSHOT_TABLES[table]["columns"].items()])
+
+
+def _utc_timestamp(value: str) -> pd.Timestamp:
+    ts = pd.Timestamp(value)
+    return ts.tz_localize("UTC") if ts.tzinfo is None else ts.tz_convert("UTC")
+
+
+def _to_frame(table: str, rows: List[Dict[str, Any]]) -> pd.DataFrame:
+    """Converte linhas JSON do PostgREST para um DataFrame tipado"""
+    columns = SNAPSHOT_TABLES[table]["columns"]
+    df = pd.DataFrame(rows).reindex(columns=list(columns))
+
+    for name, kind in columns.items():
+        if kind == "timestamp":
+            df[name] = pd.to_datetime(df[name], utc=True, format="ISO8601", errors="coerce")
+        elif kind == "float64":
+            df[name] = pd.to_numeric(df[name], errors="coerce").astype("float64")
+        elif kind == "bool":
+            df[name] = df[name].astype("boolean")
+        else:
+            df[name] = df[name].astype("string")
+
+    return df
+
+
+class AnalyticsSnapshot:
+    """Exporta as tabelas incrementalmente para Parquet particionado"""
+
+    def __init__(self, base_dir: Optional[str] = None, page_size: int = 5000):
+        _require_pyarrow()
+        self.base_dir = Path(base_dir or DEFAULT_SNAPSHOT_DIR)
+        self.base_dir.mkdir(parents=True, exist_ok=True)
+        self.page_size = page_size
+        self.supabase = get_supabase_manager()
+        self._state_file = self.base_dir / "_watermarks.json"
+
+    def _load_state(self) -> Dict[str, Any]:
+        if self._state_file.exists():
+            return json.loads(self._state_file.read_text(encoding="utf-8"))
+        return {}
+
+    def _save_state(self, state: Dict[str, Any]):
+        tmp = self._state_file.with_suffix(".tmp")
+        tmp.write_text(json.dumps(state, indent=2), encoding="utf-8")
+        tmp.replace(self._state_file)
+
+    async def run(self, full: bool = False) -> Dict[str, int]:
+        """Atualiza o snapshot de todas as tabelas (PostgREST e Parquet numa thread)"""
+        return await asyncio.to_thread(self._run, full)
+
+    def _run(self, full: bool) -> Dict[str, int]:
+        state = {} if full else self._load_state()
+        exported = {}
+
+        for table, spec in SNAPSHOT_TABLES.items():
+            try:
+                # Watermark de outra coluna (ou de antes de registrarmos a coluna): reexporta a tabela
+                mark = state.get(table)
+                if mark and mark.get("column") != spec["time_column"]:
+                    logger.info(f"♻️ Watermark de {table} mudou de coluna, reexportando a tabela")
+                    del state[table]
+                    full_table = True
+                else:
+                    full_table = full
+
+                if full_table and (self.base_dir / table).exists():
+                    shutil.rmtree(self.base_dir / table)
+
+                if spec["time_column"]:
+                    self._finish_compactions(table)
+                    exported[table] = self._export_incremental(table, state)
+                else:
+                    exported[table] = self._export_full(table)
+            except Exception as e:
+                logger.error(f"[ERRO] Erro no snapshot de {table}: {e}")
+                exported[table] = 0
+
+        state["last_run"] = datetime.now().isoformat()
+        self._save_state(state)
+
+        logger.info(f"🗄️ Snapshot analítico atualizado: {exported}")
+        return exported
+
+    def _export_incremental(self, table: str, state: Dict[str, Any]) -> int:
+        spec = SNAPSHOT_TABLES[table]
+        time_column, key = spec["time_column"], spec["key"]
+        # A coluna do watermark pode não ir para o Parquet (commissions.created_at)
+        select = ", ".join(dict.fromkeys([*spec["columns"], time_column, key]))
+        mark = state.get(table)
+        start_after = (mark["ts"], mark["key"]) if mark else None
+        run_id = datetime.now().strftime("%Y%m%d%H%M%S%f")
+
+        def query_factory():
+            return self.supabase.client.table(table).select(select)
+
+        total = 0
+        for page_number, rows in enumerate(keyset_paginate(
+            query_factory, key=key, order_column=time_column,
+            page_size=self.page_size, start_after=start_after
+        )):
+            self._write_partitions(table, _to_frame(table, rows), f"part-{run_id}-{page_number:05d}")
+
+            state[table] = {"column": time_column, "ts": rows[-1][time_column], "key": rows[-1][key]}
+            self._save_state(state)
+            total += len(rows)
+
+        if total:
+            self.compact(table)
+
+        return total
+
+    def _export_full(self, table: str) -> int:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        spec = SNAPSHOT_TABLES[table]
+        select = ", ".join(spec["columns"])
+        target = self.base_dir / table
+        target.mkdir(parents=True, exist_ok=True)
+        tmp_file = target / "part-full.parquet.tmp"
+
+        total = 0
+        writer = pq.ParquetWriter(tmp_file, _arrow_schema(table), compression="zstd")
+        try:
+            for rows in keyset_paginate(
+                lambda: self.supabase.client.table(table).select(select),
+                key=spec["key"], page_size=self.page_size
+            ):
+                frame = _to_frame(table, rows)
+                writer.write_table(pa.Table.from_pandas(frame, schema=_arrow_schema(table), preserve_index=False))
+                total += len(rows)
+        finally:
+            writer.close()
+
+        tmp_file.replace(target / "part-full.parquet")
+        return total
+
+    def _write_partitions(self, table: str, frame: pd.DataFrame, file_stem: str):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        partition_name, source_column = SNAPSHOT_TABLES[table]["partition"]
+        if partition_name == "date":
+            values = frame[source_column].dt.strftime("%Y-%m-%d").fillna("unknown")
+        else:
+            values = frame[source_column].fillna("unknown")
+
+        schema = _arrow_schema(table)
+        for value, part in frame.groupby(values, sort=False):
+            directory = self.base_dir / table / f"{partition_name}={value}"
+            directory.mkdir(parents=True, exist_ok=True)
+            pq.write_table(
+                pa.Table.from_pandas(part, schema=schema, preserve_index=False),
+                directory / f"{file_stem}.parquet",
+                compression="zstd"
+            )
+
+    def compact(self, table: str, min_files: int = 8):
+        """Reescreve partições com muitos arquivos em um só (mantendo a última versão por chave)"""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        spec = SNAPSHOT_TABLES[table]
+        for directory in (self.base_dir / table).glob("*=*"):
+            self._finish_compaction(directory)
+            files = sorted(directory.glob("part-*.parquet"))
+            if len(files) < min_files:
+                continue
+
+            frame = pq.read_table(files, schema=_arrow_schema(table)).to_pandas()
+            if spec["time_column"] == "updated_at":
+                frame = frame.sort_values(spec["time_column"]).drop_duplicates(spec["key"], keep="last")
+
+            # Prefixo "_": a leitura (pyarrow.dataset) ignora temporários e o journal
+            tmp_file = directory / "_compacted.parquet.tmp"
+            pq.write_table(pa.Table.from_pandas(frame, schema=_arrow_schema(table), preserve_index=False),
+                           tmp_file, compression="zstd")
+
+            # O compactado entra no lugar antes de as partes saírem; o journal
+            # permite terminar a troca se o processo cair entre as duas etapas
+            target = f"part-{datetime.now().strftime('%Y%m%d%H%M%S%f')}.parquet"
+            (directory / COMPACTION_JOURNAL).write_text(
+                json.dumps({"target": target, "replaced": [file.name for file in files]}),
+                encoding="utf-8"
+            )
+            tmp_file.replace(directory / target)
+            self._finish_compaction(directory)
+
+    def _finish_compactions(self, table: str):
+        for directory in (self.base_dir / table).glob("*=*"):
+            self._finish_compaction(directory)
+
+    @staticmethod
+    def _finish_compaction(directory: Path):
+        """Conclui (ou descarta) uma compactação interrompida na partição"""
+        journal = directory / COMPACTION_JOURNAL
+        if not journal.exists():
+            return
+
+        entry = json.loads(journal.read_text(encoding="utf-8"))
+        # Sem o arquivo compactado no lugar, as partes originais continuam valendo
+        if (directory / entry["target"]).exists():
+            for name in entry["replaced"]:
+                try:
+                    (directory / name).unlink()
+                except FileNotFoundError:
+                    pass
+
+        try:
+            (directory / "_compacted.parquet.tmp").unlink()
+        except FileNotFoundError:
+            pass
+        journal.unlink()
+
+
+class SnapshotReader:
+    """Leitura colunar do snapshot com poda de partições e memory-map"""
+
+    def __init__(self, base_dir: Optional[str] = None):
+        self.base_dir = Path(base_dir or DEFAULT_SNAPSHOT_DIR)
+
+    def available(self, table: str) -> bool:
+        return any((self.base_dir / table).rglob("*.parquet")) if (self.base_dir / table).exists() else False
+
+    def last_run(self) -> Optional[str]:
+        state_file = self.base_dir / "_watermarks.json"
+        if not state_file.exists():
+            return None
+        return json.loads(state_file.read_text(encoding="utf-8")).get("last_run")
+
+    def read(
+        self,
+        table: str,
+        columns: Optional[List[str]] = None,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        stores: Optional[List[str]] = None
+    ) -> pd.DataFrame:
+        """
+        Lê apenas as colunas e partições necessárias.
+
+        `start_date`/`end_date` filtram a coluna de tempo do relatório
+        (`report_time_column`) e podam as partições por data; `stores` poda as
+        partições por loja.
+        """
+        _require_pyarrow()
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+        from pyarrow import fs
+
+        spec = SNAPSHOT_TABLES[table]
+        if not self.available(table):
+            return pd.DataFrame(columns=columns or list(spec["columns"]))
+
+        schema = _arrow_schema(table)
+        partitioning = None
+        partition_field = spec["partition"][0] if spec["partition"] else None
+        if partition_field:
+            partitioning = ds.partitioning(pa.schema([(partition_field, pa.string())]), flavor="hive")
+            if partition_field not in schema.names:
+                schema = schema.append(pa.field(partition_field, pa.string()))
+
+        dataset = ds.dataset(
+            str(self.base_dir / table),
+            schema=schema,
+            format="parquet",
+            partitioning=partitioning,
+            filesystem=fs.LocalFileSystem(use_mmap=True)
+        )
+
+        wanted = list(columns or spec["columns"])
+        dedup = spec["time_column"] == "updated_at"
+        time_column = spec["report_time_column"]
+        filter_by_time = bool(start_date or end_date)
+
+        read_columns = wanted + ([spec["key"], "updated_at"] if dedup else []) + ([time_column] if filter_by_time else [])
+        read_columns = list(dict.fromkeys(read_columns))
+
+        expression = None
+
+        def add(condition):
+            nonlocal expression
+            expression = condition if expression is None else expression & condition
+
+        if partition_field == "date":
+            if start_date:
+                add(ds.field("date") >= start_date[:10])
+            if end_date:
+                add(ds.field("date") <= end_date[:10])
+        if partition_field == "store" and stores:
+            add(ds.field("store").isin(stores))
+
+        frame = dataset.to_table(columns=read_columns, filter=expression).to_pandas()
+
+        if dedup and not frame.empty:
+            frame = frame.sort_values("updated_at").drop_duplicates(spec["key"], keep="last")
+
+        # Filtro fino pela coluna de tempo (as partições são por dia)
+        if start_date:
+            frame = frame[frame[time_column] >= _utc_timestamp(start_date)]
+        if end_date:
+            frame = frame[frame[time_column] <= _utc_timestamp(end_date)]
+
+        return frame[wanted].reset_index(drop=True)
+
+
+async def update_analytics_snapshot(full: bool = False) -> Dict[str, int]:
+    """Tarefa agendada: atualiza o snapshot Parquet"""
+    return await AnalyticsSnapshot().run(full=full)
@@ -1,7 +1,9 @@
 from fastapi import APIRouter, HTTPException, Query, BackgroundTasks
+from fastapi.responses import FileResponse, StreamingResponse
 from typing import List, Optional
 from datetime import datetime, timedelta
 import json
+import os
 
 router = APIRouter(prefix="/api/v2", tags=["extended"])
 
@@ -23,6 +25,91 @@ async def get_sales_funnel(
     
     return result
 
+@router.get("/analytics/daily")
+async def get_daily_rollups(
+    days: int = Query(30, ge=1, le=365),
+    store: Optional[str] = None,
+    category: Optional[str] = None
+):
+    """Retorna série diária pré-agregada (rollups)"""
+    from api.handlers.rollups import DailyRollups
+    
+    end_date = datetime.now().isoformat()
+    start_date = (datetime.now() - timedelta(days=days)).isoformat()
+    
+    try:
+        series = await DailyRollups().get_daily_series(start_date, end_date, store, category)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    return {
+        "period_days": days,
+        "store": store,
+        "category": category,
+        "series": series
+    }
+
+@router.get("/analytics/reach")
+async def get_reach_metrics(
+    days: int = Query(30, ge=1, le=365),
+    store: Optional[str] = None,
+    top: int = Query(10, ge=1, le=100)
+):
+    """Retorna usuários únicos, produtos distintos enviados e mais enviados (aproximados)"""
+    from api.handlers.sketch_metrics import SketchMetrics
+    
+    try:
+        return await SketchMetrics().get_reach_summary(days, store, top)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/commissions/balances")
+async def get_commission_balances(
+    scope: str = Query("store", pattern="^(all|store|user)$"),
+    scope_id: Optional[str] = None
+):
+    """Saldos correntes de comissões (pending/approved/paid/cancelled)"""
+    from api.handlers.commission_ledger import CommissionLedger
+    
+    ledger = CommissionLedger()
+    if scope == "all" or scope_id:
+        result = await ledger.get_balance(scope, scope_id or "")
+    else:
+        result = await ledger.get_balances(scope)
+    
+    if "error" in result:
+        raise HTTPException(status_code=500, detail=result["error"])
+    return result
+
+@router.get("/prices/refresh-queue")
+async def get_price_refresh_queue(limit: int = Query(50, ge=1, le=500)):
+    """Próximos produtos da fila de atualização de preços, com a prioridade de cada um (cache curto)"""
+    from api.handlers.refresh_priority import get_queue_preview
+
+    try:
+        preview = await get_queue_preview(limit)
+        products = preview["products"]
+
+        return {
+            "count": len(products),
+            "weights": preview["weights"],
+            "min_age_hours": preview["min_age_hours"],
+            "generated_at": preview["generated_at"],
+            "products": [
+                {
+                    "id": p["id"],
+                    "name": p.get("name"),
+                    "store": p.get("store"),
+                    "current_price": p.get("current_price"),
+                    "last_checked": p.get("last_checked"),
+                    "priority": p["refresh_priority"]
+                }
+                for p in products
+            ]
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.get("/competition/analyze")
 async def analyze_competition(
     product_url: str = Query(..., description="URL do produto para análise"),
@@ -106,78 +193,97 @@ async def generate_recommendations_background(user_id: str, limit: int):
 
 @router.get("/reports/export")
 async def export_report(
-    report_type: str = Query(..., description="Tipo: products, sales, analytics"),
-    format: str = Query("excel", description="Formato: excel, pdf, csv"),
+    report_type: str = Query(..., description="Tipo: products, sales, comprehensive"),
+    format: str = Query("excel", description="Formato: excel, pdf, csv, ndjson, parquet, arrow"),
     start_date: Optional[str] = None,
-    end_date: Optional[str] = None
+    end_date: Optional[str] = None,
+    gzip: bool = Query(False, description="Comprime CSV/NDJSON em gzip")
 ):
-    """Exporta relatório em diferentes formatos"""
-    from api.handlers.export_reports import ReportExporter
+    """
+    Exporta relatório em diferentes formatos.
+    
+    CSV/NDJSON de produtos e vendas saem em streaming; os demais viram um
+    job de exportação (ver /reports/jobs/{job_id}).
+    """
+    from api.handlers.export_stream import EXPORT_SOURCES, STREAM_FORMATS, stream_export
     
     if not end_date:
         end_date = datetime.now().isoformat()
     if not start_date:
         start_date = (datetime.now() - timedelta(days=30)).isoformat()
     
-    exporter = ReportExporter()
+    if report_type not in EXPORT_SOURCES and report_type != "comprehensive":
+        raise HTTPException(status_code=400, detail="Tipo de relatório inválido")
     
-    if report_type == "comprehensive":
-        result = await exporter.generate_comprehensive_report(start_date, end_date, format)
-    else:
-        # Busca dados específicos
-        from api.utils.supabase_client import get_supabase_manager
-        supabase = get_supabase_manager()
+    # Tabelas linha a linha em CSV/NDJSON: streaming paginado, memória constante
+    if report_type in EXPORT_SOURCES and format in STREAM_FORMATS:
+        filename = f"{report_type}_{start_date[:10]}_{end_date[:10]}.{STREAM_FORMATS[format]['extension']}"
+        headers = {"Content-Disposition": f'attachment; filename="{filename}{".gz" if gzip else ""}"'}
+        media_type = STREAM_FORMATS[format]["content_type"]
+        if gzip:
+            media_type = "application/gzip"
         
-        if report_type == "products":
-            response = supabase.client.table("products")\
-                .select("*")\
-                .gte("created_at", start_date)\
-                .lte("created_at", end_date)\
-                .execute()
-            
-            data = {"products": response.data} if response.data else {}
-            
-        elif report_type == "sales":
-            response = supabase.client.table("commissions")\
-                .select("*")\
-                .gte("calculated_at", start_date)\
-                .lte("calculated_at", end_date)\
-                .execute()
-            
-            data = {"commissions": response.data} if response.data else {}
-            
-        else:
-            raise HTTPException(status_code=400, detail="Tipo de relatório inválido")
-        
-        # Exporta
-        if format == "excel":
-            content = await exporter.export_to_excel(data, report_type)
-            filename = f"{report_type}_{start_date[:10]}_{end_date[:10]}.xlsx"
-            content_type = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        
-        elif format == "pdf":
-            content = await exporter.export_to_pdf(data, report_type)
-            filename = f"{report_type}_{start_date[:10]}_{end_date[:10]}.pdf"
-            content_type = 'application/pdf'
-        
-        elif format == "csv":
-            content = await exporter.export_to_csv(data, report_type)
-            filename = f"{report_type}_{start_date[:10]}_{end_date[:10]}.csv"
-            content_type = 'text/csv'
-        
-        else:
-            raise HTTPException(status_code=400, detail="Formato não suportado")
-        
-        result = {
-            "filename": filename,
-            "content": content,
-            "content_type": content_type
-        }
+        return StreamingResponse(
+            stream_export(report_type, format, start_date, end_date, compress=gzip),
+            media_type=media_type,
+            headers=headers
+        )
     
-    if 'error' in result:
-        raise HTTPException(status_code=500, detail=result['error'])
+    return await create_export_job(report_type, format, start_date, end_date)
+
+@router.post("/reports/jobs")
+async def create_export_job(
+    report_type: str = Query(..., description="Tipo: products, sales, comprehensive"),
+    format: str = Query("excel", description="Formato: excel, pdf, csv, ndjson, parquet, arrow"),
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None
+):
+    """Enfileira a renderização do relatório em um processo separado"""
+    from api.handlers.export_jobs import export_jobs
     
-    return result
+    if not end_date:
+        end_date = datetime.now().isoformat()
+    if not start_date:
+        start_date = (datetime.now() - timedelta(days=30)).isoformat()
+    
+    try:
+        job = await export_jobs.submit(report_type, format, start_date, end_date)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _export_job_response(job)
+
+@router.get("/reports/jobs/{job_id}")
+async def get_export_job(job_id: str):
+    """Estado de um job de exportação"""
+    from api.handlers.export_jobs import export_jobs
+    
+    job = export_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job não encontrado ou expirado")
+    return _export_job_response(job)
+
+@router.get("/reports/jobs/{job_id}/download")
+async def download_export_job(job_id: str):
+    """Baixa o arquivo de um job concluído"""
+    from api.handlers.export_jobs import export_jobs
+    
+    job = export_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job não encontrado ou expirado")
+    if job["status"] != "done":
+        raise HTTPException(status_code=409, detail=f"Job ainda não concluído ({job['status']})")
+    
+    return FileResponse(job["path"], media_type=job["content_type"], filename=job["filename"])
+
+def _export_job_response(job: dict) -> dict:
+    return {
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "filename": job["filename"],
+        "error": job.get("error"),
+        "status_url": f"/api/v2/reports/jobs/{job['job_id']}",
+        "download_url": f"/api/v2/reports/jobs/{job['job_id']}/download"
+    }
 
 @router.get("/monitoring/health")
 async def detailed_health_check():
@@ -239,6 +345,10 @@ async def detailed_health_check():
     except Exception as e:
         checks["metrics_error"] = str(e)
     
+    # Eficiência do cache de analytics
+    from api.utils.cache import analytics_cache
+    checks["analytics_cache"] = dict(analytics_cache.stats)
+    
     # Verifica espaço em disco (simulado)
     checks["storage"] = {
         "status": "normal",
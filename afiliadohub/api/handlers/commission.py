@@ -1,10 +1,30 @@
 import asyncio
+import csv
+import io
 import json
+import os
+import uuid
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from typing import Any, Dict, List, Optional
 from decimal import Decimal
 
+import pandas as pd
+
 from ..utils.supabase_client import get_supabase_manager
+from .commission_stream import (
+    COMMISSION_COLUMNS,
+    ByDayReducer,
+    ByStoreReducer,
+    RowsReducer,
+    TotalsReducer,
+    aggregate_commissions
+)
+
+# Tamanho dos lotes de lookup/insert na importação em massa
+BULK_CHUNK_SIZE = 500
+
+# Linhas detalhadas no relatório de comissões (o restante só entra nos totais)
+REPORT_MAX_ROWS = int(os.getenv("COMMISSION_REPORT_MAX_ROWS", "1000"))
 
 class CommissionSystem:
     def __init__(self):
@@ -62,112 +82,246 @@ class CommissionSystem:
         except Exception as e:
             return {"error": str(e)}
     
+    async def calculate_commissions_bulk(self, sales: List[Dict[str, Any]], chunk_size: int = BULK_CHUNK_SIZE) -> Dict:
+        """
+        Calcula e registra comissões de várias vendas de uma vez.
+        
+        Cada venda: {"product_id", "sale_amount", "user_id"?, "sold_at"?}.
+        As lojas são resolvidas com uma consulta in_() por lote de produtos e
+        os registros são gravados em inserts em lote. Retorna o resultado de
+        cada linha, na ordem de entrada.
+        """
+        try:
+            results: List[Dict[str, Any]] = [None] * len(sales)
+            
+            # Validação linha a linha
+            valid = []
+            for index, sale in enumerate(sales):
+                product_id = sale.get("product_id")
+                try:
+                    # products.id é UUID: um id malformado derrubaria o in_() do lote inteiro
+                    product_id = str(uuid.UUID(str(product_id))) if product_id else None
+                    valid_id = True
+                except ValueError:
+                    valid_id = False
+                try:
+                    amount = float(sale.get("sale_amount"))
+                except (TypeError, ValueError):
+                    amount = None
+                
+                if not valid_id:
+                    results[index] = {"row": index, "success": False, "error": "product_id inválido"}
+                elif not product_id:
+                    results[index] = {"row": index, "success": False, "error": "product_id ausente"}
+                elif amount is None or amount < 0:
+                    results[index] = {"row": index, "success": False, "error": "sale_amount inválido"}
+                else:
+                    valid.append({
+                        "row": index,
+                        "product_id": product_id,
+                        "sale_amount": amount,
+                        "user_id": sale.get("user_id") or None,
+                        "calculated_at": sale.get("sold_at") or None
+                    })
+            
+            if valid:
+                df = pd.DataFrame(valid)
+                
+                # Lojas dos produtos
+                stores = self._lookup_product_stores(df["product_id"].unique().tolist(), chunk_size)
+                df["store"] = df["product_id"].astype(str).map(stores)
+                
+                for row in df.loc[df["store"].isna(), "row"]:
+                    results[row] = {"row": int(row), "success": False, "error": "Produto não encontrado"}
+                df = df[df["store"].notna()]
+                
+                # Taxas e comissões (vetorizado)
+                rates = {store: float(rate) for store, rate in self.commission_rates.items()}
+                df["commission_rate"] = df["store"].map(rates).fillna(0.05)
+                df["commission_amount"] = df["sale_amount"] * df["commission_rate"]
+                df["status"] = "pending"
+                df["calculated_at"] = df["calculated_at"].fillna(datetime.now().isoformat())
+                
+                columns = ["product_id", "store", "sale_amount", "commission_rate",
+                           "commission_amount", "status", "calculated_at", "user_id"]
+                rows = df["row"].tolist()
+                records = df[columns].astype(object).where(df[columns].notna(), None).to_dict("records")
+                
+                for start in range(0, len(records), chunk_size):
+                    chunk_rows = rows[start:start + chunk_size]
+                    chunk = records[start:start + chunk_size]
+                    errors = self._insert_commission_chunk(chunk)
+                    
+                    for row, record, error in zip(chunk_rows, chunk, errors):
+                        if error:
+                            results[row] = {"row": row, "success": False, "error": error}
+                        else:
+                            results[row] = {
+                                "row": row,
+                                "success": True,
+                                "commission": record["commission_amount"],
+                                "rate": record["commission_rate"],
+                                "store": record["store"]
+                            }
+            
+            succeeded = [r for r in results if r["success"]]
+            
+            return {
+                "success": len(succeeded) == len(results),
+                "total": len(results),
+                "inserted": len(succeeded),
+                "failed": len(results) - len(succeeded),
+                "total_commission": sum(r["commission"] for r in succeeded),
+                "results": results
+            }
+            
+        except Exception as e:
+            return {"error": str(e)}
+    
+    def _lookup_product_stores(self, product_ids: List[Any], chunk_size: int) -> Dict[str, str]:
+        """Mapeia product_id -> loja com uma consulta in_() por lote"""
+        stores = {}
+        
+        for start in range(0, len(product_ids), chunk_size):
+            response = self.supabase.client.table("products")\
+                .select("id, store")\
+                .in_("id", product_ids[start:start + chunk_size])\
+                .execute()
+            
+            for product in response.data or []:
+                stores[str(product["id"])] = product["store"]
+        
+        return stores
+    
+    def _insert_commission_chunk(self, records: List[Dict[str, Any]]) -> List[Optional[str]]:
+        """
+        Insere um lote de comissões. Se o lote falhar, tenta linha a linha
+        para isolar os registros com problema. Retorna o erro de cada linha.
+        """
+        try:
+            self.supabase.client.table("commissions").insert(records).execute()
+            return [None] * len(records)
+        except Exception:
+            pass
+        
+        errors = []
+        for record in records:
+            try:
+                self.supabase.client.table("commissions").insert(record).execute()
+                errors.append(None)
+            except Exception as e:
+                errors.append(str(e))
+        return errors
+    
     async def get_user_commissions(self, user_id: str, period_days: int = 30) -> Dict:
         """Busca comissões de um usuário"""
         try:
             start_date = (datetime.now() - timedelta(days=period_days)).isoformat()
             
-            response = self.supabase.client.table("commissions")\
-                .select("*")\
-                .eq("user_id", user_id)\
-                .gte("calculated_at", start_date)\
-                .execute()
+            # Uma passada: totais, por loja e as 50 comissões mais recentes
+            results = aggregate_commissions(
+                {
+                    "totals": TotalsReducer(),
+                    "by_store": ByStoreReducer(),
+                    "recent": RowsReducer(limit=50, keep_last=True, columns=COMMISSION_COLUMNS + ["user_id"])
+                },
+                start_date=start_date,
+                user_id=user_id
+            )
             
-            commissions = response.data if response.data else []
-            
-            # Calcula totais
-            total_sales = sum(c["sale_amount"] for c in commissions)
-            total_commission = sum(c["commission_amount"] for c in commissions)
-            
-            # Agrupa por loja
-            by_store = {}
-            for c in commissions:
-                store = c["store"]
-                if store not in by_store:
-                    by_store[store] = {
-                        "sales": 0,
-                        "commission": 0,
-                        "count": 0
-                    }
-                by_store[store]["sales"] += c["sale_amount"]
-                by_store[store]["commission"] += c["commission_amount"]
-                by_store[store]["count"] += 1
+            # Saldo acumulado do usuário (pending/approved/paid), leitura O(1)
+            from .commission_ledger import CommissionLedger
+            balance = await CommissionLedger().get_balance("user", str(user_id))
             
             return {
                 "period_days": period_days,
-                "total_sales": total_sales,
-                "total_commission": total_commission,
-                "commission_by_store": by_store,
-                "commissions": commissions[:50]  # Limita histórico
+                "balance": balance,
+                "total_sales": results["totals"]["sales"],
+                "total_commission": results["totals"]["commission"],
+                "commission_by_store": results["by_store"],
+                "commissions": results["recent"][::-1]  # Limita histórico
             }
             
         except Exception as e:
             return {"error": str(e)}
     
-    async def generate_commission_report(self, start_date: str, end_date: str) -> Dict:
-        """Gera relatório de comissões para um período"""
+    async def generate_commission_report(self, start_date: str, end_date: str, max_rows: int = REPORT_MAX_ROWS) -> Dict:
+        """
+        Gera relatório de comissões para um período.
+        
+        As comissões são lidas página a página e agregadas em uma única
+        passada; "data" traz só as primeiras `max_rows` linhas (o detalhe
+        completo sai em streaming por /reports/export?report_type=sales).
+        """
         try:
-            response = self.supabase.client.table("commissions")\
-                .select("*")\
-                .gte("calculated_at", start_date)\
-                .lte("calculated_at", end_date)\
-                .execute()
+            # Por dia: rollups pré-agregados quando cobrem o período em dias inteiros
+            from .rollups import DailyRollups
+            daily_totals = await DailyRollups().get_commission_daily_totals(start_date, end_date)
             
-            commissions = response.data if response.data else []
+            reducers = {
+                "totals": TotalsReducer(),
+                "by_store": ByStoreReducer(),
+                "data": RowsReducer(
+                    transform=lambda c: {
+                        "Data": c["calculated_at"][:10],
+                        "Loja": c["store"],
+                        "Venda (R$)": c["sale_amount"],
+                        "Comissão (%)": c["commission_rate"] * 100,
+                        "Comissão (R$)": c["commission_amount"],
+                        "Status": c["status"]
+                    },
+                    limit=max_rows
+                )
+            }
+            if daily_totals is None:
+                reducers["by_day"] = ByDayReducer()
+            
+            results = aggregate_commissions(reducers, start_date, end_date)
+            totals = results["totals"]
             
-            if not commissions:
+            if not totals["count"]:
                 return {"message": "Nenhuma comissão no período"}
             
-            # Processa dados
-            df_data = []
-            for c in commissions:
-                df_data.append({
-                    "Data": c["calculated_at"][:10],
-                    "Loja": c["store"],
-                    "Venda (R$)": c["sale_amount"],
-                    "Comissão (%)": c["commission_rate"] * 100,
-                    "Comissão (R$)": c["commission_amount"],
-                    "Status": c["status"]
-                })
-            
-            # Agregações
             summary = {
                 "period": f"{start_date[:10]} a {end_date[:10]}",
-                "total_sales": sum(c["sale_amount"] for c in commissions),
-                "total_commission": sum(c["commission_amount"] for c in commissions),
-                "commission_by_store": {},
-                "daily_totals": {}
+                "total_sales": totals["sales"],
+                "total_commission": totals["commission"],
+                "commission_by_store": results["by_store"],
+                "daily_totals": daily_totals if daily_totals is not None else results["by_day"]
             }
             
-            # Por loja
-            for c in commissions:
-                store = c["store"]
-                if store not in summary["commission_by_store"]:
-                    summary["commission_by_store"][store] = {
-                        "sales": 0,
-                        "commission": 0,
-                        "count": 0
-                    }
-                summary["commission_by_store"][store]["sales"] += c["sale_amount"]
-                summary["commission_by_store"][store]["commission"] += c["commission_amount"]
-                summary["commission_by_store"][store]["count"] += 1
-            
-            # Por dia
-            for c in commissions:
-                date = c["calculated_at"][:10]
-                if date not in summary["daily_totals"]:
-                    summary["daily_totals"][date] = {
-                        "sales": 0,
-                        "commission": 0
-                    }
-                summary["daily_totals"][date]["sales"] += c["sale_amount"]
-                summary["daily_totals"][date]["commission"] += c["commission_amount"]
-            
             return {
                 "summary": summary,
-                "data": df_data,
-                "count": len(commissions)
+                "data": results["data"],
+                "count": totals["count"],
+                "truncated": totals["count"] > len(results["data"])
             }
             
         except Exception as e:
             return {"error": str(e)}
+
+
+def parse_sales_csv(content) -> List[Dict[str, Any]]:
+    """
+    Lê vendas de um CSV (colunas: product_id, sale_amount, user_id, sold_at).
+    Aceita bytes ou str; separador ',' ou ';'.
+    """
+    if isinstance(content, bytes):
+        content = content.decode("utf-8-sig")
+    
+    try:
+        dialect = csv.Sniffer().sniff(content[:2048], delimiters=",;")
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.DictReader(io.StringIO(content), dialect=dialect)
+    
+    sales = []
+    for row in reader:
+        row = {(k or "").strip().lower(): (v or "").strip() for k, v in row.items()}
+        sales.append({
+            "product_id": row.get("product_id"),
+            "sale_amount": row.get("sale_amount", "").replace(",", "."),
+            "user_id": row.get("user_id"),
+            "sold_at": row.get("sold_at")
+        })
+    return sales
@@ -0,0 +1,144 @@
+"""
+Livro-razão de comissões: saldos correntes e transições de status em lote
+
+Os lançamentos e saldos são mantidos no banco (sql/migration_v3_commission_ledger.sql):
+cada comissão inserida ou com status alterado gera um lançamento e atualiza
+os saldos da loja, do usuário e o geral. Aqui ficam as leituras O(1) e as
+transições em lote.
+"""
+import logging
+from typing import Any, Dict, List, Optional
+
+from ..utils.supabase_client import get_supabase_manager
+
+logger = logging.getLogger(__name__)
+
+COMMISSION_STATUSES = ("pending", "approved", "paid", "cancelled")
+
+# Status de origem permitidos para cada status de destino
+ALLOWED_TRANSITIONS = {
+    "approved": ("pending",),
+    "paid": ("approved",),
+    "cancelled": ("pending", "approved")
+}
+
+# Lote de ids por UPDATE (limita o tamanho da URL do PostgREST)
+TRANSITION_CHUNK_SIZE = 500
+
+
+def _empty_balance(scope: str, scope_id: str) -> Dict[str, Any]:
+    balance = {status: 0 for status in COMMISSION_STATUSES}
+    balance.update({"scope": scope, "scope_id": scope_id, "total_sales": 0, "sales_count": 0})
+    return balance
+
+
+class CommissionLedger:
+    """Saldos por loja/usuário e mudanças de status de comissões"""
+
+    def __init__(self):
+        self.supabase = get_supabase_manager()
+
+    async def get_balance(self, scope: str = "all", scope_id: str = "") -> Dict[str, Any]:
+        """Saldo de um escopo ('all', 'store' ou 'user')"""
+        try:
+            response = self.supabase.client.table("commission_balances")\
+                .select("*")\
+                .eq("scope", scope)\
+                .eq("scope_id", scope_id)\
+                .limit(1)\
+                .execute()
+
+            rows = response.data or []
+            return rows[0] if rows else _empty_balance(scope, scope_id)
+
+        except Exception as e:
+            return {"error": str(e)}
+
+    async def get_balances(self, scope: str = "store") -> Dict[str, Any]:
+        """Saldos de todas as lojas (ou usuários), para dashboards"""
+        try:
+            response = self.supabase.client.table("commission_balances")\
+                .select("*")\
+                .eq("scope", scope)\
+                .execute()
+
+            return {row["scope_id"]: row for row in response.data or []}
+
+        except Exception as e:
+            return {"error": str(e)}
+
+    async def get_entries(
+        self,
+        commission_id: Optional[Any] = None,
+        store: Optional[str] = None,
+        user_id: Optional[str] = None,
+        limit: int = 100
+    ) -> List[Dict[str, Any]]:
+        """Últimos lançamentos do livro-razão"""
+        query = self.supabase.client.table("commission_ledger").select("*")
+
+        if commission_id is not None:
+            query = query.eq("commission_id", str(commission_id))
+        if store:
+            query = query.eq("store", store)
+        if user_id:
+            query = query.eq("user_id", user_id)
+
+        response = query.order("id", desc=True).limit(limit).execute()
+        return response.data or []
+
+    async def transition(
+        self,
+        commission_ids: List[Any],
+        to_status: str,
+        chunk_size: int = TRANSITION_CHUNK_SIZE
+    ) -> Dict[str, Any]:
+        """
+        Muda o status de várias comissões de uma vez.
+
+        Só são alteradas as comissões cujo status atual permite a transição;
+        as demais voltam em "skipped". Cada UPDATE afeta um lote inteiro e os
+        saldos são ajustados pelo trigger do banco.
+        """
+        if to_status not in ALLOWED_TRANSITIONS:
+            return {"error": f"Status de destino inválido: {to_status}"}
+
+        try:
+            ids = list(dict.fromkeys(commission_ids))
+            updated: List[Any] = []
+
+            for start in range(0, len(ids), chunk_size):
+                chunk = ids[start:start + chunk_size]
+
+                response = self.supabase.client.table("commissions")\
+                    .update({"status": to_status})\
+                    .in_("id", chunk)\
+                    .in_("status", list(ALLOWED_TRANSITIONS[to_status]))\
+                    .execute()
+
+                updated.extend(row["id"] for row in response.data or [])
+
+            updated_keys = {str(i) for i in updated}
+            skipped = [i for i in ids if str(i) not in updated_keys]
+
+            logger.info(f"[OK] {len(updated)} comissões -> {to_status} ({len(skipped)} ignoradas)")
+
+            return {
+                "success": True,
+                "status": to_status,
+                "updated": len(updated),
+                "updated_ids": updated,
+                "skipped": skipped
+            }
+
+        except Exception as e:
+            logger.error(f"[ERRO] Erro na transição de comissões: {e}")
+            return {"error": str(e)}
+
+    async def rebuild(self) -> Dict[str, Any]:
+        """Recalcula os saldos a partir da tabela commissions"""
+        try:
+            self.supabase.client.rpc("rebuild_commission_balances", {}).execute()
+            return {"success": True}
+        except Exception as e:
+            return {"error": str(e)}
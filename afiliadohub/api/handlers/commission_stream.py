@@ -0,0 +1,170 @@
+"""
+Agregação de comissões em uma única passada, página a página
+
+Os relatórios são compostos por redutores: cada um recebe as linhas uma a
+uma (`add`) e devolve seu pedaço do resultado (`result`). A memória usada
+depende só do número de lojas/dias, não do número de comissões.
+"""
+from collections import deque
+from typing import Any, Dict, Iterator, List, Optional
+
+from ..utils.supabase_client import get_supabase_manager
+from ..utils.pagination import keyset_paginate
+
+# Colunas lidas por padrão (evita select("*"))
+COMMISSION_COLUMNS = [
+    "id", "product_id", "store", "sale_amount", "commission_rate",
+    "commission_amount", "status", "calculated_at"
+]
+
+
+class Reducer:
+    """Interface dos redutores"""
+
+    # Colunas de que o redutor precisa
+    columns: List[str] = []
+
+    def add(self, row: Dict[str, Any]):
+        raise NotImplementedError
+
+    def result(self) -> Any:
+        raise NotImplementedError
+
+
+class TotalsReducer(Reducer):
+    """Total de vendas, comissões e quantidade"""
+
+    columns = ["sale_amount", "commission_amount"]
+
+    def __init__(self):
+        self.sales = 0
+        self.commission = 0
+        self.count = 0
+
+    def add(self, row: Dict[str, Any]):
+        self.sales += row["sale_amount"] or 0
+        self.commission += row["commission_amount"] or 0
+        self.count += 1
+
+    def result(self) -> Dict[str, Any]:
+        return {"sales": self.sales, "commission": self.commission, "count": self.count}
+
+
+class GroupReducer(Reducer):
+    """Vendas/comissões/quantidade agrupadas por uma chave derivada da linha"""
+
+    columns = ["sale_amount", "commission_amount"]
+
+    def __init__(self, key_func, include_count: bool = True):
+        self.key_func = key_func
+        self.include_count = include_count
+        self.groups: Dict[Any, Dict[str, Any]] = {}
+
+    def add(self, row: Dict[str, Any]):
+        key = self.key_func(row)
+        group = self.groups.get(key)
+        if group is None:
+            group = {"sales": 0, "commission": 0}
+            if self.include_count:
+                group["count"] = 0
+            self.groups[key] = group
+
+        group["sales"] += row["sale_amount"] or 0
+        group["commission"] += row["commission_amount"] or 0
+        if self.include_count:
+            group["count"] += 1
+
+    def result(self) -> Dict[Any, Dict[str, Any]]:
+        return self.groups
+
+
+class ByStoreReducer(GroupReducer):
+    columns = ["store", "sale_amount", "commission_amount"]
+
+    def __init__(self):
+        super().__init__(lambda row: row["store"])
+
+
+class ByDayReducer(GroupReducer):
+    columns = ["calculated_at", "sale_amount", "commission_amount"]
+
+    def __init__(self):
+        super().__init__(lambda row: row["calculated_at"][:10], include_count=False)
+
+
+class ByStatusReducer(GroupReducer):
+    columns = ["status", "sale_amount", "commission_amount"]
+
+    def __init__(self):
+        super().__init__(lambda row: row["status"])
+
+
+class RowsReducer(Reducer):
+    """
+    Guarda as linhas (opcionalmente transformadas). Com `limit`, mantém só as
+    primeiras ou, com `keep_last`, as últimas `limit` linhas.
+    """
+
+    def __init__(
+        self,
+        transform=None,
+        limit: Optional[int] = None,
+        keep_last: bool = False,
+        columns: Optional[List[str]] = None
+    ):
+        self.transform = transform
+        self.limit = limit
+        self.columns = columns or COMMISSION_COLUMNS
+        self.rows = deque(maxlen=limit) if keep_last else []
+
+    def add(self, row: Dict[str, Any]):
+        if isinstance(self.rows, list) and self.limit is not None and len(self.rows) >= self.limit:
+            return
+        self.rows.append(self.transform(row) if self.transform else row)
+
+    def result(self) -> List[Any]:
+        return list(self.rows)
+
+
+def stream_commissions(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    user_id: Optional[str] = None,
+    columns: Optional[List[str]] = None,
+    page_size: int = 1000
+) -> Iterator[Dict[str, Any]]:
+    """Itera comissões do período por keyset (calculated_at, id)"""
+    supabase = get_supabase_manager()
+    select = sorted(set(columns or COMMISSION_COLUMNS) | {"id", "calculated_at"})
+
+    def query_factory():
+        query = supabase.client.table("commissions").select(", ".join(select))
+        if start_date:
+            query = query.gte("calculated_at", start_date)
+        if end_date:
+            query = query.lte("calculated_at", end_date)
+        if user_id:
+            query = query.eq("user_id", user_id)
+        return query
+
+    for page in keyset_paginate(query_factory, key="id", order_column="calculated_at", page_size=page_size):
+        yield from page
+
+
+def aggregate_commissions(
+    reducers: Dict[str, Reducer],
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    user_id: Optional[str] = None,
+    page_size: int = 1000
+) -> Dict[str, Any]:
+    """Passa cada comissão por todos os redutores e devolve {nome: resultado}"""
+    columns = set()
+    for reducer in reducers.values():
+        columns.update(reducer.columns)
+
+    for row in stream_commissions(start_date, end_date, user_id, list(columns), page_size):
+        for reducer in reducers.values():
+            reducer.add(row)
+
+    return {name: reducer.result() for name, reducer in reducers.items()}
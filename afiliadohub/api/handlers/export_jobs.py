@@ -0,0 +1,292 @@
+"""
+Fila de jobs de exportação (Excel/PDF/CSV/Parquet) renderizados fora do event loop
+
+Cada pedido vira um job com id determinístico (hash dos parâmetros, com as
+datas reduzidas ao dia). A renderização roda em um pool de processos e o
+arquivo final fica em disco com TTL; pedidos do mesmo relatório/dia dentro
+do TTL reaproveitam o mesmo job/arquivo.
+O estado de cada job é um JSON ao lado do artefato, então qualquer worker
+da API consegue consultar e servir o download. O worker que renderiza grava
+seu dono (host:pid) e um heartbeat no estado: um job "running" de um
+worker que morreu é dado como falho e o próximo pedido o refaz.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EXPORT_DIR = os.getenv("EXPORT_JOBS_DIR", "exports")
+DEFAULT_EXPORT_TTL = int(os.getenv("EXPORT_JOBS_TTL", "3600"))
+DEFAULT_EXPORT_WORKERS = int(os.getenv("EXPORT_JOBS_WORKERS", "2"))
+# Segundos entre heartbeats de um job em andamento; 3 perdidos = worker morto
+DEFAULT_EXPORT_HEARTBEAT = float(os.getenv("EXPORT_JOBS_HEARTBEAT", "15"))
+
+JOB_FORMATS = {
+    "excel": {"extension": "xlsx", "content_type": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"},
+    "pdf": {"extension": "pdf", "content_type": "application/pdf"},
+    "csv": {"extension": "csv", "content_type": "text/csv"},
+    "ndjson": {"extension": "ndjson", "content_type": "application/x-ndjson"},
+    "parquet": {"extension": "parquet", "content_type": "application/vnd.apache.parquet"},
+    "arrow": {"extension": "arrow", "content_type": "application/vnd.apache.arrow.file"}
+}
+
+# Formatos aceitos por relatório (o completo não tem NDJSON)
+REPORT_FORMATS = {
+    "products": set(JOB_FORMATS),
+    "sales": set(JOB_FORMATS),
+    "comprehensive": {"excel", "pdf", "csv", "parquet", "arrow"}
+}
+
+
+def render_export(params: Dict[str, Any], path: str):
+    """Executado no processo filho: busca os dados e grava o arquivo em `path`"""
+    asyncio.run(_render_export(params, path))
+
+
+async def _render_export(params: Dict[str, Any], path: str):
+    from api.handlers.export_reports import ReportExporter
+    from api.handlers.export_stream import STREAM_FORMATS, iter_export_pages, stream_export
+
+    report_type = params["report_type"]
+    format = params["format"]
+    start_date = params["start_date"]
+    end_date = params["end_date"]
+    exporter = ReportExporter()
+
+    if report_type == "comprehensive":
+        result = await exporter.generate_comprehensive_report(start_date, end_date, format)
+        if "error" in result:
+            raise Exception(result["error"])
+        with open(path, "wb") as f:
+            f.write(result["content"])
+
+    elif format == "excel":
+        sheet_name = "Produtos" if report_type == "products" else "Vendas"
+        exporter.write_excel_streaming(
+            path,
+            {},
+            {sheet_name: iter_export_pages(report_type, start_date, end_date)}
+        )
+
+    elif format in STREAM_FORMATS:
+        with open(path, "wb") as f:
+            for chunk in stream_export(report_type, format, start_date, end_date):
+                f.write(chunk)
+
+    elif format in ("parquet", "arrow"):
+        from api.handlers.export_columnar import write_columnar_export
+        write_columnar_export(report_type, format, path, start_date, end_date)
+
+    elif format == "pdf":
+        # Linhas consumidas página a página enquanto o PDF é paginado
+        key = "products" if report_type == "products" else "commissions"
+        rows = (row for page in iter_export_pages(report_type, start_date, end_date) for row in page)
+        exporter.write_pdf(path, {key: rows}, report_type)
+
+    else:
+        raise ValueError(f"Formato não suportado: {format}")
+
+
+class ExportJobQueue:
+    """Jobs de exportação com artefatos em disco"""
+
+    def __init__(
+        self,
+        base_dir: Optional[str] = None,
+        ttl: int = DEFAULT_EXPORT_TTL,
+        max_workers: int = DEFAULT_EXPORT_WORKERS,
+        heartbeat: float = DEFAULT_EXPORT_HEARTBEAT
+    ):
+        self.base_dir = Path(base_dir or DEFAULT_EXPORT_DIR)
+        self.ttl = ttl
+        self.max_workers = max_workers
+        self.heartbeat = heartbeat
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._tasks = set()
+
+    @staticmethod
+    def job_id_for(params: Dict[str, Any]) -> str:
+        return hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()[:24]
+
+    def _executor_instance(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: o processo filho não herda o event loop nem threads do pai
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def _meta_path(self, job_id: str) -> Path:
+        return self.base_dir / f"{job_id}.json"
+
+    def _save(self, job: Dict[str, Any]):
+        self.base_dir.mkdir(parents=True, exist_ok=True)
+        tmp = self._meta_path(job["job_id"]).with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(job))
+        os.replace(tmp, self._meta_path(job["job_id"]))
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Estado do job (None se não existe ou expirou)"""
+        try:
+            job = json.loads(self._meta_path(job_id).read_text())
+        except (FileNotFoundError, ValueError):
+            return None
+
+        if self._expired(job):
+            self._remove(job)
+            return None
+
+        if job["status"] in ("queued", "running") and not self._owner_alive(job):
+            job["status"] = "failed"
+            job["error"] = f"worker {job.get('owner')} parou de responder"
+            self._save(job)
+        return job
+
+    def _owner_alive(self, job: Dict[str, Any]) -> bool:
+        """Dono no mesmo host: confere o pid; em outro host: heartbeat recente"""
+        host, _, pid = (job.get("owner") or "").rpartition(":")
+        if os.name == "posix" and host == socket.gethostname() and pid.isdigit():
+            try:
+                os.kill(int(pid), 0)
+            except ProcessLookupError:
+                return False
+            except PermissionError:
+                pass
+        return time.time() - job.get("heartbeat_at", job["created_at"]) < self.heartbeat * 3
+
+    def _expired(self, job: Dict[str, Any]) -> bool:
+        age = time.time() - job["created_at"]
+        if job["status"] == "done":
+            return age > self.ttl or not Path(job["path"]).exists()
+        # Jobs órfãos (processo reiniciado no meio) expiram também
+        return age > self.ttl
+
+    def _remove(self, job: Dict[str, Any]):
+        for path in (job.get("path"), str(self._meta_path(job["job_id"]))):
+            if path:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    async def submit(self, report_type: str, format: str, start_date: str, end_date: str) -> Dict[str, Any]:
+        """Enfileira (ou reaproveita) o job e devolve seu estado"""
+        if report_type not in REPORT_FORMATS:
+            raise ValueError(f"Tipo de relatório não suportado: {report_type}")
+        if format not in REPORT_FORMATS[report_type]:
+            raise ValueError(f"Formato não suportado para {report_type}: {format}")
+
+        self.cleanup_expired()
+
+        params = {
+            "report_type": report_type,
+            "format": format,
+            "start_date": start_date,
+            "end_date": end_date
+        }
+        # Mesmo dia = mesmo pedido (datas padrão usam o horário atual); o
+        # arquivo é renderizado com as datas completas do primeiro pedido
+        job_id = self.job_id_for({**params, "start_date": start_date[:10], "end_date": end_date[:10]})
+
+        job = self.get(job_id)
+        if job and job["status"] != "failed":
+            return job
+
+        extension = JOB_FORMATS[format]["extension"]
+        now = time.time()
+        job = {
+            "job_id": job_id,
+            "status": "queued",
+            "params": params,
+            "created_at": now,
+            "owner": self.owner,
+            "heartbeat_at": now,
+            "filename": f"{report_type}_{params['start_date'][:10]}_{params['end_date'][:10]}.{extension}",
+            "content_type": JOB_FORMATS[format]["content_type"],
+            "path": str(self.base_dir / f"{job_id}.{extension}"),
+            "error": None
+        }
+        self._save(job)
+
+        task = asyncio.create_task(self._run(job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+        return job
+
+    async def _run(self, job: Dict[str, Any]):
+        # Nome único por tentativa: outro worker refazendo o mesmo job não escreve no mesmo arquivo
+        tmp_path = f"{job['path']}.{uuid.uuid4().hex[:8]}.part"
+        job["status"] = "running"
+        self._save(job)
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+
+        try:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self._executor_instance(), render_export, job["params"], tmp_path)
+            os.replace(tmp_path, job["path"])
+
+            job["status"] = "done"
+            job["size"] = os.path.getsize(job["path"])
+            logger.info(f"[OK] Exportação {job['job_id']} concluída ({job['filename']})")
+
+        except Exception as e:
+            job["status"] = "failed"
+            job["error"] = str(e)
+            logger.error(f"[ERRO] Exportação {job['job_id']} falhou: {e}")
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+
+        finally:
+            heartbeat.cancel()
+
+        self._save(job)
+
+    async def _heartbeat(self, job: Dict[str, Any]):
+        while True:
+            await asyncio.sleep(self.heartbeat)
+            job["heartbeat_at"] = time.time()
+            self._save(job)
+
+    def cleanup_expired(self) -> int:
+        """Remove artefatos e estados vencidos"""
+        if not self.base_dir.exists():
+            return 0
+
+        removed = 0
+        for meta in self.base_dir.glob("*.json"):
+            if self.get(meta.stem) is None:
+                removed += 1
+
+        # Parciais de workers que morreram no meio da renderização
+        for part in self.base_dir.glob("*.part"):
+            try:
+                if time.time() - part.stat().st_mtime > self.ttl:
+                    part.unlink()
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# Instância global do processo da API
+export_jobs = ExportJobQueue()
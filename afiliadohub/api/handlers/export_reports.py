@@ -1,21 +1,158 @@
+import asyncio
+import numpy as np
 import pandas as pd
 import io
+import os
+import tempfile
 from datetime import datetime
-from typing import Dict, List
+from typing import Any, Dict, Iterable, List, Optional
 import json
 
+import xlsxwriter
+
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas as pdf_canvas
+
+# Linhas por bloco de tabela no PDF (~1 página A4 com fonte 8)
+PDF_ROWS_PER_TABLE = 45
+
+# Flowables gerados à frente do que o ReportLab está paginando
+PDF_LOOKAHEAD = 4
+
+# Estilos criados uma vez e compartilhados por todas as tabelas
+SUMMARY_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1E3A8A')),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 12),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.whitesmoke, colors.lightgrey])
+])
+
+PRODUCTS_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3B82F6')),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 10),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 6),
+    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.whitesmoke, colors.white]),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+    ('FONTSIZE', (0, 1), (-1, -1), 8)
+])
+
+STORE_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#10B981')),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 11),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.whitesmoke),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.grey)
+])
+
+
+class NumberedCanvas(pdf_canvas.Canvas):
+    """
+    Canvas com rodapé "Página X de Y" sem guardar as páginas.
+    
+    Y é um form XObject referenciado em todas as páginas e definido só no
+    save(), quando o total é conhecido; cada página é finalizada na hora.
+    """
+    
+    FOOTER_FONT = ('Helvetica-Oblique', 8)
+    TOTAL_FORM = "pageTotal"
+    
+    def showPage(self):
+        self._draw_footer()
+        super().showPage()
+    
+    def save(self):
+        if len(self._code):
+            self.showPage()
+        
+        self.beginForm(self.TOTAL_FORM)
+        self.setFont(*self.FOOTER_FONT)
+        self.setFillColor(colors.grey)
+        self.drawString(0, 0, str(self.getPageNumber() - 1))
+        self.endForm()
+        
+        super().save()
+    
+    def _draw_footer(self):
+        self.saveState()
+        self.setFont(*self.FOOTER_FONT)
+        self.setFillColor(colors.grey)
+        self.drawString(72, 40, "AfiliadoHub - Relatório Gerado Automaticamente")
+        
+        # Texto alinhado à esquerda de uma caixa que cabe até "Página 99999 de 99999"
+        label = f"Página {self.getPageNumber()} de "
+        x = A4[0] - 72 - stringWidth("Página 99999 de 99999", *self.FOOTER_FONT)
+        self.drawString(x, 40, label)
+        self.translate(x + stringWidth(label, *self.FOOTER_FONT), 40)
+        self.doForm(self.TOTAL_FORM)
+        self.restoreState()
+
+
+class _LazyFlowables(list):
+    """
+    Lista que o doc.build() consome pela frente e que é reabastecida de um
+    gerador: só PDF_LOOKAHEAD flowables existem ao mesmo tempo.
+    """
+    
+    def __init__(self, flowables: Iterable):
+        super().__init__()
+        self._source = iter(flowables)
+    
+    def __len__(self) -> int:
+        while super().__len__() < PDF_LOOKAHEAD:
+            flowable = next(self._source, None)
+            if flowable is None:
+                break
+            self.append(flowable)
+        return super().__len__()
+
 
 class ReportExporter:
     def __init__(self):
         self.styles = getSampleStyleSheet()
         
-    async def export_to_excel(self, data: Dict, report_type: str) -> bytes:
-        """Exporta dados para Excel"""
+    async def export_to_excel(
+        self,
+        data: Dict,
+        report_type: str,
+        row_sheets: Optional[Dict[str, Iterable[List[Dict]]]] = None,
+        engine: str = "xlsxwriter"
+    ) -> bytes:
+        """
+        Exporta dados para Excel.
+        
+        Por padrão usa o modo streaming (xlsxwriter, memória constante);
+        engine="openpyxl" mantém o caminho antigo via pandas.
+        """
+        if engine == "xlsxwriter":
+            fd, path = tempfile.mkstemp(suffix=".xlsx")
+            os.close(fd)
+            try:
+                # xlsxwriter (e as páginas de row_sheets) são síncronos: fora do event loop
+                await asyncio.to_thread(self.write_excel_streaming, path, data, row_sheets)
+                with open(path, "rb") as f:
+                    return f.read()
+            finally:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        
         try:
             output = io.BytesIO()
             
@@ -53,148 +190,228 @@ class ReportExporter:
         except Exception as e:
             raise Exception(f"Erro ao exportar para Excel: {str(e)}")
     
-    async def export_to_pdf(self, data: Dict, report_type: str) -> bytes:
-        """Exporta dados para PDF"""
+    def write_excel_streaming(
+        self,
+        path: str,
+        data: Dict,
+        row_sheets: Optional[Dict[str, Iterable[List[Dict]]]] = None
+    ) -> int:
+        """
+        Escreve o Excel em `path` com xlsxwriter em modo constant_memory.
+        
+        `row_sheets` mapeia nome da aba -> páginas de linhas (ex.: páginas
+        lidas do banco); cada página é escrita e descartada em seguida, então
+        só uma linha fica em memória por aba. Retorna o total de linhas.
+        """
+        workbook = xlsxwriter.Workbook(path, {"constant_memory": True, "strings_to_urls": False})
+        header_format = workbook.add_format({"bold": True, "bg_color": "#1E3A8A", "font_color": "#FFFFFF"})
+        total_rows = 0
+        
         try:
-            buffer = io.BytesIO()
-            
-            doc = SimpleDocTemplate(
-                buffer,
-                pagesize=A4,
-                rightMargin=72,
-                leftMargin=72,
-                topMargin=72,
-                bottomMargin=72
-            )
+            # Página de resumo
+            if 'summary' in data:
+                self._write_dict_rows(workbook.add_worksheet('Resumo'), [[data['summary']]], header_format)
             
-            elements = []
+            # Produtos (e outras abas linha a linha)
+            sheets = dict(row_sheets or {})
+            if 'Produtos' not in sheets and data.get('products'):
+                sheets['Produtos'] = [data['products']]
             
-            # Título
-            title_style = ParagraphStyle(
-                'CustomTitle',
-                parent=self.styles['Heading1'],
-                fontSize=24,
-                spaceAfter=30,
-                textColor=colors.HexColor('#1E3A8A')
-            )
+            for name, pages in sheets.items():
+                total_rows += self._write_dict_rows(workbook.add_worksheet(name), pages, header_format)
             
-            elements.append(Paragraph(f"Relatório AfiliadoHub - {report_type}", title_style))
-            elements.append(Paragraph(f"Gerado em: {datetime.now().strftime('%d/%m/%Y %H:%M')}", self.styles['Normal']))
-            elements.append(Spacer(1, 20))
+            # Página de estatísticas
+            if data.get('statistics'):
+                self._write_dict_rows(workbook.add_worksheet('Estatísticas'), [[data['statistics']]], header_format)
             
-            # Resumo
-            if 'summary' in data:
-                elements.append(Paragraph("📊 Resumo Geral", self.styles['Heading2']))
-                
-                summary_data = [
-                    ['Métrica', 'Valor']
-                ]
-                
-                for key, value in data['summary'].items():
-                    if isinstance(value, (int, float)):
-                        if 'percent' in key.lower() or 'rate' in key.lower():
-                            value = f"{value:.2f}%"
-                        elif 'price' in key.lower() or 'amount' in key.lower():
-                            value = f"R$ {value:,.2f}"
-                        else:
-                            value = f"{value:,}"
-                    
-                    summary_data.append([key.replace('_', ' ').title(), str(value)])
-                
-                summary_table = Table(summary_data, colWidths=[3*inch, 2*inch])
-                summary_table.setStyle(TableStyle([
-                    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1E3A8A')),
-                    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                    ('FONTSIZE', (0, 0), (-1, 0), 12),
-                    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                    ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.whitesmoke, colors.lightgrey])
-                ]))
+            # Página por loja
+            by_store = data.get('by_store') or data.get('store_analysis')
+            if by_store:
+                store_rows = [{'loja': store, **metrics} for store, metrics in by_store.items()]
+                self._write_dict_rows(workbook.add_worksheet('Por Loja'), [store_rows], header_format)
+        finally:
+            workbook.close()
+        
+        return total_rows
+    
+    @staticmethod
+    def _excel_value(value: Any) -> Any:
+        # Escalares do pandas/numpy (int64, bool_, float32) viram tipos Python, não texto
+        if isinstance(value, np.generic):
+            value = value.item()
+        if value is None or isinstance(value, (bool, int, float, str)):
+            return value
+        if isinstance(value, (list, dict)):
+            return json.dumps(value, ensure_ascii=False, default=str)
+        return str(value)
+    
+    def _write_dict_rows(self, worksheet, pages: Iterable[List[Dict]], header_format) -> int:
+        """Escreve páginas de dicts em ordem; o cabeçalho vem da primeira linha"""
+        columns = None
+        row_index = 0
+        
+        for page in pages:
+            for row in page:
+                if columns is None:
+                    columns = list(row.keys())
+                    worksheet.write_row(0, 0, columns, header_format)
+                    worksheet.freeze_panes(1, 0)
                 
-                elements.append(summary_table)
-                elements.append(Spacer(1, 30))
+                row_index += 1
+                worksheet.write_row(row_index, 0, [self._excel_value(row.get(c)) for c in columns])
+        
+        return row_index
+    
+    async def export_to_pdf(self, data: Dict, report_type: str) -> bytes:
+        """Exporta dados para PDF (todas as linhas, em páginas numeradas)"""
+        try:
+            buffer = io.BytesIO()
+            self.write_pdf(buffer, data, report_type)
             
-            # Produtos (limitado)
-            if 'products' in data and data['products']:
-                elements.append(Paragraph("📦 Produtos", self.styles['Heading2']))
-                
-                # Limita a 50 produtos no PDF
-                products_data = [['ID', 'Nome', 'Loja', 'Preço', 'Desconto']]
-                
-                for product in data['products'][:50]:
-                    products_data.append([
-                        str(product.get('id', '')),
-                        str(product.get('name', ''))[:30],
-                        str(product.get('store', '')),
-                        f"R$ {product.get('current_price', 0):,.2f}",
-                        f"{product.get('discount_percentage', 0)}%" if product.get('discount_percentage') else ''
-                    ])
-                
-                products_table = Table(products_data, colWidths=[0.5*inch, 3*inch, inch, inch, inch])
-                products_table.setStyle(TableStyle([
-                    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3B82F6')),
-                    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                    ('FONTSIZE', (0, 0), (-1, 0), 10),
-                    ('BOTTOMPADDING', (0, 0), (-1, 0), 6),
-                    ('BACKGROUND', (0, 1), (-1, -1), colors.whitesmoke),
-                    ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-                    ('FONTSIZE', (0, 1), (-1, -1), 8)
-                ]))
-                
-                elements.append(products_table)
-                
-                if len(data['products']) > 50:
-                    elements.append(Paragraph(f"... e mais {len(data['products']) - 50} produtos", self.styles['Italic']))
-                
-                elements.append(Spacer(1, 30))
+            buffer.seek(0)
+            return buffer.getvalue()
             
-            # Por loja
-            if 'by_store' in data and data['by_store']:
-                elements.append(Paragraph("🏪 Análise por Loja", self.styles['Heading2']))
-                
-                store_data = [['Loja', 'Produtos', 'Vendas (R$)', 'Taxa Conversão']]
-                
-                for store, metrics in data['by_store'].items():
-                    store_data.append([
-                        store.title(),
-                        str(metrics.get('product_count', 0)),
-                        f"R$ {metrics.get('total_revenue', 0):,.2f}",
-                        f"{metrics.get('click_through_rate', 0):.1f}%"
-                    ])
-                
-                store_table = Table(store_data, colWidths=[1.5*inch, inch, 1.5*inch, 1.5*inch])
-                store_table.setStyle(TableStyle([
-                    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#10B981')),
-                    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                    ('FONTSIZE', (0, 0), (-1, 0), 11),
-                    ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
-                    ('BACKGROUND', (0, 1), (-1, -1), colors.whitesmoke),
-                    ('GRID', (0, 0), (-1, -1), 0.5, colors.grey)
-                ]))
+        except Exception as e:
+            raise Exception(f"Erro ao exportar para PDF: {str(e)}")
+    
+    def write_pdf(self, output, data: Dict, report_type: str):
+        """
+        Monta o PDF em `output` (arquivo ou buffer).
+        
+        Tabelas longas são divididas em blocos de PDF_ROWS_PER_TABLE linhas
+        com cabeçalho repetido, gerados sob demanda enquanto o ReportLab
+        pagina. "products"/"commissions" podem ser iteráveis (ex.: páginas
+        lidas do banco): só os blocos em paginação ficam em memória, além
+        das páginas já prontas (comprimidas) que o ReportLab guarda até o
+        save().
+        """
+        doc = SimpleDocTemplate(
+            output,
+            pagesize=A4,
+            rightMargin=72,
+            leftMargin=72,
+            topMargin=72,
+            bottomMargin=72,
+            title=f"Relatório AfiliadoHub - {report_type}"
+        )
+        
+        # Gera PDF (rodapé e "Página X de Y" desenhados pelo canvas)
+        doc.build(_LazyFlowables(self._pdf_flowables(data, report_type)), canvasmaker=NumberedCanvas)
+    
+    def _pdf_flowables(self, data: Dict, report_type: str):
+        # Título
+        title_style = ParagraphStyle(
+            'CustomTitle',
+            parent=self.styles['Heading1'],
+            fontSize=24,
+            spaceAfter=30,
+            textColor=colors.HexColor('#1E3A8A')
+        )
+        
+        yield Paragraph(f"Relatório AfiliadoHub - {report_type}", title_style)
+        yield Paragraph(f"Gerado em: {datetime.now().strftime('%d/%m/%Y %H:%M')}", self.styles['Normal'])
+        yield Spacer(1, 20)
+        
+        # Resumo
+        if 'summary' in data:
+            yield Paragraph("📊 Resumo Geral", self.styles['Heading2'])
+            
+            summary_data = []
+            for key, value in data['summary'].items():
+                if isinstance(value, (int, float)):
+                    if 'percent' in key.lower() or 'rate' in key.lower():
+                        value = f"{value:.2f}%"
+                    elif 'price' in key.lower() or 'amount' in key.lower():
+                        value = f"R$ {value:,.2f}"
+                    else:
+                        value = f"{value:,}"
                 
-                elements.append(store_table)
-                elements.append(Spacer(1, 30))
+                summary_data.append([key.replace('_', ' ').title(), str(value)])
             
-            # Rodapé
-            elements.append(Paragraph("---", self.styles['Normal']))
-            elements.append(Paragraph("AfiliadoHub - Relatório Gerado Automaticamente", self.styles['Italic']))
-            elements.append(Paragraph(f"Página 1", self.styles['Italic']))
+            yield from self._paginated_table(
+                ['Métrica', 'Valor'], summary_data, [3*inch, 2*inch], SUMMARY_TABLE_STYLE
+            )
+            yield Spacer(1, 30)
+        
+        # Produtos
+        if data.get('products'):
+            yield Paragraph(f"📦 Produtos{self._count_label(data['products'])}", self.styles['Heading2'])
             
-            # Gera PDF
-            doc.build(elements)
+            rows = (
+                [
+                    str(product.get('id', ''))[:8],
+                    str(product.get('name', ''))[:30],
+                    str(product.get('store', '')),
+                    f"R$ {product.get('current_price') or 0:,.2f}",
+                    f"{product.get('discount_percentage')}%" if product.get('discount_percentage') else ''
+                ]
+                for product in data['products']
+            )
+            yield from self._paginated_table(
+                ['ID', 'Nome', 'Loja', 'Preço', 'Desconto'], rows,
+                [0.8*inch, 2.7*inch, inch, inch, inch], PRODUCTS_TABLE_STYLE
+            )
+            yield Spacer(1, 30)
+        
+        # Vendas
+        if data.get('commissions'):
+            yield Paragraph(f"💰 Vendas{self._count_label(data['commissions'])}", self.styles['Heading2'])
             
-            buffer.seek(0)
-            return buffer.getvalue()
+            rows = (
+                [
+                    str(sale.get('calculated_at', ''))[:10],
+                    str(sale.get('store', '')),
+                    f"R$ {sale.get('sale_amount') or 0:,.2f}",
+                    f"R$ {sale.get('commission_amount') or 0:,.2f}",
+                    str(sale.get('status', ''))
+                ]
+                for sale in data['commissions']
+            )
+            yield from self._paginated_table(
+                ['Data', 'Loja', 'Venda', 'Comissão', 'Status'], rows,
+                [inch, 1.2*inch, 1.2*inch, 1.2*inch, inch], PRODUCTS_TABLE_STYLE
+            )
+            yield Spacer(1, 30)
+        
+        # Por loja
+        by_store = data.get('by_store') or data.get('store_analysis')
+        if by_store:
+            yield Paragraph("🏪 Análise por Loja", self.styles['Heading2'])
             
-        except Exception as e:
-            raise Exception(f"Erro ao exportar para PDF: {str(e)}")
+            store_data = [
+                [
+                    store.title(),
+                    str(metrics.get('product_count', 0)),
+                    f"R$ {metrics.get('total_revenue', 0):,.2f}",
+                    f"{metrics.get('click_through_rate', 0):.1f}%"
+                ]
+                for store, metrics in by_store.items()
+            ]
+            yield from self._paginated_table(
+                ['Loja', 'Produtos', 'Vendas (R$)', 'Taxa Conversão'], store_data,
+                [1.5*inch, inch, 1.5*inch, 1.5*inch], STORE_TABLE_STYLE
+            )
+    
+    @staticmethod
+    def _count_label(rows) -> str:
+        """" (N)" quando as linhas já estão em memória; iteráveis não são contados"""
+        return f" ({len(rows):,})" if hasattr(rows, '__len__') else ""
+    
+    @staticmethod
+    def _paginated_table(header: List[str], rows: Iterable[List[str]], col_widths, style):
+        """Divide as linhas em tabelas de PDF_ROWS_PER_TABLE com o mesmo estilo, uma por vez"""
+        chunk = []
+        emitted = False
+        
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) == PDF_ROWS_PER_TABLE:
+                yield Table([header] + chunk, colWidths=col_widths, repeatRows=1, style=style)
+                emitted = True
+                chunk = []
+        
+        if chunk or not emitted:
+            yield Table([header] + chunk, colWidths=col_widths, repeatRows=1, style=style)
     
     async def export_to_csv(self, data: Dict, report_type: str) -> bytes:
         """Exporta dados para CSV"""
@@ -232,7 +449,13 @@ class ReportExporter:
             
             # Exporta no formato solicitado
             if format == 'excel':
-                content = await self.export_to_excel(report_data, 'Completo')
+                from api.handlers.export_stream import iter_export_pages
+                
+                content = await self.export_to_excel(
+                    report_data,
+                    'Completo',
+                    row_sheets={'Produtos': iter_export_pages('products', start_date, end_date)}
+                )
                 filename = f"relatorio_completo_{start_date[:10]}_{end_date[:10]}.xlsx"
                 content_type = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
             
@@ -246,6 +469,23 @@ class ReportExporter:
                 filename = f"relatorio_completo_{start_date[:10]}_{end_date[:10]}.csv"
                 content_type = 'text/csv'
             
+            elif format in ('parquet', 'arrow'):
+                # Produtos do período tipados; o resumo vai nos metadados do schema
+                from api.handlers.export_columnar import COLUMNAR_FORMATS, write_columnar_export
+                
+                buffer = io.BytesIO()
+                write_columnar_export(
+                    'products', format, buffer, start_date, end_date,
+                    metadata={
+                        "period": report_data.get('period'),
+                        "summary": report_data.get('summary'),
+                        "store_analysis": report_data.get('store_analysis')
+                    }
+                )
+                content = buffer.getvalue()
+                filename = f"relatorio_completo_{start_date[:10]}_{end_date[:10]}.{COLUMNAR_FORMATS[format]['extension']}"
+                content_type = COLUMNAR_FORMATS[format]['content_type']
+            
             else:
                 return {"error": "Formato não suportado"}
             
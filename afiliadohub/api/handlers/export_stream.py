@@ -0,0 +1,135 @@
+"""
+Exportação em streaming (CSV / NDJSON) com memória constante
+
+As linhas são lidas página a página (keyset) e convertidas em blocos de
+bytes à medida que chegam, opcionalmente comprimidos em gzip. Nenhum
+arquivo inteiro é montado em memória.
+"""
+import csv
+import io
+import json
+import zlib
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from ..utils.supabase_client import get_supabase_manager
+from ..utils.pagination import keyset_paginate
+
+# Relatórios exportáveis linha a linha (coluna -> tipo nos formatos colunares)
+EXPORT_SOURCES = {
+    "products": {
+        "table": "products",
+        "time_column": "created_at",
+        "columns": {
+            "id": "string",
+            "name": "string",
+            "store": "dictionary",
+            "category": "dictionary",
+            "current_price": "float64",
+            "original_price": "float64",
+            "discount_percentage": "int64",
+            "coupon_code": "string",
+            "affiliate_link": "string",
+            "is_active": "bool",
+            "created_at": "timestamp"
+        }
+    },
+    "sales": {
+        "table": "commissions",
+        "time_column": "calculated_at",
+        "columns": {
+            "id": "string",
+            "product_id": "string",
+            "store": "dictionary",
+            "sale_amount": "float64",
+            "commission_rate": "float64",
+            "commission_amount": "float64",
+            "status": "dictionary",
+            "user_id": "string",
+            "calculated_at": "timestamp"
+        }
+    }
+}
+
+STREAM_FORMATS = {
+    "csv": {"content_type": "text/csv; charset=utf-8", "extension": "csv"},
+    "ndjson": {"content_type": "application/x-ndjson", "extension": "ndjson"}
+}
+
+
+def iter_export_pages(
+    report_type: str,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    page_size: int = 1000,
+    columns: Optional[List[str]] = None
+) -> Iterator[List[Dict[str, Any]]]:
+    """Páginas do relatório ordenadas por (coluna de tempo, id)"""
+    source = EXPORT_SOURCES[report_type]
+    time_column = source["time_column"]
+    select = list(dict.fromkeys(list(columns or source["columns"]) + ["id", time_column]))
+    supabase = get_supabase_manager()
+
+    def query_factory():
+        query = supabase.client.table(source["table"]).select(", ".join(select))
+        if start_date:
+            query = query.gte(time_column, start_date)
+        if end_date:
+            query = query.lte(time_column, end_date)
+        return query
+
+    yield from keyset_paginate(query_factory, key="id", order_column=time_column, page_size=page_size)
+
+
+def csv_chunks(pages: Iterable[List[Dict[str, Any]]], columns: List[str]) -> Iterator[bytes]:
+    """Um bloco CSV por página (cabeçalho no primeiro)"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore")
+    writer.writeheader()
+
+    for page in pages:
+        writer.writerows(page)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+
+    # Só cabeçalho quando não houver linhas
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def ndjson_chunks(pages: Iterable[List[Dict[str, Any]]], columns: List[str]) -> Iterator[bytes]:
+    """Um objeto JSON por linha"""
+    for page in pages:
+        lines = (
+            json.dumps({column: row.get(column) for column in columns}, ensure_ascii=False, default=str)
+            for row in page
+        )
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """Comprime o fluxo em gzip sem juntar os blocos"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+
+    yield compressor.flush()
+
+
+def stream_export(
+    report_type: str,
+    format: str = "csv",
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    compress: bool = False,
+    page_size: int = 1000
+) -> Iterator[bytes]:
+    """Gerador de bytes do relatório no formato pedido"""
+    columns = list(EXPORT_SOURCES[report_type]["columns"])
+    pages = iter_export_pages(report_type, start_date, end_date, page_size)
+
+    chunks = csv_chunks(pages, columns) if format == "csv" else ndjson_chunks(pages, columns)
+    return gzip_chunks(chunks) if compress else chunks
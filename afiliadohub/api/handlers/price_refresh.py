@@ -0,0 +1,430 @@
+"""
+Motor de atualização de preços (usado pelo agendador em check_prices)
+
+Busca os produtos em ondas (pela fila de prioridade de refresh_priority.py
+ou, com PRICE_REFRESH_SELECTION=oldest, os mais antigos primeiro), consulta as lojas com um
+pool de workers assíncronos (concorrência e taxa limitadas por loja),
+usa requisições condicionais (ETag / Last-Modified) e extrai o preço com
+um parser por loja. O resultado de cada onda volta ao banco em upserts em
+lote e as mudanças de preço vão para product_logs como "price_change".
+"""
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+from collections import defaultdict, deque
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse
+
+import aiohttp
+
+from ..utils.supabase_client import get_supabase_manager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PRODUCTS_PER_HOUR = int(os.getenv("PRICE_REFRESH_PER_HOUR", "3000"))
+DEFAULT_STALE_HOURS = float(os.getenv("PRICE_REFRESH_STALE_HOURS", "168"))
+DEFAULT_SELECTION = os.getenv("PRICE_REFRESH_SELECTION", "priority")
+WAVE_SIZE = 500
+REQUEST_TIMEOUT = 20
+
+# Limites por loja: requisições simultâneas e requisições por segundo
+STORE_LIMITS = {
+    "default": {"concurrency": 2, "rate": 1.0},
+    "shopee": {"concurrency": 4, "rate": 2.0},
+    "aliexpress": {"concurrency": 4, "rate": 2.0},
+    "amazon": {"concurrency": 2, "rate": 0.5},
+    "magalu": {"concurrency": 3, "rate": 2.0},
+    "mercado_livre": {"concurrency": 4, "rate": 3.0}
+}
+
+REQUEST_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
+    "Accept-Language": "pt-BR,pt;q=0.9"
+}
+
+PRODUCT_COLUMNS = (
+    "id, name, store, affiliate_link, original_link, current_price, original_price, "
+    "discount_percentage, price_etag, price_last_modified, last_checked, updated_at"
+)
+
+
+def load_store_limits() -> Dict[str, Dict[str, float]]:
+    """STORE_LIMITS com ajustes de PRICE_REFRESH_STORE_LIMITS (JSON por loja)"""
+    limits = {store: dict(values) for store, values in STORE_LIMITS.items()}
+    overrides = os.getenv("PRICE_REFRESH_STORE_LIMITS")
+    if overrides:
+        try:
+            for store, values in json.loads(overrides).items():
+                limits.setdefault(store, dict(STORE_LIMITS["default"])).update(values)
+        except ValueError as e:
+            logger.warning(f"PRICE_REFRESH_STORE_LIMITS inválido: {e}")
+    return limits
+
+
+class RateLimiter:
+    """Token bucket assíncrono (taxa em requisições por segundo)"""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """Suspende a loja (429 / Retry-After)"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+# ==================== PARSERS ====================
+
+def parse_brl(text: Any) -> Optional[float]:
+    """'R$ 1.234,56' -> 1234.56 (também aceita '1234.56')"""
+    cleaned = re.sub(r"[^\d,.]", "", str(text))
+    if not cleaned:
+        return None
+    if "," in cleaned:
+        cleaned = cleaned.replace(".", "").replace(",", ".")
+    try:
+        return float(cleaned)
+    except ValueError:
+        return None
+
+
+def _json_ld_price(body: str) -> Optional[Dict[str, Optional[float]]]:
+    for block in re.findall(r'<script[^>]+application/ld\+json[^>]*>(.*?)</script>', body, re.S | re.I):
+        try:
+            data = json.loads(block)
+        except ValueError:
+            continue
+
+        for item in data if isinstance(data, list) else data.get("@graph", [data]):
+            offers = item.get("offers") if isinstance(item, dict) else None
+            if isinstance(offers, list):
+                offers = offers[0] if offers else None
+            if isinstance(offers, dict):
+                price = parse_brl(offers.get("price") or offers.get("lowPrice") or "")
+                if price:
+                    original = parse_brl(offers.get("highPrice") or "")
+                    return {"current_price": price, "original_price": original}
+    return None
+
+
+def _meta_price(body: str) -> Optional[Dict[str, Optional[float]]]:
+    names = r'(?:product:price:amount|og:price:amount|price)'
+    match = (
+        re.search(rf'(?:property|itemprop|name)="{names}"[^>]*content="([\d.,]+)"', body, re.I)
+        or re.search(rf'content="([\d.,]+)"[^>]*(?:property|itemprop|name)="{names}"', body, re.I)
+    )
+    price = parse_brl(match.group(1)) if match else None
+    return {"current_price": price, "original_price": None} if price else None
+
+
+def parse_generic_price(body: str) -> Optional[Dict[str, Optional[float]]]:
+    """JSON-LD (schema.org Product) ou meta tags de preço"""
+    return _json_ld_price(body) or _meta_price(body)
+
+
+def parse_shopee_price(body: str) -> Optional[Dict[str, Optional[float]]]:
+    """Resposta da API /api/v4/item/get (preço em centésimos de milésimo)"""
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return parse_generic_price(body)
+
+    item = (data or {}).get("data") or (data or {}).get("item") or {}
+    price = item.get("price") or item.get("price_min")
+    if not price:
+        return None
+
+    original = item.get("price_before_discount") or 0
+    return {
+        "current_price": price / 100000,
+        "original_price": original / 100000 if original else None
+    }
+
+
+def parse_amazon_price(body: str) -> Optional[Dict[str, Optional[float]]]:
+    current = re.search(r'class="a-price[^"]*"[^>]*>\s*<span class="a-offscreen">([^<]+)</span>', body)
+    if not current:
+        return parse_generic_price(body)
+
+    original = re.search(r'class="a-price a-text-price"[^>]*>\s*<span class="a-offscreen">([^<]+)</span>', body)
+    price = parse_brl(current.group(1))
+    if not price:
+        return None
+    return {"current_price": price, "original_price": parse_brl(original.group(1)) if original else None}
+
+
+def parse_aliexpress_price(body: str) -> Optional[Dict[str, Optional[float]]]:
+    current = (
+        re.search(r'"minActivityAmount"\s*:\s*\{\s*"value"\s*:\s*([\d.]+)', body)
+        or re.search(r'"formatedActivityPrice"\s*:\s*"([^"]+)"', body)
+    )
+    if not current:
+        return parse_generic_price(body)
+
+    original = (
+        re.search(r'"minAmount"\s*:\s*\{\s*"value"\s*:\s*([\d.]+)', body)
+        or re.search(r'"formatedPrice"\s*:\s*"([^"]+)"', body)
+    )
+    price = parse_brl(current.group(1))
+    if not price:
+        return None
+    return {"current_price": price, "original_price": parse_brl(original.group(1)) if original else None}
+
+
+PRICE_PARSERS = {
+    "shopee": parse_shopee_price,
+    "amazon": parse_amazon_price,
+    "aliexpress": parse_aliexpress_price
+}
+
+
+def price_request_url(product: Dict[str, Any]) -> str:
+    """URL consultada para o produto (Shopee usa a API de item)"""
+    url = product.get("original_link") or product["affiliate_link"]
+
+    if product.get("store") == "shopee":
+        match = re.search(r"/product/(\d+)/(\d+)", url) or re.search(r"-i\.(\d+)\.(\d+)", url)
+        if match:
+            parsed = urlparse(url)
+            return f"{parsed.scheme}://{parsed.netloc}/api/v4/item/get?itemid={match.group(2)}&shopid={match.group(1)}"
+
+    return url
+
+
+# ==================== MOTOR ====================
+
+class PriceRefreshEngine:
+    def __init__(
+        self,
+        products_per_hour: Optional[int] = None,
+        stale_hours: Optional[float] = None,
+        store_limits: Optional[Dict[str, Dict[str, float]]] = None,
+        wave_size: int = WAVE_SIZE,
+        timeout: float = REQUEST_TIMEOUT,
+        selection: Optional[str] = None
+    ):
+        self.products_per_hour = products_per_hour or DEFAULT_PRODUCTS_PER_HOUR
+        self.selection = selection or DEFAULT_SELECTION
+        self.stale_hours = stale_hours or DEFAULT_STALE_HOURS
+        self.store_limits = store_limits or load_store_limits()
+        self.wave_size = wave_size
+        self.timeout = timeout
+        self._limiters: Dict[str, RateLimiter] = {}
+
+    def _limits(self, store: str) -> Dict[str, float]:
+        return self.store_limits.get(store) or self.store_limits["default"]
+
+    def _limiter(self, store: str) -> RateLimiter:
+        if store not in self._limiters:
+            limits = self._limits(store)
+            self._limiters[store] = RateLimiter(limits["rate"], int(limits.get("burst", 1)))
+        return self._limiters[store]
+
+    def _new_session(self) -> aiohttp.ClientSession:
+        total = sum(int(limits["concurrency"]) for limits in self.store_limits.values())
+        return aiohttp.ClientSession(
+            headers=REQUEST_HEADERS,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            connector=aiohttp.TCPConnector(limit=total)
+        )
+
+    async def run(self, interval_hours: float = 1) -> Dict[str, Any]:
+        """Atualiza até products_per_hour * interval_hours produtos, os mais urgentes primeiro"""
+        budget = int(self.products_per_hour * interval_hours)
+        cutoff = (datetime.now() - timedelta(hours=self.stale_hours)).isoformat()
+        stats = defaultdict(int)
+        started = time.monotonic()
+
+        queue = None
+        if self.selection == "priority":
+            from .refresh_priority import RefreshPriorityQueue
+            queue = RefreshPriorityQueue()
+            queue.build(budget)
+
+        async with self._new_session() as session:
+            while stats["checked"] < budget:
+                size = min(self.wave_size, budget - stats["checked"])
+                products = queue.next_wave(size) if queue is not None else self._fetch_stale(cutoff, size)
+                if not products:
+                    break
+
+                results = await self.check_products(products, session)
+                written = self.apply_results(results)
+
+                stats["checked"] += len(results)
+                stats["logged"] += written["logged"]
+                for result in results:
+                    stats[result["status"]] += 1
+
+        elapsed = time.monotonic() - started
+        stats["selection"] = self.selection
+        stats["elapsed_seconds"] = round(elapsed, 2)
+        stats["products_per_hour"] = int(stats["checked"] / elapsed * 3600) if elapsed > 0 and stats["checked"] else 0
+        return dict(stats)
+
+    def _fetch_stale(self, cutoff: str, limit: int) -> List[Dict[str, Any]]:
+        # Quem já foi verificado nesta execução sai do filtro (last_checked > cutoff)
+        response = get_supabase_manager().client.table("products")\
+            .select(PRODUCT_COLUMNS)\
+            .eq("is_active", True)\
+            .lt("last_checked", cutoff)\
+            .order("last_checked")\
+            .limit(limit)\
+            .execute()
+        return response.data or []
+
+    async def check_products(
+        self,
+        products: List[Dict[str, Any]],
+        session: Optional[aiohttp.ClientSession] = None
+    ) -> List[Dict[str, Any]]:
+        """Consulta as lojas (sem tocar no banco) e devolve um resultado por produto"""
+        if session is None:
+            async with self._new_session() as own_session:
+                return await self.check_products(products, own_session)
+
+        by_store = defaultdict(deque)
+        for product in products:
+            by_store[product.get("store") or "default"].append(product)
+
+        results: List[Dict[str, Any]] = []
+
+        async def worker(store: str, queue: deque):
+            limiter = self._limiter(store)
+            while queue:
+                product = queue.popleft()
+                await limiter.acquire()
+                results.append(await self._check_one(session, store, product))
+
+        workers = [
+            worker(store, queue)
+            for store, queue in by_store.items()
+            for _ in range(min(int(self._limits(store)["concurrency"]), len(queue)))
+        ]
+        await asyncio.gather(*workers)
+        return results
+
+    async def _check_one(self, session: aiohttp.ClientSession, store: str, product: Dict[str, Any]) -> Dict[str, Any]:
+        result = {
+            "product": product,
+            "status": "failed",
+            "current_price": None,
+            "original_price": None,
+            "etag": product.get("price_etag"),
+            "last_modified": product.get("price_last_modified"),
+            "error": None
+        }
+
+        headers = {}
+        if product.get("price_etag"):
+            headers["If-None-Match"] = product["price_etag"]
+        if product.get("price_last_modified"):
+            headers["If-Modified-Since"] = product["price_last_modified"]
+
+        try:
+            async with session.get(price_request_url(product), headers=headers) as response:
+                if response.status == 304:
+                    result["status"] = "not_modified"
+                    return result
+
+                if response.status in (429, 503):
+                    retry_after = response.headers.get("Retry-After", "")
+                    self._limiter(store).pause(float(retry_after) if retry_after.isdigit() else 30)
+                    result["error"] = f"HTTP {response.status}"
+                    return result
+
+                if response.status != 200:
+                    result["error"] = f"HTTP {response.status}"
+                    return result
+
+                body = await response.text(errors="replace")
+                result["etag"] = response.headers.get("ETag")
+                result["last_modified"] = response.headers.get("Last-Modified")
+
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            result["error"] = str(e) or type(e).__name__
+            return result
+
+        parsed = PRICE_PARSERS.get(store, parse_generic_price)(body)
+        if not parsed or not parsed["current_price"] or parsed["current_price"] <= 0:
+            result["status"] = "unparsed"
+            return result
+
+        result.update(parsed)
+        old_price = float(product.get("current_price") or 0)
+        result["status"] = "changed" if abs(parsed["current_price"] - old_price) >= 0.01 else "unchanged"
+        return result
+
+    def apply_results(self, results: List[Dict[str, Any]], chunk_size: int = 500) -> Dict[str, int]:
+        """
+        Grava preços/validadores e last_checked em lote e registra as mudanças
+        em product_logs, pela função apply_price_refresh (só UPDATE: produto
+        removido durante a rodada não é recriado)
+        """
+        supabase = get_supabase_manager()
+        now = datetime.now().isoformat()
+        rows = []
+
+        for result in results:
+            product = result["product"]
+            current = product.get("current_price")
+            original = product.get("original_price")
+            discount = product.get("discount_percentage")
+            updated_at = product.get("updated_at") or now
+            changed = result["status"] == "changed"
+
+            if changed:
+                current = round(result["current_price"], 2)
+                original = round(result["original_price"], 2) if result["original_price"] else original
+                discount = int((original - current) / original * 100) if original and original > current else 0
+                updated_at = now
+
+            rows.append({
+                "id": product["id"],
+                "current_price": current,
+                "original_price": original,
+                "discount_percentage": discount,
+                "price_etag": result["etag"],
+                "price_last_modified": result["last_modified"],
+                "last_checked": now,
+                "updated_at": updated_at,
+                "old_price": product.get("current_price"),
+                "changed": changed
+            })
+
+        written = {"updated": 0, "logged": 0}
+        for i in range(0, len(rows), chunk_size):
+            response = supabase.client.rpc("apply_price_refresh", {"p_rows": rows[i:i + chunk_size]}).execute()
+            for counts in response.data or []:
+                written["updated"] += counts["updated"]
+                written["logged"] += counts["logged"]
+
+        return written
+
+
+async def refresh_prices(interval_hours: float = 1, **kwargs) -> Dict[str, Any]:
+    """Atalho usado pelo agendador"""
+    return await PriceRefreshEngine(**kwargs).run(interval_hours)
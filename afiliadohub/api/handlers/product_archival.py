@@ -0,0 +1,193 @@
+"""
+Limpeza de produtos inativos em lotes, com arquivamento opcional
+
+Substitui o delete único (sem limite) por lotes em ordem de id: cada lote
+é (opcionalmente) gravado em um arquivo NDJSON gzip local junto com as
+linhas dependentes (product_stats / product_logs, que caem em cascata),
+removido com return=minimal e registrado em um checkpoint na tabela
+settings. Uma limpeza interrompida continua do último id com o mesmo
+corte de data.
+"""
+import asyncio
+import gzip
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from ..utils.supabase_client import get_supabase_manager
+from ..utils.pagination import keyset_paginate
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_SETTING_KEY = "product_archival_checkpoint"
+DEFAULT_ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archives")
+DEFAULT_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "500"))
+DEFAULT_BATCH_PAUSE = float(os.getenv("ARCHIVE_BATCH_PAUSE", "1.0"))
+
+# Tabelas com ON DELETE CASCADE em products(id) e a chave usada para paginá-las
+DEPENDENT_TABLES = {"product_stats": "product_id", "product_logs": "id"}
+
+
+class ProductArchiver:
+    def __init__(
+        self,
+        days_old: int = 30,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        pause_seconds: float = DEFAULT_BATCH_PAUSE,
+        archive: Optional[bool] = None,
+        archive_dir: Optional[str] = None
+    ):
+        self.supabase = get_supabase_manager()
+        self.days_old = days_old
+        self.batch_size = batch_size
+        self.pause_seconds = pause_seconds
+        self.archive = archive if archive is not None else os.getenv("PRODUCT_ARCHIVE", "false").lower() == "true"
+        self.archive_dir = Path(archive_dir or DEFAULT_ARCHIVE_DIR)
+
+    async def run(self, max_seconds: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Remove (e arquiva) os inativos até acabar ou até `max_seconds`.
+
+        Retorna o checkpoint final; `done` = False indica que ainda há
+        lotes e a próxima execução continua de onde esta parou.
+        """
+        checkpoint = self._load_checkpoint()
+        resumed = bool(checkpoint) and not checkpoint.get("done")
+
+        if not resumed:
+            started = datetime.now()
+            checkpoint = {
+                "cutoff": (started - timedelta(days=self.days_old)).isoformat(),
+                "last_id": None,
+                "deleted": 0,
+                "archived": 0,
+                "batches": 0,
+                "archive_file": str(self.archive_dir / f"products-{started:%Y%m%d-%H%M%S}.ndjson.gz") if self.archive else None,
+                "started_at": started.isoformat(),
+                "done": False
+            }
+        else:
+            logger.info(f"♻️ Retomando limpeza após id {checkpoint['last_id']} ({checkpoint['deleted']} já removidos)")
+
+        deadline = time.monotonic() + max_seconds if max_seconds else None
+        cutoff = checkpoint["cutoff"]
+
+        pages = keyset_paginate(
+            lambda: self.supabase.client.table("products")
+                .select("*" if checkpoint["archive_file"] else "id")
+                .eq("is_active", False)
+                .lt("updated_at", cutoff),
+            key="id",
+            page_size=self.batch_size,
+            start_after=(None, checkpoint["last_id"]) if checkpoint["last_id"] else None
+        )
+
+        finished = True
+        for page in pages:
+            ids = [row["id"] for row in page]
+
+            if checkpoint["archive_file"]:
+                checkpoint["archived"] += self._archive_batch(checkpoint["archive_file"], page, ids)
+
+            self._delete_batch(ids, cutoff)
+
+            checkpoint["last_id"] = ids[-1]
+            checkpoint["deleted"] += len(ids)
+            checkpoint["batches"] += 1
+            self._save_checkpoint(checkpoint)
+
+            if deadline and time.monotonic() >= deadline:
+                finished = len(page) < self.batch_size
+                break
+
+            # Folga para o banco entre lotes
+            await asyncio.sleep(self.pause_seconds)
+
+        if finished:
+            checkpoint["done"] = True
+            checkpoint["finished_at"] = datetime.now().isoformat()
+            self._save_checkpoint(checkpoint)
+
+        checkpoint["resumed"] = resumed
+        return checkpoint
+
+    def _archive_batch(self, path: str, products: List[Dict[str, Any]], ids: List[Any]) -> int:
+        """
+        Grava o lote (e as linhas dependentes) antes de removê-lo; gzip
+        aceita append de membros. As dependentes são lidas em páginas e
+        conferidas com um count exato: se faltar alguma, o lote não é gravado
+        nem removido (o cascade apagaria linhas fora do arquivo).
+        """
+        records = [{"table": "products", "row": row} for row in products]
+        for table, key in DEPENDENT_TABLES.items():
+            rows = [
+                row
+                for page in keyset_paginate(
+                    lambda: self.supabase.client.table(table).select("*").in_("product_id", ids),
+                    key=key
+                )
+                for row in page
+            ]
+
+            expected = self.supabase.client.table(table)\
+                .select(key, count="exact", head=True)\
+                .in_("product_id", ids)\
+                .execute().count
+            if expected is None or len(rows) < expected:
+                raise RuntimeError(f"{table}: {len(rows)} de {expected} linhas lidas, lote a partir do id {ids[0]} não removido")
+
+            records.extend({"table": table, "row": row} for row in rows)
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "ab") as raw:
+            with gzip.GzipFile(fileobj=raw, mode="ab") as f:
+                for record in records:
+                    f.write(json.dumps(record, default=str, ensure_ascii=False).encode("utf-8") + b"\n")
+            raw.flush()
+            os.fsync(raw.fileno())
+
+        return len(records)
+
+    def _delete_batch(self, ids: List[Any], cutoff: str):
+        # Repete o filtro: produto reativado entre a leitura e o delete fica
+        self.supabase.client.table("products")\
+            .delete(returning="minimal")\
+            .in_("id", ids)\
+            .eq("is_active", False)\
+            .lt("updated_at", cutoff)\
+            .execute()
+
+    def _load_checkpoint(self) -> Dict[str, Any]:
+        response = self.supabase.client.table("settings")\
+            .select("value")\
+            .eq("key", CHECKPOINT_SETTING_KEY)\
+            .execute()
+
+        rows = response.data or []
+        value = rows[0]["value"] if rows else {}
+        return json.loads(value) if isinstance(value, str) else dict(value or {})
+
+    def _save_checkpoint(self, checkpoint: Dict[str, Any]):
+        self.supabase.client.table("settings").upsert({
+            "key": CHECKPOINT_SETTING_KEY,
+            "value": checkpoint,
+            "description": "Progresso da limpeza de produtos inativos",
+            "updated_at": datetime.now().isoformat()
+        }).execute()
+
+
+def read_archive(path: str):
+    """Itera os registros {"table", "row"} de um arquivo de arquivamento"""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+async def archive_old_products(days_old: int = 30, max_seconds: Optional[float] = None, **kwargs) -> Dict[str, Any]:
+    """Atalho usado pelo agendador e pelo SupabaseManager"""
+    return await ProductArchiver(days_old=days_old, **kwargs).run(max_seconds)
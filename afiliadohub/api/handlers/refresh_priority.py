@@ -0,0 +1,255 @@
+"""
+Fila de prioridade para a atualização de preços
+
+Em vez de "os mais antigos primeiro", cada produto elegível recebe uma
+prioridade proporcional ao custo de manter o preço desatualizado:
+
+    horas desde a última verificação × (base + cliques + envios + desconto + volatilidade)
+
+- cliques / envios: product_stats (log1p, para um hit não engolir o resto)
+- desconto: discount_percentage / 100
+- volatilidade: soma das variações relativas de preço em product_logs
+  (change_type = price_change) na janela recente, limitada a VOLATILITY_CAP
+
+Produtos sem tráfego continuam acumulando prioridade com o tempo (termo
+base), então nada fica sem verificação para sempre.
+"""
+import asyncio
+import heapq
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from ..utils.supabase_client import get_supabase_manager
+from ..utils.pagination import keyset_paginate
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MIN_AGE_HOURS = float(os.getenv("PRICE_REFRESH_MIN_AGE_HOURS", "6"))
+# Prévia da fila na API: montada fora do event loop e reaproveitada por TTL
+QUEUE_PREVIEW_TTL = float(os.getenv("PRICE_REFRESH_QUEUE_CACHE_TTL", "300"))
+QUEUE_PREVIEW_SIZE = 500
+VOLATILITY_DAYS = 30
+VOLATILITY_CAP = 2.0
+MAX_AGE_HOURS = 24 * 90
+
+PRIORITY_WEIGHTS = {
+    "base": 1.0,
+    "clicks": 1.0,
+    "sends": 0.5,
+    "discount": 2.0,
+    "volatility": 3.0
+}
+
+
+def load_priority_weights() -> Dict[str, float]:
+    """PRIORITY_WEIGHTS com ajustes de PRICE_REFRESH_PRIORITY_WEIGHTS (JSON)"""
+    weights = dict(PRIORITY_WEIGHTS)
+    overrides = os.getenv("PRICE_REFRESH_PRIORITY_WEIGHTS")
+    if overrides:
+        try:
+            weights.update({key: float(value) for key, value in json.loads(overrides).items()})
+        except (TypeError, ValueError) as e:
+            logger.warning(f"PRICE_REFRESH_PRIORITY_WEIGHTS inválido: {e}")
+    return weights
+
+
+def score_products(
+    candidates: pd.DataFrame,
+    stats: pd.DataFrame,
+    volatility: pd.Series,
+    now: datetime,
+    weights: Dict[str, float]
+) -> pd.Series:
+    """
+    Prioridade por produto (índice = id).
+
+    `candidates`: id, last_checked, discount_percentage
+    `stats`: product_id, click_count, telegram_send_count
+    `volatility`: soma das variações relativas por product_id
+    """
+    frame = candidates.set_index("id")
+
+    checked = pd.to_datetime(frame["last_checked"], utc=True, format="ISO8601", errors="coerce")
+    hours = ((pd.Timestamp(now) - checked).dt.total_seconds() / 3600).fillna(MAX_AGE_HOURS).clip(0, MAX_AGE_HOURS)
+
+    if not stats.empty:
+        stats = stats.drop_duplicates("product_id").set_index("product_id")
+        clicks = pd.to_numeric(stats["click_count"], errors="coerce").reindex(frame.index)
+        sends = pd.to_numeric(stats["telegram_send_count"], errors="coerce").reindex(frame.index)
+    else:
+        clicks = sends = pd.Series(0.0, index=frame.index)
+
+    discount = pd.to_numeric(frame["discount_percentage"], errors="coerce").fillna(0).clip(0, 100) / 100
+    volatility = volatility.reindex(frame.index).fillna(0).clip(0, VOLATILITY_CAP)
+
+    value = (
+        weights["base"]
+        + weights["clicks"] * np.log1p(clicks.fillna(0).clip(lower=0))
+        + weights["sends"] * np.log1p(sends.fillna(0).clip(lower=0))
+        + weights["discount"] * discount
+        + weights["volatility"] * volatility
+    )
+    return hours * value
+
+
+class RefreshPriorityQueue:
+    """Produtos elegíveis ordenados por prioridade; entregue em ondas ao motor de preços"""
+
+    def __init__(
+        self,
+        min_age_hours: Optional[float] = None,
+        weights: Optional[Dict[str, float]] = None,
+        volatility_days: int = VOLATILITY_DAYS,
+        page_size: int = 1000
+    ):
+        self.supabase = get_supabase_manager()
+        self.min_age_hours = min_age_hours if min_age_hours is not None else DEFAULT_MIN_AGE_HOURS
+        self.weights = weights or load_priority_weights()
+        self.volatility_days = volatility_days
+        self.page_size = page_size
+        self.scores: Dict[Any, float] = {}
+        self._heap: List = []
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def build(self, limit: int) -> int:
+        """Calcula as prioridades e guarda os `limit` produtos mais urgentes"""
+        now = datetime.now(timezone.utc)
+        cutoff = (now - timedelta(hours=self.min_age_hours)).isoformat()
+
+        candidates = self._load_candidates(cutoff)
+        if candidates.empty:
+            self.scores, self._heap = {}, []
+            return 0
+
+        scores = score_products(
+            candidates,
+            self._load_stats(),
+            self._load_volatility((now - timedelta(days=self.volatility_days)).isoformat()),
+            now,
+            self.weights
+        )
+
+        top = scores.nlargest(limit)
+        self.scores = top.to_dict()
+        self._heap = [(-score, i, product_id) for i, (product_id, score) in enumerate(top.items())]
+        heapq.heapify(self._heap)
+
+        logger.info(f"📋 Fila de preços: {len(self._heap)} de {len(candidates)} produtos elegíveis")
+        return len(self._heap)
+
+    def next_wave(self, size: int) -> List[Dict[str, Any]]:
+        """Próximos `size` produtos (linhas completas) em ordem de prioridade"""
+        wave = []
+        # Produtos removidos entre o build e a onda são pulados
+        while not wave and self._heap:
+            ids = [heapq.heappop(self._heap)[2] for _ in range(min(size, len(self._heap)))]
+            wave = self._load_rows(ids)
+        return wave
+
+    def _load_rows(self, ids: List[Any]) -> List[Dict[str, Any]]:
+        from .price_refresh import PRODUCT_COLUMNS
+
+        rows = {}
+        for i in range(0, len(ids), 200):
+            response = self.supabase.client.table("products")\
+                .select(PRODUCT_COLUMNS)\
+                .in_("id", ids[i:i + 200])\
+                .execute()
+            for row in response.data or []:
+                rows[row["id"]] = row
+
+        wave = []
+        for product_id in ids:
+            if product_id in rows:
+                rows[product_id]["refresh_priority"] = round(self.scores.get(product_id, 0), 2)
+                wave.append(rows[product_id])
+        return wave
+
+    def _load_candidates(self, cutoff: str) -> pd.DataFrame:
+        rows = []
+        for page in keyset_paginate(
+            lambda: self.supabase.client.table("products")
+                .select("id, last_checked, discount_percentage")
+                .eq("is_active", True)
+                .lt("last_checked", cutoff),
+            key="id",
+            page_size=self.page_size
+        ):
+            rows.extend(page)
+        return pd.DataFrame(rows, columns=["id", "last_checked", "discount_percentage"])
+
+    def _load_stats(self) -> pd.DataFrame:
+        rows = []
+        for page in keyset_paginate(
+            lambda: self.supabase.client.table("product_stats")
+                .select("product_id, click_count, telegram_send_count"),
+            key="product_id",
+            page_size=self.page_size
+        ):
+            rows.extend(page)
+        return pd.DataFrame(rows, columns=["product_id", "click_count", "telegram_send_count"])
+
+    def _load_volatility(self, since: str) -> pd.Series:
+        rows = []
+        for page in keyset_paginate(
+            lambda: self.supabase.client.table("product_logs")
+                .select("id, product_id, old_price, new_price")
+                .eq("change_type", "price_change")
+                .gte("created_at", since),
+            key="id",
+            page_size=self.page_size
+        ):
+            rows.extend(page)
+
+        if not rows:
+            return pd.Series(dtype="float64")
+
+        logs = pd.DataFrame(rows)
+        old = pd.to_numeric(logs["old_price"], errors="coerce")
+        new = pd.to_numeric(logs["new_price"], errors="coerce")
+        logs["change"] = ((new - old).abs() / old.where(old > 0)).fillna(0)
+        return logs.groupby("product_id")["change"].sum()
+
+
+_preview: Dict[str, Any] = {}
+_preview_lock: Optional[asyncio.Lock] = None
+
+
+def _build_preview() -> Dict[str, Any]:
+    queue = RefreshPriorityQueue()
+    queue.build(QUEUE_PREVIEW_SIZE)
+    return {
+        "weights": queue.weights,
+        "min_age_hours": queue.min_age_hours,
+        "products": queue.next_wave(QUEUE_PREVIEW_SIZE),
+        "generated_at": datetime.now(timezone.utc).isoformat()
+    }
+
+
+async def get_queue_preview(limit: int) -> Dict[str, Any]:
+    """
+    Primeiros `limit` produtos da fila. O build lê todos os ativos,
+    product_stats e os logs recentes com o cliente síncrono: roda em uma
+    thread, uma vez por QUEUE_PREVIEW_TTL, e pedidos simultâneos esperam o
+    mesmo build.
+    """
+    global _preview_lock
+    if _preview_lock is None:
+        _preview_lock = asyncio.Lock()
+
+    async with _preview_lock:
+        if not _preview or time.monotonic() - _preview["built_at"] > QUEUE_PREVIEW_TTL:
+            preview = await asyncio.to_thread(_build_preview)
+            _preview.clear()
+            _preview.update(preview, built_at=time.monotonic())
+
+    return {**_preview, "products": _preview["products"][:limit]}
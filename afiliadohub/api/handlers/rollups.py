@@ -0,0 +1,230 @@
+"""
+Rollups diários pré-agregados, mantidos incrementalmente por watermark
+"""
+import logging
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..utils.supabase_client import get_supabase_manager
+from ..utils.pagination import keyset_paginate
+
+logger = logging.getLogger(__name__)
+
+WATERMARK_SETTING_KEY = "rollup_watermarks"
+
+ROLLUP_METRICS = (
+    "products_added",
+    "price_changes",
+    "telegram_sends",
+    "sales_count",
+    "sale_amount",
+    "commission_amount"
+)
+
+# Fontes lidas incrementalmente: (coluna de tempo, chave, colunas). Comissões
+# usam created_at (inserção) no watermark e calculated_at (venda) no dia
+ROLLUP_SOURCES = {
+    "products": ("created_at", "id", "id, store, category, created_at"),
+    "product_logs": ("created_at", "id", "id, product_id, change_type, created_at"),
+    "product_stats": ("last_sent", "product_id", "product_id, last_sent"),
+    "commissions": ("created_at", "id", "id, product_id, store, sale_amount, commission_amount, calculated_at, created_at")
+}
+
+
+class DailyRollups:
+    def __init__(self, page_size: int = 1000):
+        self.supabase = get_supabase_manager()
+        self.page_size = page_size
+        self._dimensions: Dict[Any, Tuple[str, str]] = {}
+
+    # ==================== ATUALIZAÇÃO INCREMENTAL ====================
+
+    async def fold_new_rows(self) -> Dict[str, int]:
+        """Soma aos rollups tudo que entrou desde o último watermark de cada fonte"""
+        watermarks = self._load_watermarks()
+        upper_bound = datetime.now(timezone.utc).isoformat()
+        folded = {}
+
+        for source in ROLLUP_SOURCES:
+            try:
+                folded[source] = self._fold_source(source, watermarks, upper_bound)
+            except Exception as e:
+                logger.error(f"[ERRO] Erro ao agregar {source}: {e}")
+                folded[source] = 0
+
+        logger.info(f"📊 Rollups atualizados: {folded}")
+        return folded
+
+    def _fold_source(self, source: str, watermarks: Dict, upper_bound: str) -> int:
+        """Lê uma fonte a partir do watermark, página a página"""
+        time_column, key, columns = ROLLUP_SOURCES[source]
+        mark = watermarks.get(source)
+        start_after = (mark["ts"], mark["key"]) if mark else None
+
+        def query_factory():
+            return self.supabase.client.table(source).select(columns).lte(time_column, upper_bound)
+
+        total = 0
+        for rows in keyset_paginate(query_factory, key=key, order_column=time_column,
+                                    page_size=self.page_size, start_after=start_after):
+            buckets = self._aggregate(source, rows)
+            self._merge(buckets)
+
+            # Avança o watermark só depois do merge, página a página
+            watermarks[source] = {"ts": rows[-1][time_column], "key": rows[-1][key]}
+            self._save_watermarks(watermarks)
+            total += len(rows)
+
+        watermarks.setdefault("folded_until", {})[source] = upper_bound
+        self._save_watermarks(watermarks)
+        return total
+
+    def _aggregate(self, source: str, rows: List[Dict]) -> Dict[Tuple[str, str, str], Dict]:
+        """Agrupa uma página de linhas por (dia, loja, categoria)"""
+        buckets = defaultdict(lambda: dict.fromkeys(ROLLUP_METRICS, 0))
+
+        if source != "products":
+            self._resolve_dimensions([r["product_id"] for r in rows if r.get("product_id") is not None])
+
+        for row in rows:
+            if source == "products":
+                store, category = row.get("store") or "", row.get("category") or ""
+                self._dimensions[row["id"]] = (store, category)
+                buckets[(row["created_at"][:10], store, category)]["products_added"] += 1
+
+            elif source == "product_logs":
+                # Outros tipos de log (status, importação) não são mudança de preço
+                if row.get("change_type") != "price_change":
+                    continue
+                store, category = self._dimensions.get(row.get("product_id"), ("", ""))
+                buckets[(row["created_at"][:10], store, category)]["price_changes"] += 1
+
+            elif source == "product_stats":
+                store, category = self._dimensions.get(row.get("product_id"), ("", ""))
+                buckets[(row["last_sent"][:10], store, category)]["telegram_sends"] += 1
+
+            elif source == "commissions":
+                store, category = self._dimensions.get(row.get("product_id"), ("", ""))
+                bucket = buckets[(row["calculated_at"][:10], row.get("store") or store, category)]
+                bucket["sales_count"] += 1
+                bucket["sale_amount"] += row.get("sale_amount") or 0
+                bucket["commission_amount"] += row.get("commission_amount") or 0
+
+        return buckets
+
+    def _resolve_dimensions(self, product_ids: List[Any]):
+        """Busca loja/categoria dos produtos ainda não vistos em uma única consulta"""
+        missing = list({pid for pid in product_ids if pid not in self._dimensions})
+        if not missing:
+            return
+
+        response = self.supabase.client.table("products")\
+            .select("id, store, category")\
+            .in_("id", missing)\
+            .execute()
+
+        for product in response.data or []:
+            self._dimensions[product["id"]] = (product.get("store") or "", product.get("category") or "")
+
+    def _merge(self, buckets: Dict[Tuple[str, str, str], Dict]):
+        """Envia os deltas para a função merge_daily_rollups"""
+        if not buckets:
+            return
+
+        rows = [
+            {"day": day, "store": store, "category": category, **metrics}
+            for (day, store, category), metrics in buckets.items()
+        ]
+        self.supabase.client.rpc("merge_daily_rollups", {"p_rows": rows}).execute()
+
+    def _load_watermarks(self) -> Dict[str, Dict]:
+        response = self.supabase.client.table("settings")\
+            .select("value")\
+            .eq("key", WATERMARK_SETTING_KEY)\
+            .execute()
+
+        return response.data[0]["value"] if response.data else {}
+
+    def _save_watermarks(self, watermarks: Dict[str, Dict]):
+        self.supabase.client.table("settings").upsert({
+            "key": WATERMARK_SETTING_KEY,
+            "value": watermarks,
+            "description": "Watermarks dos rollups diários",
+            "updated_at": datetime.now().isoformat()
+        }, on_conflict="key").execute()
+
+    # ==================== LEITURA ====================
+
+    async def get_daily_series(
+        self,
+        start_date: str,
+        end_date: str,
+        store: Optional[str] = None,
+        category: Optional[str] = None
+    ) -> List[Dict]:
+        """Série diária já agregada (somando lojas/categorias quando não filtradas)"""
+        params = {
+            "p_start": start_date[:10],
+            "p_end": end_date[:10],
+            "p_store": store or None,
+            "p_category": category or None
+        }
+
+        # Soma por dia no banco e lê em páginas: dias x lojas x categorias passa do max-rows
+        series = []
+        for page in keyset_paginate(
+            lambda: self.supabase.client.rpc("get_daily_rollup_series", params),
+            key="day"
+        ):
+            for row in page:
+                metrics = {metric: float(row.get(metric) or 0) for metric in ROLLUP_METRICS}
+                series.append({
+                    "date": row["day"],
+                    "products_added": int(metrics["products_added"]),
+                    "products_sold": int(metrics["sales_count"]),
+                    "total_sales": metrics["sale_amount"],
+                    "total_commission": metrics["commission_amount"],
+                    "telegram_sends": int(metrics["telegram_sends"]),
+                    "price_changes": int(metrics["price_changes"])
+                })
+
+        return series
+
+    async def get_commission_daily_totals(self, start_date: str, end_date: str) -> Optional[Dict[str, Dict]]:
+        """
+        Totais diários de comissão a partir dos rollups.
+
+        Retorna None quando o período não é de dias inteiros (YYYY-MM-DD),
+        quando os rollups ainda não passaram do último dia pedido ou quando
+        há vendas do período inseridas depois da última agregação (importação
+        retroativa ainda não somada).
+        """
+        if len(start_date) != 10 or len(end_date) != 10:
+            return None
+
+        folded_until = self._load_watermarks().get("folded_until", {}).get("commissions")
+        if not folded_until or folded_until[:10] <= end_date:
+            return None
+
+        pending = self.supabase.client.table("commissions")\
+            .select("id")\
+            .gt("created_at", folded_until)\
+            .gte("calculated_at", start_date)\
+            .lt("calculated_at", f"{end_date}T23:59:59.999999")\
+            .limit(1)\
+            .execute()
+        if pending.data:
+            return None
+
+        series = await self.get_daily_series(start_date, end_date)
+        return {
+            day["date"]: {"sales": day["total_sales"], "commission": day["total_commission"]}
+            for day in series
+            if day["products_sold"]
+        }
+
+
+async def update_daily_rollups() -> Dict[str, int]:
+    """Tarefa agendada: agrega novas linhas nos rollups diários"""
+    return await DailyRollups().fold_new_rows()
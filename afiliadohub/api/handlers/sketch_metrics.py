@@ -0,0 +1,76 @@
+"""
+Métricas aproximadas (distintos e top-K) mantidas em sketches por dia/loja
+"""
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from ..utils.supabase_client import get_supabase_manager
+from ..utils.pagination import keyset_paginate
+from ..utils.sketches import (
+    UNIQUE_USERS,
+    distinct_products_metric,
+    top_products_metric,
+    sketch_from_dict
+)
+
+
+class SketchMetrics:
+    """Consultas sobre os sketches gravados"""
+
+    def __init__(self):
+        self.supabase = get_supabase_manager()
+
+    def _load(self, metric: str, days: int, store: Optional[str] = None):
+        """Mescla os sketches de uma métrica no período (todas as lojas se não filtrado)"""
+        merged = None
+        # Um dia por vez, em páginas: cada dia tem uma linha por loja e nó
+        for offset in range(days):
+            day = (datetime.now() - timedelta(days=offset)).strftime("%Y-%m-%d")
+
+            def query_factory(day=day):
+                query = self.supabase.client.table("metric_sketches")\
+                    .select("store, node, payload")\
+                    .eq("metric", metric)\
+                    .eq("day", day)
+                return query.eq("store", store) if store else query
+
+            pages = keyset_paginate(query_factory, key="node", order_column=None if store else "store", page_size=200)
+            for page in pages:
+                for row in page:
+                    sketch = sketch_from_dict(row["payload"])
+                    merged = sketch if merged is None else merged.merge(sketch)
+
+        return merged
+
+    async def unique_users(self, days: int = 30, store: Optional[str] = None) -> Dict[str, Any]:
+        hll = self._load(UNIQUE_USERS, days, store)
+        return {
+            "estimate": hll.count() if hll else 0,
+            "relative_error": hll.relative_error if hll else 0
+        }
+
+    async def distinct_products(self, stat_type: str = "telegram_send_count", days: int = 30,
+                                store: Optional[str] = None) -> Dict[str, Any]:
+        hll = self._load(distinct_products_metric(stat_type), days, store)
+        return {
+            "estimate": hll.count() if hll else 0,
+            "relative_error": hll.relative_error if hll else 0
+        }
+
+    async def top_products(self, stat_type: str = "telegram_send_count", days: int = 30,
+                           store: Optional[str] = None, k: int = 10) -> Dict[str, Any]:
+        topk = self._load(top_products_metric(stat_type), days, store)
+        return {
+            "items": topk.top(k) if topk else [],
+            "max_overcount": topk.cms.error_bound if topk else 0
+        }
+
+    async def get_reach_summary(self, days: int = 30, store: Optional[str] = None, k: int = 10) -> Dict[str, Any]:
+        """Resumo de alcance: usuários únicos, produtos distintos enviados e mais enviados"""
+        return {
+            "period_days": days,
+            "store": store,
+            "unique_users": await self.unique_users(days, store),
+            "distinct_products_sent": await self.distinct_products("telegram_send_count", days, store),
+            "top_sent": await self.top_products("telegram_send_count", days, store, k)
+        }
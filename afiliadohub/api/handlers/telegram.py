@@ -184,7 +184,9 @@ Ex: /buscar fone bluetooth
                 # Atualiza estatísticas
                 await self.supabase.increment_product_stats(
                     product["id"],
-                    "telegram_send_count"
+                    "telegram_send_count",
+                    store=product.get("store"),
+                    user_id=update.effective_user.id if update.effective_user else None
                 )
             else:
                 await update.message.reply_text(
@@ -221,7 +223,9 @@ Ex: /buscar fone bluetooth
                     # Atualiza estatísticas
                     await self.supabase.increment_product_stats(
                         product["id"],
-                        "telegram_send_count"
+                        "telegram_send_count",
+                        store=product.get("store"),
+                        user_id=update.effective_user.id if update.effective_user else None
                     )
                     
                     # Pequena pausa entre mensagens
@@ -562,7 +566,9 @@ Ex: /buscar eletrônicos
             # Atualiza estatísticas
             await self.supabase.increment_product_stats(
                 product["id"],
-                "telegram_send_count"
+                "telegram_send_count",
+                store=product.get("store"),
+                user_id=chat_id
             )
             
             logger.info(f"[OK] Produto {product['id']} enviado para {chat_id}")
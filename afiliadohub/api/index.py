@@ -28,6 +28,7 @@ from .handlers.export_reports import ReportExporter
 from .utils.supabase_client import get_supabase_manager
 from .utils.logger import setup_logger
 from .utils.scheduler import scheduler
+from .utils.sketches import sketch_recorder
 
 # Configuração de logging
 logger = setup_logger()
@@ -50,6 +51,9 @@ async def lifespan(app: FastAPI):
     # 1. Startup
     logger.info("[STARTUP] Iniciando AfiliadoHub API...")
     
+    # Sketches de métricas: cada processo grava os eventos que registrou
+    await sketch_recorder.start()
+    
     # Inicia Scheduler (apenas se não estiver em ambiente serverless como Vercel)
     # Se estiver no Vercel, o GitHub Actions (cron.yml) fará o trabalho.
     if os.getenv("RUN_SCHEDULER", "False").lower() == "true":
@@ -70,6 +74,10 @@ async def lifespan(app: FastAPI):
     # 2. Shutdown
     logger.info("🛑 Encerrando serviços...")
     await scheduler.stop()
+    await sketch_recorder.stop()
+    
+    from .handlers.export_jobs import export_jobs
+    export_jobs.shutdown()
 
 # Inicialização do FastAPI
 app = FastAPI(
@@ -266,6 +274,39 @@ async def commission_calc(data: dict):
         data.get("product_id"), data.get("sale_amount")
     )
 
+@app.post("/api/commission/bulk", dependencies=[Depends(verify_admin_token)])
+async def commission_bulk(data: dict):
+    """Registra várias vendas: {"sales": [{"product_id", "sale_amount", ...}]}"""
+    sales = data.get("sales")
+    if not isinstance(sales, list):
+        raise HTTPException(status_code=400, detail="Campo 'sales' deve ser uma lista")
+    
+    commission_system = CommissionSystem()
+    return await commission_system.calculate_commissions_bulk(sales)
+
+@app.post("/api/commission/bulk/csv", dependencies=[Depends(verify_admin_token)])
+async def commission_bulk_csv(file: UploadFile = File(...)):
+    """Registra vendas a partir do CSV do relatório de afiliados"""
+    from .handlers.commission import parse_sales_csv
+    
+    if not file.filename.endswith('.csv'):
+        raise HTTPException(status_code=400, detail="Apenas CSV permitido")
+    
+    sales = parse_sales_csv(await file.read())
+    commission_system = CommissionSystem()
+    return await commission_system.calculate_commissions_bulk(sales)
+
+@app.post("/api/commission/status", dependencies=[Depends(verify_admin_token)])
+async def commission_status(data: dict):
+    """Transição em lote: {"ids": [...], "status": "approved" | "paid" | "cancelled"}"""
+    from .handlers.commission_ledger import CommissionLedger
+    
+    ids = data.get("ids")
+    if not isinstance(ids, list) or not ids:
+        raise HTTPException(status_code=400, detail="Campo 'ids' deve ser uma lista não vazia")
+    
+    return await CommissionLedger().transition(ids, data.get("status"))
+
 # ==================== EXECUÇÃO LOCAL ====================
 if __name__ == "__main__":
     uvicorn.run("api.index:app", host="0.0.0.0", port=8000, reload=True)
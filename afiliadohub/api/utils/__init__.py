@@ -10,6 +10,10 @@ from .link_processor import (
     LinkProcessor
 )
 from .scheduler import Scheduler, scheduler
+from .cron import CronExpression
+from .pagination import keyset_paginate
+from .cache import AnalyticsCache, analytics_cache
+from .sketches import HyperLogLog, CountMinSketch, SpaceSaving, TopK, sketch_recorder
 from .logger import setup_logger, logger, json_logger
 
 __all__ = [
@@ -22,6 +26,15 @@ __all__ = [
     'LinkProcessor',
     'Scheduler',
     'scheduler',
+    'CronExpression',
+    'keyset_paginate',
+    'AnalyticsCache',
+    'analytics_cache',
+    'HyperLogLog',
+    'CountMinSketch',
+    'SpaceSaving',
+    'TopK',
+    'sketch_recorder',
     'setup_logger',
     'logger',
     'json_logger'
@@ -0,0 +1,147 @@
+"""
+Cache de resultados de analytics com stale-while-revalidate
+"""
+import asyncio
+import copy
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# TTL (segundos) por tipo de relatório
+DEFAULT_TTLS = {
+    "funnel": 300,
+    "performance": 900
+}
+
+
+class AnalyticsCache:
+    """
+    Cache em memória por (relatório, parâmetros).
+
+    - Fresco (idade < TTL): devolve direto.
+    - Vencido, mas dentro de `max_stale_factor` × TTL: devolve o valor antigo
+      na hora e recalcula em background.
+    - Ausente ou velho demais: calcula e espera.
+    Requisições idênticas simultâneas compartilham o mesmo cálculo. Cada
+    chamador recebe uma cópia do resultado, nunca o objeto guardado.
+    """
+
+    def __init__(
+        self,
+        ttls: Optional[Dict[str, int]] = None,
+        default_ttl: int = 300,
+        max_stale_factor: int = 12,
+        max_entries: int = 256
+    ):
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.default_ttl = default_ttl
+        self.max_stale_factor = max_stale_factor
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._background = set()
+        self.stats = {"hits": 0, "stale_hits": 0, "misses": 0, "computations": 0}
+
+    @staticmethod
+    def day_key(value: Optional[str]) -> Optional[str]:
+        """Datas ISO reduzidas ao dia: períodos "até agora" caem na mesma chave o dia todo"""
+        return value[:10] if value else value
+
+    @staticmethod
+    def make_key(report: str, params: Optional[Dict[str, Any]] = None) -> str:
+        return f"{report}:{json.dumps(params or {}, sort_keys=True, default=str)}"
+
+    def ttl_for(self, report: str) -> int:
+        return self.ttls.get(report, self.default_ttl)
+
+    async def get_or_compute(
+        self,
+        report: str,
+        params: Optional[Dict[str, Any]],
+        compute: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """Retorna o resultado do relatório, do cache quando possível"""
+        key = self.make_key(report, params)
+        ttl = self.ttl_for(report)
+        entry = self._entries.get(key)
+
+        if entry is not None:
+            value, computed_at = entry
+            age = time.monotonic() - computed_at
+            self._entries.move_to_end(key)
+
+            if age < ttl:
+                self.stats["hits"] += 1
+                return copy.deepcopy(value)
+
+            if age < ttl * self.max_stale_factor:
+                self.stats["stale_hits"] += 1
+                if key not in self._inflight:
+                    task = asyncio.create_task(self._refresh_in_background(key, compute))
+                    self._background.add(task)
+                    task.add_done_callback(self._background.discard)
+                return copy.deepcopy(value)
+
+        self.stats["misses"] += 1
+        return copy.deepcopy(await self._compute_once(key, compute))
+
+    async def _compute_once(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """Executa o cálculo uma única vez por chave, mesmo com chamadas concorrentes"""
+        future = self._inflight.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+
+        try:
+            self.stats["computations"] += 1
+            value = await compute()
+            self._store(key, value)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Evita "exception never retrieved" quando ninguém mais aguardava
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _refresh_in_background(self, key: str, compute: Callable[[], Awaitable[Any]]):
+        try:
+            await self._compute_once(key, compute)
+        except Exception as e:
+            logger.warning(f"Falha ao revalidar cache {key}: {e}")
+
+    def _store(self, key: str, value: Any):
+        # Resultados de erro não são cacheados
+        if isinstance(value, dict) and "error" in value:
+            return
+
+        self._entries[key] = (value, time.monotonic())
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, report: Optional[str] = None):
+        """Remove entradas de um relatório (ou todas)"""
+        if report is None:
+            self._entries.clear()
+            return
+
+        prefix = f"{report}:"
+        for key in [k for k in self._entries if k.startswith(prefix)]:
+            del self._entries[key]
+
+
+# Instância global compartilhada entre requisições
+analytics_cache = AnalyticsCache()
@@ -0,0 +1,152 @@
+"""
+Armazenamento de chunks endereçados por conteúdo (backups)
+
+Cada chunk é um bloco de linhas NDJSON comprimido com zstd e gravado em
+<raiz>/<2 primeiros hex>/<sha256>.ndjson.zst, onde o hash é o do conteúdo
+sem compressão. Backups que exportam as mesmas linhas geram o mesmo hash e
+reaproveitam o arquivo; o manifesto de cada backup lista os hashes por
+tabela e gc() remove os chunks que nenhum manifesto referencia.
+
+O corte entre chunks depende do hash da chave da linha, não da posição:
+inserir, alterar ou remover uma linha em geral só muda o chunk em que ela está.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List
+
+DEFAULT_ZSTD_LEVEL = int(os.getenv("BACKUP_ZSTD_LEVEL", "3"))
+DEFAULT_CHUNK_ROWS = int(os.getenv("BACKUP_CHUNK_ROWS", "1000"))
+CHUNK_SUFFIX = ".ndjson.zst"
+
+
+def _require_zstandard():
+    try:
+        import zstandard  # noqa: F401
+    except ImportError:
+        raise ImportError("zstandard é necessário para backups em chunks (pip install zstandard ou BACKUP_STORAGE=tar)")
+
+
+class ChunkStore:
+    """Diretório de chunks zstd, um arquivo por hash"""
+
+    def __init__(self, root: Path, level: int = DEFAULT_ZSTD_LEVEL):
+        _require_zstandard()
+        self.root = Path(root)
+        self.level = level
+        # Compressores zstd não podem ser usados por duas threads ao mesmo tempo
+        self._local = threading.local()
+
+    def path(self, digest: str) -> Path:
+        return self.root / digest[:2] / f"{digest}{CHUNK_SUFFIX}"
+
+    def put(self, data: bytes) -> Dict[str, Any]:
+        """Grava o chunk se ainda não existir; `new` indica se foi escrito agora"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+
+        if path.exists():
+            # Reaproveitado por um backup em andamento: renova o mtime para o gc()
+            # (que só poupa chunks recentes) não removê-lo antes do manifesto existir
+            os.utime(path)
+            return {"hash": digest, "size": path.stat().st_size, "new": False}
+
+        compressed = self._compressor().compress(data)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(compressed)
+        os.replace(tmp_path, path)
+
+        return {"hash": digest, "size": len(compressed), "new": True}
+
+    def get(self, digest: str) -> bytes:
+        """Conteúdo do chunk, conferido contra o hash"""
+        import zstandard
+
+        with open(self.path(digest), "rb") as f:
+            data = zstandard.ZstdDecompressor().decompress(f.read())
+
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError(f"Chunk corrompido: {digest}")
+        return data
+
+    def iter_rows(self, digests: Iterable[str]) -> Iterator[Dict[str, Any]]:
+        for digest in digests:
+            for line in self.get(digest).splitlines():
+                if line.strip():
+                    yield json.loads(line)
+
+    def gc(self, referenced: set, grace_seconds: float = 3600) -> Dict[str, int]:
+        """
+        Remove chunks fora de `referenced`. Chunks gravados há menos de
+        `grace_seconds` ficam: podem ser de um backup ainda em andamento,
+        cujo manifesto não existe.
+        """
+        removed = 0
+        freed = 0
+        cutoff = time.time() - grace_seconds
+
+        if not self.root.exists():
+            return {"removed": 0, "bytes": 0}
+
+        for path in self.root.glob(f"*/*{CHUNK_SUFFIX}"):
+            digest = path.name[:-len(CHUNK_SUFFIX)]
+            stat = path.stat()
+            if digest in referenced or stat.st_mtime > cutoff:
+                continue
+            path.unlink()
+            removed += 1
+            freed += stat.st_size
+
+        return {"removed": removed, "bytes": freed}
+
+    def _compressor(self):
+        import zstandard
+
+        if not hasattr(self._local, "compressor"):
+            self._local.compressor = zstandard.ZstdCompressor(level=self.level)
+        return self._local.compressor
+
+
+class ChunkWriter:
+    """Recebe páginas de linhas (em ordem de chave) e as corta em chunks"""
+
+    def __init__(self, store: ChunkStore, key: str, target_rows: int = DEFAULT_CHUNK_ROWS):
+        self.store = store
+        self.key = key
+        self.target_rows = max(1, target_rows)
+        self.min_rows = max(1, self.target_rows // 4)
+        self.max_rows = self.target_rows * 4
+        self.chunks: List[Dict[str, Any]] = []
+        self._lines: List[str] = []
+
+    def add(self, rows: List[Dict[str, Any]]):
+        for row in rows:
+            self._lines.append(json.dumps(row, ensure_ascii=False, separators=(",", ":"), default=str) + "\n")
+            if self._is_boundary(row[self.key]):
+                self._flush()
+
+    def close(self) -> List[Dict[str, Any]]:
+        self._flush()
+        return self.chunks
+
+    def _is_boundary(self, key_value: Any) -> bool:
+        count = len(self._lines)
+        if count >= self.max_rows:
+            return True
+        if count < self.min_rows:
+            return False
+        digest = hashlib.blake2b(str(key_value).encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "big") % self.target_rows == 0
+
+    def _flush(self):
+        if not self._lines:
+            return
+        chunk = self.store.put("".join(self._lines).encode("utf-8"))
+        chunk["rows"] = len(self._lines)
+        self.chunks.append(chunk)
+        self._lines = []
@@ -0,0 +1,126 @@
+"""
+Expressões cron (5 campos: minuto hora dia mês dia-da-semana)
+
+Suporta "*", listas (1,15), intervalos (1-5), passos (*/15, 8-18/2) e
+nomes de meses/dias em inglês (jan, mon). Como no cron clássico, se dia do
+mês e dia da semana forem ambos restritos, vale qualquer um dos dois.
+"""
+from datetime import datetime, timedelta
+from typing import List, Set
+
+_FIELDS = [
+    ("minute", 0, 59),
+    ("hour", 0, 23),
+    ("day", 1, 31),
+    ("month", 1, 12),
+    ("weekday", 0, 7)  # domingo = 0 ou 7
+]
+
+_NAMES = {
+    "month": {name: i for i, name in enumerate(
+        ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"], start=1)},
+    "weekday": {name: i for i, name in enumerate(["sun", "mon", "tue", "wed", "thu", "fri", "sat"])}
+}
+
+_ALIASES = {
+    "@hourly": "0 * * * *",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@weekly": "0 0 * * 0",
+    "@monthly": "0 0 1 * *",
+    "@yearly": "0 0 1 1 *"
+}
+
+
+def _parse_value(field: str, text: str) -> int:
+    names = _NAMES.get(field, {})
+    return names[text.lower()] if text.lower() in names else int(text)
+
+
+def _parse_field(field: str, text: str, low: int, high: int) -> Set[int]:
+    values = set()
+
+    for part in text.split(","):
+        step = 1
+        if "/" in part:
+            part, step_text = part.split("/", 1)
+            step = int(step_text)
+            if step <= 0:
+                raise ValueError(f"Passo inválido em {field}: {text}")
+
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            start_text, end_text = part.split("-", 1)
+            start, end = _parse_value(field, start_text), _parse_value(field, end_text)
+        else:
+            start = _parse_value(field, part)
+            end = high if step > 1 else start
+
+        if not (low <= start <= high and low <= end <= high and start <= end):
+            raise ValueError(f"Valor fora do intervalo em {field}: {text}")
+
+        values.update(v % 7 if field == "weekday" else v for v in range(start, end + 1, step))
+
+    return values
+
+
+class CronExpression:
+    """Expressão cron já interpretada; `next_after` calcula a próxima ocorrência"""
+
+    def __init__(self, expression: str):
+        self.expression = expression.strip()
+        text = _ALIASES.get(self.expression.lower(), self.expression)
+        parts = text.split()
+
+        if len(parts) != 5:
+            raise ValueError(f"Expressão cron deve ter 5 campos: {expression!r}")
+
+        parsed: List[Set[int]] = [
+            _parse_field(name, part, low, high)
+            for (name, low, high), part in zip(_FIELDS, parts)
+        ]
+        self.minutes, self.hours, self.days, self.months, self.weekdays = parsed
+        self._day_restricted = parts[2] != "*"
+        self._weekday_restricted = parts[4] != "*"
+
+    def _day_matches(self, moment: datetime) -> bool:
+        weekday = (moment.weekday() + 1) % 7  # cron: domingo = 0
+        day_ok = moment.day in self.days
+        weekday_ok = weekday in self.weekdays
+
+        if self._day_restricted and self._weekday_restricted:
+            return day_ok or weekday_ok
+        return day_ok and weekday_ok
+
+    def next_after(self, moment: datetime) -> datetime:
+        """Primeiro horário estritamente depois de `moment` que casa com a expressão"""
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate + timedelta(days=366 * 5)
+
+        while candidate < limit:
+            if candidate.month not in self.months:
+                # Pula para o primeiro dia do próximo mês
+                year = candidate.year + (candidate.month == 12)
+                month = candidate.month % 12 + 1
+                candidate = candidate.replace(year=year, month=month, day=1, hour=0, minute=0)
+                continue
+
+            if not self._day_matches(candidate):
+                candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+                continue
+
+            if candidate.hour not in self.hours:
+                candidate = candidate.replace(minute=0) + timedelta(hours=1)
+                continue
+
+            if candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+                continue
+
+            return candidate
+
+        raise ValueError(f"Expressão cron sem ocorrências: {self.expression!r}")
+
+    def __repr__(self) -> str:
+        return f"CronExpression({self.expression!r})"
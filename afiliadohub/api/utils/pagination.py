@@ -0,0 +1,59 @@
+"""
+Paginação por chave (keyset) sobre o PostgREST
+"""
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+
+def _quote(value: Any) -> str:
+    """Escapa valor para uso dentro de filtros or=(...) do PostgREST"""
+    text = str(value).replace('\\', '\\\\').replace('"', '\\"')
+    return f'"{text}"'
+
+
+def keyset_paginate(
+    query_factory: Callable[[], Any],
+    key: str = "id",
+    order_column: Optional[str] = None,
+    page_size: int = 1000,
+    start_after: Optional[Tuple[Any, Any]] = None
+) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Itera páginas de uma tabela sem OFFSET, usando a última chave lida.
+
+    `query_factory` deve devolver um builder novo já com `select` e filtros
+    (as colunas `key` e `order_column` precisam estar no select). Com
+    `order_column`, a ordenação é (order_column, key) e `start_after` é a
+    tupla (valor_ordem, valor_chave) de onde continuar; sem ela, é apenas a
+    chave e `start_after` é (None, valor_chave).
+    """
+    last_order, last_key = start_after if start_after else (None, None)
+
+    while True:
+        query = query_factory()
+
+        if order_column:
+            if last_order is not None:
+                query = query.or_(
+                    f"{order_column}.gt.{_quote(last_order)},"
+                    f"and({order_column}.eq.{_quote(last_order)},{key}.gt.{_quote(last_key)})"
+                )
+            query = query.order(order_column).order(key)
+        else:
+            if last_key is not None:
+                query = query.gt(key, last_key)
+            query = query.order(key)
+
+        response = query.limit(page_size).execute()
+        rows = response.data if response.data else []
+
+        if not rows:
+            return
+
+        yield rows
+
+        last_key = rows[-1][key]
+        if order_column:
+            last_order = rows[-1][order_column]
+
+        if len(rows) < page_size:
+            return
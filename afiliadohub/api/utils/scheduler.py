@@ -1,20 +1,55 @@
 """
 Sistema de agendamento para tarefas periódicas
+
+Motor baseado em heap: um único laço dorme até a próxima tarefa vencida
+(ou até uma tarefa nova ser agendada). Suporta intervalos e expressões
+cron, guarda o último disparo de cada tarefa (SQLite local ou settings)
+para não reexecutar tudo a cada reinício, e aplica por tarefa limite de
+execuções simultâneas, jitter e timeout.
+
+Com várias réplicas (RUN_SCHEDULER=true em mais de um worker/instância),
+só o nó que detém o lease do agendador dispara as tarefas; os demais
+assumem quando o lease expira (ver scheduler_lease.py).
 """
 import asyncio
+import heapq
+import itertools
 import logging
+import os
+import random
+import socket
+import time
+import uuid
 from datetime import datetime, timedelta
-from typing import Callable, Dict, Any
+from typing import Callable, Dict, Any, Optional
 import aiohttp
 
+from .cron import CronExpression
+from .scheduler_store import get_state_store
+from .scheduler_lease import DEFAULT_LEASE_TTL, get_lease_store
+
 logger = logging.getLogger(__name__)
 
+LEASE_NAME = "scheduler"
+
 class Scheduler:
     """Agendador de tarefas periódicas"""
     
-    def __init__(self):
+    def __init__(self, state_store=None, lease_store=None, node_id: str = None, lease_ttl: float = None):
         self.tasks = {}
         self.running = False
+        self.state_store = state_store
+        self.lease_store = lease_store
+        self.lease_ttl = lease_ttl or DEFAULT_LEASE_TTL
+        self.node_id = node_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._leader_until = 0.0
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._persisted: Dict[str, datetime] = {}
+        self._heap = []
+        self._sequence = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop_task: Optional[asyncio.Task] = None
+        self._running_tasks = set()
         
     async def start(self):
         """Inicia o agendador"""
@@ -22,7 +57,26 @@ class Scheduler:
             return
         
         self.running = True
-        logger.info("🔄 Agendador iniciado")
+        self._wakeup = asyncio.Event()
+        
+        # Últimos disparos persistidos (reinícios não reexecutam tudo)
+        try:
+            if self.state_store is None:
+                self.state_store = get_state_store()
+            self._persisted = self.state_store.load()
+        except Exception as e:
+            logger.warning(f"Estado do agendador indisponível, iniciando sem histórico: {e}")
+            self._persisted = {}
+        
+        # Disputa o lease antes de agendar (o líder já dispara o que estiver vencido)
+        if self.lease_store is None:
+            self.lease_store = get_lease_store()
+        if self.lease_store is not None:
+            await self._renew_lease()
+            self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
+        
+        self._loop_task = asyncio.create_task(self._run_loop())
+        logger.info(f"🔄 Agendador iniciado (nó {self.node_id}, líder: {self.is_leader})")
         
         # Agenda tarefas padrão
         await self.schedule_default_tasks()
@@ -33,21 +87,41 @@ class Scheduler:
         await self.schedule_task(
             "price_check",
             self.check_prices,
-            interval_minutes=60
+            interval_minutes=60,
+            jitter_seconds=120,
+            timeout_seconds=55 * 60
         )
         
-        # Limpeza de produtos inativos diariamente
+        # Limpeza de produtos inativos diariamente (madrugada)
         await self.schedule_task(
             "cleanup",
             self.cleanup_old_products,
-            interval_hours=24
+            cron_expression="0 3 * * *",
+            timeout_seconds=2 * 3600
+        )
+        
+        # Rollups diários incrementais
+        await self.schedule_task(
+            "daily_rollups",
+            self.update_rollups,
+            interval_minutes=15,
+            timeout_seconds=10 * 60
         )
         
-        # Backup semanal
+        # Snapshot Parquet para relatórios (opcional)
+        if os.getenv("ANALYTICS_SNAPSHOT", "false").lower() == "true":
+            await self.schedule_task(
+                "analytics_snapshot",
+                self.export_analytics_snapshot,
+                interval_hours=1,
+                jitter_seconds=300
+            )
+        
+        # Backup semanal (domingo de madrugada)
         await self.schedule_task(
             "backup",
             self.create_backup,
-            interval_days=7
+            cron_expression="0 4 * * 0"
         )
     
     async def schedule_task(
@@ -57,9 +131,22 @@ class Scheduler:
         interval_minutes: int = None,
         interval_hours: int = None,
         interval_days: int = None,
-        cron_expression: str = None
+        cron_expression: str = None,
+        max_concurrency: int = 1,
+        jitter_seconds: float = 0,
+        timeout_seconds: float = None,
+        run_on_start: bool = True,
+        leader_only: bool = True
     ):
-        """Agenda uma tarefa periódica"""
+        """
+        Agenda uma tarefa periódica.
+        
+        Sem histórico persistido, tarefas por intervalo rodam logo
+        (`run_on_start`) e tarefas cron esperam a próxima ocorrência. Com
+        histórico, o próximo disparo parte do último; disparos perdidos
+        enquanto o processo estava parado viram uma única execução.
+        Tarefas `leader_only` só executam no nó que detém o lease.
+        """
         
         if task_id in self.tasks:
             logger.warning(f"Tarefa {task_id} já está agendada")
@@ -67,52 +154,171 @@ class Scheduler:
         
         self.tasks[task_id] = {
             "func": task_func,
-            "last_run": None,
+            "last_run": self._persisted.get(task_id) if leader_only else None,
             "next_run": None,
             "interval_minutes": interval_minutes,
             "interval_hours": interval_hours,
             "interval_days": interval_days,
-            "cron_expression": cron_expression
+            "cron_expression": cron_expression,
+            "cron": CronExpression(cron_expression) if cron_expression else None,
+            "max_concurrency": max(1, max_concurrency),
+            "jitter_seconds": jitter_seconds,
+            "timeout_seconds": timeout_seconds,
+            "run_on_start": run_on_start,
+            "leader_only": leader_only,
+            "running": 0,
+            "skipped": 0,
+            "last_error": None,
+            "last_duration": None
         }
         
-        logger.info(f"[OK] Tarefa {task_id} agendada")
+        task = self.tasks[task_id]
+        self._push(task_id, self._first_run(task))
+        logger.info(f"[OK] Tarefa {task_id} agendada (próxima: {task['next_run'].strftime('%d/%m %H:%M:%S')})")
+    
+    def _first_run(self, task: Dict[str, Any]) -> datetime:
+        """Próximo disparo a partir do último conhecido"""
+        if task["last_run"] is None:
+            if task["run_on_start"] and not task["cron"]:
+                return datetime.now()
+            return self._calculate_next_run(task, datetime.now())
+        
+        # Atrasada (processo parado): max() faz a recuperação numa execução só
+        return max(self._calculate_next_run(task, task["last_run"]), datetime.now())
+    
+    @property
+    def is_leader(self) -> bool:
+        """Sem lease configurado, o nó é sempre líder"""
+        return self.lease_store is None or time.monotonic() < self._leader_until
+    
+    async def _heartbeat_loop(self):
+        """Renova (ou disputa) o lease a cada terço do TTL"""
+        while self.running:
+            try:
+                await asyncio.sleep(self.lease_ttl / 3)
+                await self._renew_lease()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Erro no heartbeat do agendador: {e}")
+    
+    async def _renew_lease(self):
+        was_leader = self.is_leader
+        # Validade local com margem: deixa de disparar antes do lease expirar no store
+        valid_until = time.monotonic() + self.lease_ttl * 0.8
+        
+        try:
+            acquired = await asyncio.to_thread(self.lease_store.acquire, LEASE_NAME, self.node_id, self.lease_ttl)
+        except Exception as e:
+            # Sem resposta do store: mantém a validade atual, que expira sozinha
+            logger.warning(f"Falha ao renovar lease do agendador: {e}")
+            return
+        
+        self._leader_until = valid_until if acquired else 0.0
+        
+        if acquired and not was_leader:
+            logger.info(f"👑 Nó {self.node_id} assumiu o agendador")
+            await self._resync_leader_tasks()
+        elif was_leader and not acquired:
+            logger.warning(f"⚠️ Nó {self.node_id} perdeu o lease do agendador")
+    
+    async def _resync_leader_tasks(self):
+        """Ao assumir, recalcula os disparos a partir do estado salvo pelo líder anterior"""
+        if not self.tasks:
+            return
+        
+        try:
+            persisted = await asyncio.to_thread(self.state_store.load) if self.state_store else {}
+        except Exception as e:
+            logger.warning(f"Estado do agendador indisponível ao assumir: {e}")
+            persisted = {}
+        
+        for task_id, task in self.tasks.items():
+            if not task["leader_only"]:
+                continue
+            last_run = persisted.get(task_id)
+            if last_run and (task["last_run"] is None or last_run > task["last_run"]):
+                task["last_run"] = last_run
+            self._push(task_id, self._first_run(task))
+    
+    def _push(self, task_id: str, when: datetime):
+        task = self.tasks[task_id]
+        if task["jitter_seconds"]:
+            when += timedelta(seconds=random.uniform(0, task["jitter_seconds"]))
+        
+        task["next_run"] = when
+        heapq.heappush(self._heap, (when, next(self._sequence), task_id))
         
-        # Inicia a execução em background
-        asyncio.create_task(self._run_task(task_id))
+        if self._wakeup is not None:
+            self._wakeup.set()
     
-    async def _run_task(self, task_id: str):
-        """Executa uma tarefa em loop"""
-        while self.running and task_id in self.tasks:
+    async def _run_loop(self):
+        """Dorme até a próxima tarefa vencida e a dispara"""
+        while self.running:
             try:
-                task = self.tasks[task_id]
+                # Descarta entradas de tarefas removidas/reagendadas
+                while self._heap and (
+                    self._heap[0][2] not in self.tasks
+                    or self.tasks[self._heap[0][2]]["next_run"] != self._heap[0][0]
+                ):
+                    heapq.heappop(self._heap)
                 
-                # Calcula quando executar
-                if task["last_run"] is None:
-                    # Primeira execução imediata
-                    await self._execute_task(task_id)
-                else:
-                    # Calcula próximo horário
-                    next_run = self._calculate_next_run(task)
-                    
-                    if datetime.now() >= next_run:
-                        await self._execute_task(task_id)
-                    else:
-                        # Aguarda até o próximo horário
-                        wait_seconds = (next_run - datetime.now()).total_seconds()
-                        await asyncio.sleep(min(wait_seconds, 60))  # Verifica a cada minuto
+                timeout = None
+                if self._heap:
+                    timeout = max(0.0, (self._heap[0][0] - datetime.now()).total_seconds())
                 
-                # Pequena pausa para não sobrecarregar
-                await asyncio.sleep(1)
+                if timeout is None or timeout > 0:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                
+                _, _, task_id = heapq.heappop(self._heap)
+                self._dispatch(task_id)
                 
             except asyncio.CancelledError:
                 break
             except Exception as e:
-                logger.error(f"Erro na tarefa {task_id}: {e}")
-                await asyncio.sleep(60)  # Aguarda antes de tentar novamente
+                logger.error(f"Erro no laço do agendador: {e}")
+                await asyncio.sleep(1)
+    
+    def _dispatch(self, task_id: str):
+        """Dispara a tarefa (se houver vaga) e reagenda a próxima ocorrência"""
+        task = self.tasks[task_id]
+        now = datetime.now()
+        
+        if task["leader_only"] and not self.is_leader:
+            # Outro nó executa; ao assumir o lease os disparos são recalculados
+            logger.debug(f"Tarefa {task_id} ignorada (nó {self.node_id} não é líder)")
+        elif task["running"] >= task["max_concurrency"]:
+            task["skipped"] += 1
+            logger.warning(f"⏭️ Tarefa {task_id} ainda em execução, disparo ignorado")
+        else:
+            task["running"] += 1
+            task["last_run"] = now
+            # Só o líder persiste: tarefas de todos os nós não têm um "último disparo" comum
+            if task["leader_only"]:
+                self._save_last_run(task_id, now)
+            
+            execution = asyncio.create_task(self._execute_task(task_id))
+            self._running_tasks.add(execution)
+            execution.add_done_callback(self._running_tasks.discard)
+        
+        self._push(task_id, self._calculate_next_run(task, now))
     
-    def _calculate_next_run(self, task: Dict[str, Any]) -> datetime:
+    def _save_last_run(self, task_id: str, when: datetime):
+        try:
+            if self.state_store is not None:
+                self.state_store.save(task_id, when)
+        except Exception as e:
+            logger.warning(f"Falha ao persistir estado da tarefa {task_id}: {e}")
+    
+    def _calculate_next_run(self, task: Dict[str, Any], last_run: datetime) -> datetime:
         """Calcula o próximo horário de execução"""
-        last_run = task["last_run"]
+        if task["cron"]:
+            return task["cron"].next_after(last_run)
         
         if task["interval_minutes"]:
             return last_run + timedelta(minutes=task["interval_minutes"])
@@ -125,88 +331,100 @@ class Scheduler:
             return last_run + timedelta(hours=1)
     
     async def _execute_task(self, task_id: str):
-        """Executa uma tarefa"""
+        """Executa uma tarefa (com timeout, se configurado)"""
+        task = self.tasks.get(task_id)
+        if task is None:
+            return
+        
+        started = datetime.now()
         try:
-            task = self.tasks[task_id]
             logger.info(f"▶️ Executando tarefa: {task_id}")
             
-            # Atualiza timestamps
-            task["last_run"] = datetime.now()
-            task["next_run"] = self._calculate_next_run(task)
-            
-            # Executa a função
+            # Executa a função (síncronas vão para uma thread)
             if asyncio.iscoroutinefunction(task["func"]):
-                await task["func"]()
+                call = task["func"]()
             else:
-                task["func"]()
+                call = asyncio.to_thread(task["func"])
+            
+            await asyncio.wait_for(call, timeout=task["timeout_seconds"])
             
+            task["last_error"] = None
             logger.info(f"[OK] Tarefa {task_id} concluída")
             
+        except asyncio.TimeoutError:
+            task["last_error"] = f"timeout após {task['timeout_seconds']}s"
+            logger.error(f"[ERRO] Tarefa {task_id} excedeu o timeout de {task['timeout_seconds']}s")
+        except asyncio.CancelledError:
+            task["last_error"] = "cancelada"
+            raise
         except Exception as e:
+            task["last_error"] = str(e)
             logger.error(f"[ERRO] Erro na execução da tarefa {task_id}: {e}")
+        finally:
+            task["running"] -= 1
+            task["last_duration"] = (datetime.now() - started).total_seconds()
     
     async def check_prices(self):
-        """Verifica e atualiza preços dos produtos"""
+        """Consulta as lojas e atualiza os preços dos produtos mais desatualizados"""
         try:
-            from api.utils.supabase_client import get_supabase_manager
-            supabase = get_supabase_manager()
+            from api.handlers.price_refresh import refresh_prices
             
             logger.info("🔍 Verificando preços...")
+            stats = await refresh_prices(interval_hours=1)
             
-            # Busca produtos que precisam de verificação
-            week_ago = (datetime.now() - timedelta(days=7)).isoformat()
-            
-            response = supabase.client.table("products")\
-                .select("id, affiliate_link, current_price")\
-                .eq("is_active", True)\
-                .lt("last_checked", week_ago)\
-                .limit(50)\
-                .execute()
-            
-            products = response.data if response.data else []
-            
-            if not products:
+            if not stats.get("checked"):
                 logger.info("📭 Nenhum produto precisa de verificação")
                 return
             
-            logger.info(f"📦 Verificando preços de {len(products)} produtos")
-            
-            # Aqui você implementaria a lógica real de verificação de preços
-            # Por enquanto, apenas atualiza o timestamp
-            for product in products:
-                supabase.client.table("products")\
-                    .update({"last_checked": datetime.now().isoformat()})\
-                    .eq("id", product["id"])\
-                    .execute()
-            
-            logger.info(f"[OK] Verificação de preços concluída")
+            logger.info(
+                f"[OK] Verificação de preços concluída: {stats['checked']} produtos, "
+                f"{stats.get('changed', 0)} mudanças, {stats.get('not_modified', 0)} sem alteração (304), "
+                f"{stats.get('failed', 0)} falhas ({stats['products_per_hour']}/h)"
+            )
             
         except Exception as e:
             logger.error(f"Erro na verificação de preços: {e}")
     
     async def cleanup_old_products(self):
-        """Remove produtos inativos antigos"""
+        """Remove (e opcionalmente arquiva) produtos inativos antigos, em lotes"""
         try:
-            from api.utils.supabase_client import get_supabase_manager
-            supabase = get_supabase_manager()
+            from api.handlers.product_archival import archive_old_products
             
             logger.info("🧹 Limpando produtos antigos...")
             
-            # Remove produtos inativos com mais de 30 dias
-            month_ago = (datetime.now() - timedelta(days=30)).isoformat()
+            # Remove produtos inativos com mais de 30 dias; o que não couber
+            # no tempo fica no checkpoint para a próxima execução
+            result = await archive_old_products(days_old=30, max_seconds=90 * 60)
+            
+            status = "concluída" if result["done"] else "pausada (continua na próxima execução)"
+            logger.info(f"🗑️ {result['deleted']} produtos antigos removidos, limpeza {status}")
+            
+        except Exception as e:
+            logger.error(f"Erro na limpeza de produtos: {e}")
+    
+    async def update_rollups(self):
+        """Agrega novos produtos, envios e comissões nos rollups diários"""
+        try:
+            from api.handlers.rollups import update_daily_rollups
             
-            response = supabase.client.table("products")\
-                .delete()\
-                .eq("is_active", False)\
-                .lt("updated_at", month_ago)\
-                .execute()
+            logger.info("📊 Atualizando rollups diários...")
+            folded = await update_daily_rollups()
+            logger.info(f"[OK] Rollups atualizados: {sum(folded.values())} linhas agregadas")
             
-            deleted_count = len(response.data) if response.data else 0
+        except Exception as e:
+            logger.error(f"Erro ao atualizar rollups: {e}")
+    
+    async def export_analytics_snapshot(self):
+        """Exporta incrementalmente as tabelas de analytics para Parquet"""
+        try:
+            from api.handlers.analytics_snapshot import update_analytics_snapshot
             
-            logger.info(f"🗑️ {deleted_count} produtos antigos removidos")
+            logger.info("🗂️ Atualizando snapshot de analytics...")
+            exported = await update_analytics_snapshot()
+            logger.info(f"[OK] Snapshot atualizado: {sum(exported.values())} linhas exportadas")
             
         except Exception as e:
-            logger.error(f"Erro na limpeza de produtos: {e}")
+            logger.error(f"Erro ao atualizar snapshot de analytics: {e}")
     
     async def create_backup(self):
         """Cria backup do banco de dados"""
@@ -224,10 +442,34 @@ class Scheduler:
         """Para o agendador"""
         self.running = False
         
+        if self._loop_task is not None:
+            self._loop_task.cancel()
+            self._loop_task = None
+        
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+        
+        # Cancela execuções em andamento
+        for execution in list(self._running_tasks):
+            execution.cancel()
+        if self._running_tasks:
+            await asyncio.gather(*self._running_tasks, return_exceptions=True)
+        
         # Cancela todas as tarefas
         for task_id in list(self.tasks.keys()):
             await self.remove_task(task_id)
         
+        self._heap.clear()
+        
+        # Libera o lease para outro nó assumir sem esperar o TTL
+        if self.lease_store is not None and self.is_leader:
+            try:
+                await asyncio.to_thread(self.lease_store.release, LEASE_NAME, self.node_id)
+            except Exception as e:
+                logger.warning(f"Falha ao liberar lease do agendador: {e}")
+        self._leader_until = 0.0
+        
         logger.info("🛑 Agendador parado")
     
     async def remove_task(self, task_id: str):
@@ -244,10 +486,33 @@ class Scheduler:
             status[task_id] = {
                 "last_run": task["last_run"].isoformat() if task["last_run"] else None,
                 "next_run": task["next_run"].isoformat() if task["next_run"] else None,
-                "running": True
+                "schedule": task["cron_expression"] or "interval",
+                "running": task["running"],
+                "max_concurrency": task["max_concurrency"],
+                "leader_only": task["leader_only"],
+                "skipped": task["skipped"],
+                "last_duration": task["last_duration"],
+                "last_error": task["last_error"]
             }
         
         return status
+    
+    async def get_lease_status(self) -> Dict[str, Any]:
+        """Nó atual, liderança e dono do lease"""
+        holder = None
+        if self.lease_store is not None:
+            try:
+                holder = await asyncio.to_thread(self.lease_store.holder, LEASE_NAME)
+            except Exception as e:
+                logger.warning(f"Falha ao consultar lease do agendador: {e}")
+        
+        return {
+            "node_id": self.node_id,
+            "is_leader": self.is_leader,
+            "lease_backend": type(self.lease_store).__name__ if self.lease_store else None,
+            "lease_ttl": self.lease_ttl,
+            "holder": holder
+        }
 
 # Instância global do agendador
 scheduler = Scheduler()
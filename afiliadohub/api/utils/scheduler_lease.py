@@ -0,0 +1,167 @@
+"""
+Lease (eleição de líder) para o agendador com várias réplicas da API
+
+Só o nó que detém o lease dispara as tarefas; ele o renova por heartbeat
+e, se morrer, o lease expira após o TTL e outro nó assume.
+
+- SupabaseLeaseStore: linha na tabela scheduler_leases (várias instâncias)
+- FileLeaseStore: arquivo com trava (workers do uvicorn na mesma máquina)
+- MemoryLeaseStore: em memória, para vários agendadores no mesmo processo
+"""
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LEASE_TTL = int(os.getenv("SCHEDULER_LEASE_TTL", "60"))
+
+
+class MemoryLeaseStore:
+    """Leases em memória (testes e processo único)"""
+
+    def __init__(self, clock: Callable[[], float] = time.time):
+        self.clock = clock
+        self._leases: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, name: str, owner: str, ttl: float) -> bool:
+        """Adquire ou renova o lease; False se outro dono ainda o detém"""
+        with self._lock:
+            now = self.clock()
+            lease = self._leases.get(name)
+            if lease and lease["owner"] != owner and lease["expires_at"] > now:
+                return False
+            self._leases[name] = {"owner": owner, "expires_at": now + ttl}
+            return True
+
+    def release(self, name: str, owner: str):
+        with self._lock:
+            if self._leases.get(name, {}).get("owner") == owner:
+                del self._leases[name]
+
+    def holder(self, name: str) -> Optional[str]:
+        with self._lock:
+            lease = self._leases.get(name)
+            if lease and lease["expires_at"] > self.clock():
+                return lease["owner"]
+            return None
+
+
+class FileLeaseStore:
+    """Leases em arquivos com trava exclusiva (mesma máquina)"""
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory or os.getenv("SCHEDULER_LEASE_DIR", tempfile.gettempdir())
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, f"afiliadohub-{name}.lease")
+
+    @contextmanager
+    def _locked(self, name: str):
+        with open(self._path(name), "a+") as f:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                f.seek(0)
+                yield f
+            finally:
+                f.flush()
+                if fcntl:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+    @staticmethod
+    def _read(f) -> Dict[str, Any]:
+        try:
+            return json.loads(f.read() or "{}")
+        except ValueError:
+            return {}
+
+    @staticmethod
+    def _write(f, lease: Dict[str, Any]):
+        f.seek(0)
+        f.truncate()
+        f.write(json.dumps(lease))
+
+    def acquire(self, name: str, owner: str, ttl: float) -> bool:
+        with self._locked(name) as f:
+            now = time.time()
+            lease = self._read(f)
+            if lease.get("owner") not in (None, owner) and lease.get("expires_at", 0) > now:
+                return False
+            self._write(f, {"owner": owner, "expires_at": now + ttl})
+            return True
+
+    def release(self, name: str, owner: str):
+        with self._locked(name) as f:
+            if self._read(f).get("owner") == owner:
+                self._write(f, {})
+
+    def holder(self, name: str) -> Optional[str]:
+        with self._locked(name) as f:
+            lease = self._read(f)
+            if lease.get("expires_at", 0) > time.time():
+                return lease.get("owner")
+            return None
+
+
+class SupabaseLeaseStore:
+    """Leases na tabela scheduler_leases (ver sql/migration_v3_scheduler_leases.sql)"""
+
+    def _client(self):
+        from .supabase_client import get_supabase_manager
+        return get_supabase_manager().client
+
+    def acquire(self, name: str, owner: str, ttl: float) -> bool:
+        # A função compara e grava numa só instrução (atômico entre réplicas)
+        response = self._client().rpc("acquire_scheduler_lease", {
+            "p_name": name,
+            "p_owner": owner,
+            "p_ttl_seconds": int(ttl)
+        }).execute()
+        return bool(response.data)
+
+    def release(self, name: str, owner: str):
+        self._client().table("scheduler_leases")\
+            .delete()\
+            .eq("name", name)\
+            .eq("owner", owner)\
+            .execute()
+
+    def holder(self, name: str) -> Optional[str]:
+        response = self._client().table("scheduler_leases")\
+            .select("owner, expires_at")\
+            .eq("name", name)\
+            .gt("expires_at", datetime.now(timezone.utc).isoformat())\
+            .execute()
+        rows = response.data or []
+        return rows[0]["owner"] if rows else None
+
+
+def get_lease_store():
+    """Store configurado por SCHEDULER_LEASE_BACKEND (file | supabase | none)"""
+    backend = os.getenv("SCHEDULER_LEASE_BACKEND", "file").lower()
+    if backend == "supabase":
+        return SupabaseLeaseStore()
+    if backend == "none":
+        return None
+    return FileLeaseStore()
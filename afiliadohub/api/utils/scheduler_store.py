@@ -0,0 +1,90 @@
+"""
+Persistência do estado do agendador (último disparo de cada tarefa)
+
+- SQLiteStateStore: arquivo local (padrão, SCHEDULER_STATE_DB)
+- SettingsStateStore: chave "scheduler_state" na tabela settings do Supabase,
+  para quando o disco local não sobrevive a reinícios (Render, containers)
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteStateStore:
+    """Último disparo por tarefa em um SQLite local"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.getenv("SCHEDULER_STATE_DB", "scheduler_state.db")
+        self._lock = threading.Lock()
+        self._execute("CREATE TABLE IF NOT EXISTS task_runs (task_id TEXT PRIMARY KEY, last_run TEXT NOT NULL)")
+
+    def _execute(self, sql: str, params: tuple = ()) -> list:
+        with self._lock:
+            conn = sqlite3.connect(self.path, timeout=10)
+            try:
+                with conn:
+                    return conn.execute(sql, params).fetchall()
+            finally:
+                conn.close()
+
+    def load(self) -> Dict[str, datetime]:
+        rows = self._execute("SELECT task_id, last_run FROM task_runs")
+        return {task_id: datetime.fromisoformat(last_run) for task_id, last_run in rows}
+
+    def save(self, task_id: str, last_run: datetime):
+        self._execute(
+            "INSERT INTO task_runs (task_id, last_run) VALUES (?, ?) "
+            "ON CONFLICT(task_id) DO UPDATE SET last_run = excluded.last_run",
+            (task_id, last_run.isoformat())
+        )
+
+
+class SettingsStateStore:
+    """Último disparo por tarefa na tabela settings (chave única em JSON)"""
+
+    KEY = "scheduler_state"
+
+    def _client(self):
+        from .supabase_client import get_supabase_manager
+        return get_supabase_manager().client
+
+    def _read(self) -> Dict[str, str]:
+        response = self._client().table("settings")\
+            .select("value")\
+            .eq("key", self.KEY)\
+            .execute()
+
+        rows = response.data or []
+        value = rows[0]["value"] if rows else {}
+        if isinstance(value, str):
+            value = json.loads(value)
+        return dict(value or {})
+
+    def _merge(self, task_id: str, last_run: str):
+        # Só a chave da tarefa, e só se for mais nova (ver sql/migration_v3_scheduler_leases.sql):
+        # réplicas com uma cópia antiga do JSON não sobrescrevem o que o líder gravou
+        self._client().rpc("merge_scheduler_state", {
+            "p_key": self.KEY,
+            "p_task_id": task_id,
+            "p_last_run": last_run
+        }).execute()
+
+    def load(self) -> Dict[str, datetime]:
+        return {task_id: datetime.fromisoformat(last_run) for task_id, last_run in self._read().items()}
+
+    def save(self, task_id: str, last_run: datetime):
+        self._merge(task_id, last_run.isoformat())
+
+
+def get_state_store():
+    """Store configurado por SCHEDULER_STATE_BACKEND (sqlite | settings)"""
+    backend = os.getenv("SCHEDULER_STATE_BACKEND", "sqlite").lower()
+    if backend == "settings":
+        return SettingsStateStore()
+    return SQLiteStateStore()
@@ -0,0 +1,465 @@
+"""
+Sketches probabilísticos para métricas de alto volume
+
+- HyperLogLog: contagem aproximada de distintos
+- CountMinSketch: frequência aproximada por item
+- TopK: candidatos Space-Saving com contagens do Count-Min
+
+Todos são mescláveis (dias, lojas, processos) e serializáveis em JSON.
+"""
+import asyncio
+import base64
+import hashlib
+import logging
+import math
+import os
+import socket
+import tempfile
+from array import array
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+SKETCH_FLUSH_INTERVAL = float(os.getenv("SKETCH_FLUSH_INTERVAL", "300"))
+# Linhas de dias anteriores sem escrita há tanto tempo são de nós mortos/reimplantados
+SKETCH_COMPACT_AFTER_HOURS = float(os.getenv("SKETCH_COMPACT_AFTER_HOURS", "6"))
+SKETCH_COMPACT_BATCH = int(os.getenv("SKETCH_COMPACT_BATCH", "100"))
+SKETCH_NODE_SLOTS = 64
+
+_MASK64 = (1 << 64) - 1
+
+
+def _hash128(value: Any) -> Tuple[int, int]:
+    """Hash estável entre processos (hash() do Python é aleatorizado)"""
+    digest = hashlib.blake2b(str(value).encode("utf-8"), digest_size=16).digest()
+    return int.from_bytes(digest[:8], "big"), int.from_bytes(digest[8:], "big")
+
+
+class HyperLogLog:
+    """Contador de distintos com erro relativo ~1.04/sqrt(2^precision)"""
+
+    def __init__(self, precision: int = 12, registers: Optional[bytearray] = None):
+        if not 4 <= precision <= 16:
+            raise ValueError("precision deve estar entre 4 e 16")
+
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers = registers if registers is not None else bytearray(self.m)
+
+    @property
+    def relative_error(self) -> float:
+        return 1.04 / math.sqrt(self.m)
+
+    def add(self, value: Any):
+        h, _ = _hash128(value)
+        index = h >> (64 - self.precision)
+        remaining = h & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - remaining.bit_length() + 1
+
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self) -> int:
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m * self.m / sum(2.0 ** -r for r in self.registers)
+
+        # Correção para cardinalidades pequenas (linear counting)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.m and zeros:
+            estimate = self.m * math.log(self.m / zeros)
+
+        return int(round(estimate))
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        if other.precision != self.precision:
+            raise ValueError("HyperLogLog com precisões diferentes")
+
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+        return self
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "kind": "hll",
+            "precision": self.precision,
+            "registers": base64.b64encode(bytes(self.registers)).decode("ascii")
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "HyperLogLog":
+        return cls(data["precision"], bytearray(base64.b64decode(data["registers"])))
+
+
+class CountMinSketch:
+    """
+    Frequência aproximada: estimativa >= real e, com probabilidade
+    1 - e^-depth, excede o real em no máximo (e / width) × total.
+    """
+
+    def __init__(self, width: int = 1024, depth: int = 4, table: Optional[array] = None, total: int = 0):
+        self.width = width
+        self.depth = depth
+        self.table = table if table is not None else array("I", bytes(4 * width * depth))
+        self.total = total
+
+    @property
+    def error_bound(self) -> float:
+        return math.e / self.width * self.total
+
+    def _cells(self, value: Any):
+        h1, h2 = _hash128(value)
+        for row in range(self.depth):
+            yield row * self.width + ((h1 + row * h2) & _MASK64) % self.width
+
+    def add(self, value: Any, count: int = 1):
+        for cell in self._cells(value):
+            self.table[cell] += count
+        self.total += count
+
+    def estimate(self, value: Any) -> int:
+        return min(self.table[cell] for cell in self._cells(value))
+
+    def merge(self, other: "CountMinSketch") -> "CountMinSketch":
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError("CountMinSketch com dimensões diferentes")
+
+        for i, value in enumerate(other.table):
+            self.table[i] += value
+        self.total += other.total
+        return self
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "kind": "cms",
+            "width": self.width,
+            "depth": self.depth,
+            "total": self.total,
+            "table": base64.b64encode(self.table.tobytes()).decode("ascii")
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "CountMinSketch":
+        table = array("I")
+        table.frombytes(base64.b64decode(data["table"]))
+        return cls(data["width"], data["depth"], table, data["total"])
+
+
+class SpaceSaving:
+    """Mantém no máximo `capacity` candidatos a itens mais frequentes"""
+
+    def __init__(self, capacity: int = 128, counters: Optional[Dict[str, int]] = None):
+        self.capacity = capacity
+        self.counters: Dict[str, int] = counters or {}
+
+    def add(self, item: Any, count: int = 1):
+        key = str(item)
+
+        if key in self.counters:
+            self.counters[key] += count
+        elif len(self.counters) < self.capacity:
+            self.counters[key] = count
+        else:
+            # Substitui o menor contador, herdando sua contagem (superestima)
+            victim = min(self.counters, key=self.counters.get)
+            self.counters[key] = self.counters.pop(victim) + count
+
+    def merge(self, other: "SpaceSaving") -> "SpaceSaving":
+        for key, count in other.counters.items():
+            self.counters[key] = self.counters.get(key, 0) + count
+
+        if len(self.counters) > self.capacity:
+            kept = sorted(self.counters.items(), key=lambda kv: kv[1], reverse=True)[:self.capacity]
+            self.counters = dict(kept)
+        return self
+
+    def candidates(self) -> List[str]:
+        return list(self.counters)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"kind": "spacesaving", "capacity": self.capacity, "counters": self.counters}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "SpaceSaving":
+        return cls(data["capacity"], dict(data["counters"]))
+
+
+class TopK:
+    """Top-K aproximado: candidatos do Space-Saving ordenados pelo Count-Min"""
+
+    def __init__(self, cms: Optional[CountMinSketch] = None, candidates: Optional[SpaceSaving] = None):
+        self.cms = cms or CountMinSketch()
+        self.candidates = candidates or SpaceSaving()
+
+    def add(self, item: Any, count: int = 1):
+        self.cms.add(str(item), count)
+        self.candidates.add(item, count)
+
+    def top(self, k: int = 10) -> List[Dict[str, Any]]:
+        ranked = sorted(
+            ((item, self.cms.estimate(item)) for item in self.candidates.candidates()),
+            key=lambda pair: pair[1],
+            reverse=True
+        )
+        return [{"item": item, "count": count} for item, count in ranked[:k]]
+
+    def merge(self, other: "TopK") -> "TopK":
+        self.cms.merge(other.cms)
+        self.candidates.merge(other.candidates)
+        return self
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"kind": "topk", "cms": self.cms.to_dict(), "candidates": self.candidates.to_dict()}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "TopK":
+        return cls(CountMinSketch.from_dict(data["cms"]), SpaceSaving.from_dict(data["candidates"]))
+
+
+SKETCH_TYPES = {
+    "hll": HyperLogLog,
+    "cms": CountMinSketch,
+    "spacesaving": SpaceSaving,
+    "topk": TopK
+}
+
+
+def sketch_from_dict(data: Dict[str, Any]):
+    """Reconstrói qualquer sketch serializado com to_dict()"""
+    return SKETCH_TYPES[data["kind"]].from_dict(data)
+
+
+# Nome das métricas guardadas em metric_sketches
+UNIQUE_USERS = "unique_users"
+
+
+def distinct_products_metric(stat_type: str) -> str:
+    return f"distinct_products:{stat_type}"
+
+
+def top_products_metric(stat_type: str) -> str:
+    return f"top_products:{stat_type}"
+
+
+class SketchRecorder:
+    """
+    Acumula eventos em memória e descarrega periodicamente em metric_sketches.
+
+    O registro de um evento não faz I/O; `flush()` mescla os sketches locais
+    com os já gravados (HLL por máximo, Count-Min por soma) e faz um único
+    upsert. Todo processo que registra eventos descarrega os seus: `start()`
+    (no lifespan da API) sobe o laço de flush e `stop()` grava o que sobrou.
+
+    O nó é SKETCH_NODE_ID ou hostname:slot (o primeiro slot livre na
+    máquina), então reinícios reaproveitam as mesmas linhas. Linhas de nós
+    que sumiram (outra máquina, deploy novo) são mescladas na linha node=''
+    pelos flushes seguintes, um lote por vez. Cada nó grava nas próprias linhas (coluna node): todas as réplicas
+    descarregam ao mesmo tempo sem perder contagens umas das outras, e a
+    leitura mescla as linhas de todos os nós.
+    """
+
+    def __init__(self, node_id: Optional[str] = None):
+        self._node_id = node_id or os.getenv("SKETCH_NODE_ID")
+        self._slot_file = None
+        self._pending: Dict[Tuple[str, str, str], Any] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+
+    @property
+    def node_id(self) -> str:
+        if self._node_id is None:
+            self._node_id = self._claim_node_id()
+        return self._node_id
+
+    def _claim_node_id(self) -> str:
+        """hostname:N com o primeiro slot livre; a trava fica com o processo até ele sair"""
+        hostname = socket.gethostname()
+        if fcntl is None:
+            return f"{hostname}:{os.getpid()}"
+
+        for slot in range(SKETCH_NODE_SLOTS):
+            path = os.path.join(tempfile.gettempdir(), f"afiliadohub-sketch-slot-{slot}.lock")
+            f = open(path, "a")
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                f.close()
+                continue
+            self._slot_file = f
+            return f"{hostname}:{slot}"
+
+        return f"{hostname}:{os.getpid()}"
+
+    async def start(self, interval: float = SKETCH_FLUSH_INTERVAL):
+        """Sobe o laço de flush deste processo"""
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop(interval))
+
+    async def stop(self):
+        """Para o laço e grava os eventos ainda em memória"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+
+    async def _flush_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            written = await self.flush()
+            if written:
+                logger.info(f"[OK] {written} sketches de métricas gravados")
+
+    def record(
+        self,
+        stat_type: str,
+        product_id: Any,
+        store: Optional[str] = None,
+        user_id: Optional[Any] = None,
+        increment: int = 1
+    ):
+        """Registra um evento (envio, clique, visualização)"""
+        day = datetime.now().strftime("%Y-%m-%d")
+        store = store or ""
+
+        self._sketch(day, store, distinct_products_metric(stat_type), HyperLogLog).add(product_id)
+        self._sketch(day, store, top_products_metric(stat_type), TopK).add(product_id, increment)
+
+        if user_id is not None:
+            self._sketch(day, store, UNIQUE_USERS, HyperLogLog).add(user_id)
+
+    def _sketch(self, day: str, store: str, metric: str, factory):
+        key = (day, store, metric)
+        if key not in self._pending:
+            self._pending[key] = factory()
+        return self._pending[key]
+
+    async def flush(self) -> int:
+        """Mescla os sketches pendentes com os do banco"""
+        if not self._pending:
+            return 0
+
+        from .supabase_client import get_supabase_manager
+
+        pending, self._pending = self._pending, {}
+        supabase = get_supabase_manager()
+
+        # Sem await entre a leitura e o upsert: no mesmo processo os flushes
+        # não se intercalam, e nenhum outro nó escreve nas linhas deste
+        try:
+            days = sorted({day for day, _, _ in pending})
+            response = supabase.client.table("metric_sketches")\
+                .select("day, store, metric, payload")\
+                .eq("node", self.node_id)\
+                .in_("day", days)\
+                .execute()
+
+            stored = {
+                (row["day"], row["store"], row["metric"]): row["payload"]
+                for row in response.data or []
+            }
+
+            now = datetime.now(timezone.utc).isoformat()
+            rows = []
+            for (day, store, metric), sketch in pending.items():
+                # Mescla em cima do gravado: o pendente fica intacto para nova tentativa
+                payload = stored.get((day, store, metric))
+                merged = sketch_from_dict(payload).merge(sketch) if payload else sketch
+
+                rows.append({
+                    "day": day,
+                    "store": store,
+                    "metric": metric,
+                    "node": self.node_id,
+                    "payload": merged.to_dict(),
+                    "updated_at": now
+                })
+
+            supabase.client.table("metric_sketches")\
+                .upsert(rows, on_conflict="day,store,metric,node")\
+                .execute()
+
+        except Exception as e:
+            # Devolve os eventos para a próxima tentativa
+            for key, sketch in pending.items():
+                if key in self._pending:
+                    sketch.merge(self._pending[key])
+                self._pending[key] = sketch
+            logger.error(f"[ERRO] Erro ao gravar sketches: {e}")
+            return 0
+
+        try:
+            compacted = self._compact_idle_rows(supabase.client)
+            if compacted:
+                logger.info(f"🗜️ {compacted} linhas de sketches de nós inativos compactadas")
+        except Exception as e:
+            logger.warning(f"Falha ao compactar sketches: {e}")
+
+        return len(rows)
+
+    def _compact_idle_rows(self, client) -> int:
+        """
+        Mescla um lote de linhas paradas (dias anteriores, sem escrita há
+        SKETCH_COMPACT_AFTER_HOURS) na linha node='' de cada dia/loja/métrica
+        e as apaga. A função compact_metric_sketches só aplica se nenhuma das
+        linhas lidas mudou: dois processos compactando juntos não somam em dobro.
+        """
+        today = datetime.now().strftime("%Y-%m-%d")
+        idle_before = datetime.now(timezone.utc) - timedelta(hours=SKETCH_COMPACT_AFTER_HOURS)
+
+        idle = client.table("metric_sketches")\
+            .select("day, store, metric, node, payload, updated_at")\
+            .neq("node", "")\
+            .lt("day", today)\
+            .lt("updated_at", idle_before.isoformat())\
+            .order("updated_at")\
+            .limit(SKETCH_COMPACT_BATCH)\
+            .execute().data or []
+        if not idle:
+            return 0
+
+        groups = defaultdict(list)
+        for row in idle:
+            groups[(row["day"], row["store"], row["metric"])].append(row)
+
+        response = client.table("metric_sketches")\
+            .select("day, store, metric, payload, updated_at")\
+            .eq("node", "")\
+            .in_("day", sorted({day for day, _, _ in groups}))\
+            .in_("metric", sorted({metric for _, _, metric in groups}))\
+            .execute()
+        targets = {(row["day"], row["store"], row["metric"]): row for row in response.data or []}
+
+        merged = []
+        for (day, store, metric), rows in groups.items():
+            target = targets.get((day, store, metric))
+            sketch = sketch_from_dict(target["payload"]) if target else None
+            for row in rows:
+                other = sketch_from_dict(row["payload"])
+                sketch = other if sketch is None else sketch.merge(other)
+
+            merged.append({
+                "day": day,
+                "store": store,
+                "metric": metric,
+                "payload": sketch.to_dict(),
+                "updated_at": target["updated_at"] if target else None
+            })
+
+        consumed = [
+            {key: row[key] for key in ("day", "store", "metric", "node", "updated_at")}
+            for row in idle
+        ]
+        applied = client.rpc("compact_metric_sketches", {"p_merged": merged, "p_consumed": consumed}).execute()
+        return len(consumed) if applied.data else 0
+
+
+# Instância global (eventos do processo atual)
+sketch_recorder = SketchRecorder()
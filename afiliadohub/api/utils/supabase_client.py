@@ -190,8 +190,19 @@ class SupabaseManager:
     
     # ==================== MÉTODOS PARA ESTATÍSTICAS ====================
     
-    async def increment_product_stats(self, product_id: int, stat_type: str = "click_count", increment: int = 1) -> bool:
+    async def increment_product_stats(
+        self,
+        product_id: int,
+        stat_type: str = "click_count",
+        increment: int = 1,
+        store: Optional[str] = None,
+        user_id: Optional[Any] = None
+    ) -> bool:
         """Incrementa estatísticas de um produto"""
+        # Sketches de alcance/top-K (apenas memória, gravados pelo Scheduler)
+        from .sketches import sketch_recorder
+        sketch_recorder.record(stat_type, product_id, store=store, user_id=user_id, increment=increment)
+        
         try:
             # Usa RPC para incremento atômico
             response = self.client.rpc(
@@ -234,19 +245,13 @@ class SupabaseManager:
     # ==================== MÉTODOS UTILITÁRIOS ====================
     
     async def cleanup_old_products(self, days_old: int = 30):
-        """Remove produtos inativos antigos"""
+        """Remove produtos inativos antigos (em lotes, ver handlers/product_archival.py)"""
         try:
-            cutoff_date = (datetime.now() - timedelta(days=days_old)).isoformat()
-            
-            response = self.client.table("products")\
-                .delete()\
-                .lt("updated_at", cutoff_date)\
-                .eq("is_active", False)\
-                .execute()
+            from ..handlers.product_archival import archive_old_products
             
-            deleted_count = len(response.data) if response.data else 0
-            print(f"🧹 {deleted_count} produtos antigos removidos")
-            return deleted_count
+            result = await archive_old_products(days_old=days_old)
+            print(f"🧹 {result['deleted']} produtos antigos removidos")
+            return result["deleted"]
             
         except Exception as e:
             print(f"[ERRO] Erro ao limpar produtos antigos: {e}")
@@ -4,11 +4,14 @@ Script de backup automático para o AfiliadoHub
 """
 import os
 import json
-import csv
 import gzip
-from datetime import datetime, timedelta
+import hashlib
+import itertools
+import tarfile
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 import sys
+import time
 import asyncio
 
 # Adiciona o diretório raiz ao path
@@ -17,268 +20,804 @@ sys.path.append(str(Path(__file__).parent.parent))
 
 try:
     from api.utils.supabase_client import get_supabase_manager
+    from api.utils.pagination import keyset_paginate
+    from api.utils.chunk_store import ChunkStore, ChunkWriter, DEFAULT_CHUNK_ROWS
 except ImportError:
     # Try alternate path if running from root
     from afiliadohub.api.utils.supabase_client import get_supabase_manager
+    from afiliadohub.api.utils.pagination import keyset_paginate
+    from afiliadohub.api.utils.chunk_store import ChunkStore, ChunkWriter, DEFAULT_CHUNK_ROWS
+
+# Tabelas do backup completo e a chave usada na paginação (keyset)
+BACKUP_TABLES = {
+    "products": "id",
+    "product_stats": "product_id",
+    "product_logs": "id",
+    "commissions": "id",
+    "settings": "key",
+    "import_logs": "id"
+}
+
+# Coluna que indica alteração, usada pelos backups incrementais (watermark)
+INCREMENTAL_COLUMNS = {
+    "products": "updated_at",
+    "product_stats": "updated_at",
+    "product_logs": "created_at",
+    "commissions": "updated_at",
+    "settings": "updated_at",
+    "import_logs": "timestamp"
+}
+
+# Remoções registradas por trigger (sql/migration_v3_incremental_backup.sql)
+TOMBSTONES_TABLE = "backup_tombstones"
+WATERMARK_SETTING_KEY = "backup_watermarks"
+
+# Margem para transações que gravam um updated_at antigo e só comitam depois
+WATERMARK_LAG_SECONDS = int(os.getenv("BACKUP_WATERMARK_LAG", "120"))
+
+# chunks: NDJSON zstd endereçado por conteúdo + manifesto (chunks iguais são
+# compartilhados entre backups); tar: um .tar com <tabela>.ndjson.gz
+BACKUP_STORAGE = os.getenv("BACKUP_STORAGE", "chunks")
+MANIFEST_SUFFIX = ".manifest.json"
+CHUNK_GC_GRACE_SECONDS = int(os.getenv("BACKUP_CHUNK_GC_GRACE", "3600"))
+
+DEFAULT_BACKUP_WORKERS = int(os.getenv("BACKUP_WORKERS", "3"))
+DEFAULT_BACKUP_PAGE_SIZE = int(os.getenv("BACKUP_PAGE_SIZE", "1000"))
+DEFAULT_RESTORE_WORKERS = int(os.getenv("RESTORE_WORKERS", "4"))
+DEFAULT_RESTORE_BATCH_SIZE = int(os.getenv("RESTORE_BATCH_SIZE", "500"))
+
+# Fora do checksum da restauração: o upsert de uma linha existente dispara
+# touch_updated_at, que troca o valor restaurado por NOW()
+CHECKSUM_IGNORED_COLUMNS = {"updated_at"}
 
 
 class BackupManager:
-    def __init__(self):
+    def __init__(self, storage: str = BACKUP_STORAGE, chunk_rows: int = DEFAULT_CHUNK_ROWS):
         self.backup_dir = Path("backups")
         self.backup_dir.mkdir(exist_ok=True)
         self.supabase = get_supabase_manager()
+        self.storage = storage
+        self.chunk_rows = chunk_rows
+        self._chunks = None
     
-    async def create_full_backup(self):
-        """Cria backup completo do banco"""
+    @property
+    def chunks(self) -> ChunkStore:
+        # Criado sob demanda: backups em tar não exigem zstandard
+        if self._chunks is None:
+            self._chunks = ChunkStore(self.backup_dir / "chunks")
+        return self._chunks
+    
+    async def create_full_backup(self, workers: int = DEFAULT_BACKUP_WORKERS, page_size: int = DEFAULT_BACKUP_PAGE_SIZE):
+        """
+        Cria backup completo do banco
+        
+        Cada tabela é lida página a página (keyset na chave) e gravada como
+        NDJSON compacto, em chunks zstd compartilhados entre backups ou num
+        arquivo gzip (BACKUP_STORAGE=tar); `workers` tabelas são exportadas
+        em paralelo. O total de linhas é conferido com count="exact" sobre
+        o intervalo de chaves exportado.
+        """
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         backup_name = f"backup_full_{timestamp}"
-        backup_path = self.backup_dir / backup_name
-        backup_path.mkdir(exist_ok=True)
+        backup_path = self._staging_dir(backup_name)
         
-        print(f"💾 Criando backup completo: {backup_name}")
+        print(f"💾 Criando backup completo: {backup_name} ({workers} tabelas em paralelo)")
         
-        # Tabelas para backup
-        tables = [
-            "products", "product_stats", "product_logs",
-            "commissions", "settings", "import_logs"
-        ]
+        # Tudo alterado depois deste instante fica para o próximo incremental
+        upper_bound = self._watermark_upper_bound()
         
-        backup_data = {}
+        semaphore = asyncio.Semaphore(max(1, workers))
         
-        for table in tables:
-            try:
+        async def export(table: str, key: str):
+            async with semaphore:
                 print(f"  📋 Exportando {table}...")
-                
-                # Busca todos os dados da tabela
-                response = self.supabase.client.table(table).select("*").execute()
-                
-                if response.data:
-                    # Salva como JSON
-                    json_file = backup_path / f"{table}.json"
-                    with open(json_file, 'w', encoding='utf-8') as f:
-                        json.dump(response.data, f, ensure_ascii=False, indent=2)
-                    
-                    # Salva como CSV
-                    csv_file = backup_path / f"{table}.csv"
-                    with open(csv_file, 'w', newline='', encoding='utf-8') as f:
-                        writer = csv.DictWriter(f, fieldnames=response.data[0].keys())
-                        writer.writeheader()
-                        writer.writerows(response.data)
-                    
-                    backup_data[table] = {
-                        "rows": len(response.data),
-                        "json_size": json_file.stat().st_size,
-                        "csv_size": csv_file.stat().st_size
-                    }
-                    
-                    print(f"    ✅ {table}: {len(response.data)} registros")
-                else:
-                    print(f"    📭 {table}: vazia")
-                    
-            except Exception as e:
-                print(f"    ❌ Erro em {table}: {e}")
+                try:
+                    return table, await asyncio.to_thread(self._export_table, table, key, backup_path, page_size)
+                except Exception as e:
+                    print(f"    ❌ Erro em {table}: {e}")
+                    return table, {"error": str(e)}
+        
+        results = await asyncio.gather(*(export(table, key) for table, key in BACKUP_TABLES.items()))
+        backup_data = {table: info for table, info in results if "error" not in info}
+        errors = {table: info["error"] for table, info in results if "error" in info}
+        
+        for table, info in backup_data.items():
+            status = "✅" if info["verified"] else "⚠️"
+            print(f"    {status} {table}: {info['rows']} registros (esperado {info['expected_rows']})")
         
         # Cria arquivo de metadados
         metadata = {
             "backup_type": "full",
+            "format": self._format,
             "timestamp": timestamp,
+            "parent": None,
+            "base": backup_name,
+            "upper_bound": upper_bound,
             "tables": backup_data,
+            "errors": errors,
             "total_rows": sum(data["rows"] for data in backup_data.values()),
-            "version": "1.0.0",
+            "verified": not errors and all(data["verified"] for data in backup_data.values()),
+            "stored_size": sum(data["stored_size"] for data in backup_data.values()),
+            "version": "2.0.0",
             "created_by": "AfiliadoHub Backup Manager"
         }
         
-        metadata_file = backup_path / "metadata.json"
-        with open(metadata_file, 'w') as f:
+        archive_path = self._store_backup(backup_name, backup_path, metadata)
+        
+        # Base de uma nova cadeia de incrementais (só se todas as tabelas saíram)
+        if not errors:
+            self._save_watermarks({
+                "backup": backup_name,
+                "base": backup_name,
+                "tables": {
+                    table: {"ts": upper_bound, "key": None}
+                    for table in [*BACKUP_TABLES, TOMBSTONES_TABLE]
+                }
+            })
+            self._prune_tombstones(upper_bound)
+        
+        print(f"✅ Backup criado: {archive_path}")
+        print(f"📊 Estatísticas: {metadata['total_rows']} registros em {len(backup_data)} tabelas")
+        print(f"💽 Gravados: {metadata['stored_size'] / (1024 * 1024):.2f} MB novos")
+        if not metadata["verified"]:
+            print("⚠️  Contagens divergentes ou tabelas com erro; veja metadata.json")
+        
+        return archive_path
+    
+    def _export_table(self, table: str, key: str, backup_path: Path, page_size: int) -> dict:
+        """Grava a tabela sem manter as linhas em memória"""
+        started = time.monotonic()
+        
+        info, last_row = self._write_pages(
+            table, key,
+            keyset_paginate(lambda: self._select(table), key=key, page_size=page_size),
+            backup_path
+        )
+        
+        expected = self._count_rows(table, key, last_row[key]) if last_row else self._count_rows(table, key)
+        
+        info.update({
+            "expected_rows": expected,
+            "verified": info["rows"] == expected,
+            "seconds": round(time.monotonic() - started, 2)
+        })
+        return info
+    
+    def _write_pages(self, table: str, key: str, pages, backup_path: Path):
+        """
+        Grava as páginas como NDJSON: em chunks do ChunkStore ou em
+        <table>.ndjson.gz. Retorna (info para o metadata, última linha).
+        """
+        rows = 0
+        last_row = None
+        
+        if self.storage == "chunks":
+            writer = ChunkWriter(self.chunks, key, self.chunk_rows)
+            for page in pages:
+                writer.add(page)
+                rows += len(page)
+                last_row = page[-1]
+            chunks = writer.close()
+            
+            return {
+                "key": key,
+                "rows": rows,
+                "chunks": [{"hash": c["hash"], "rows": c["rows"], "size": c["size"]} for c in chunks],
+                "new_chunks": sum(1 for c in chunks if c["new"]),
+                "size": sum(c["size"] for c in chunks),
+                "stored_size": sum(c["size"] for c in chunks if c["new"])
+            }, last_row
+        
+        file_path = backup_path / f"{table}.ndjson.gz"
+        with gzip.open(file_path, "wt", encoding="utf-8", compresslevel=6) as f:
+            for page in pages:
+                f.write("".join(
+                    json.dumps(row, ensure_ascii=False, separators=(",", ":"), default=str) + "\n"
+                    for row in page
+                ))
+                rows += len(page)
+                last_row = page[-1]
+        
+        size = file_path.stat().st_size
+        return {"file": file_path.name, "key": key, "rows": rows, "size": size, "stored_size": size}, last_row
+    
+    @property
+    def _format(self) -> str:
+        return "chunks.zst" if self.storage == "chunks" else "ndjson.gz"
+    
+    def _staging_dir(self, backup_name: str):
+        """Diretório dos arquivos do backup em tar (chunks vão direto para o ChunkStore)"""
+        if self.storage == "chunks":
+            return None
+        backup_path = self.backup_dir / backup_name
+        backup_path.mkdir(exist_ok=True)
+        return backup_path
+    
+    def _store_backup(self, backup_name: str, backup_path, metadata: dict) -> Path:
+        """Grava o manifesto (chunks) ou empacota o diretório com metadata.json (tar)"""
+        if self.storage == "chunks":
+            manifest_path = self.backup_dir / f"{backup_name}{MANIFEST_SUFFIX}"
+            tmp_path = manifest_path.with_suffix(".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(metadata, f, indent=2)
+            os.replace(tmp_path, manifest_path)
+            return manifest_path
+        
+        with open(backup_path / "metadata.json", 'w') as f:
             json.dump(metadata, f, indent=2)
         
-        # Compacta backup
-        archive_path = self._compress_backup(backup_path)
+        # Empacota (os arquivos já estão comprimidos)
+        archive_path = self._compress_backup(backup_path, compress=False)
         
-        # Remove diretório temporário
         import shutil
         shutil.rmtree(backup_path)
-        
-        print(f"✅ Backup criado: {archive_path}")
-        print(f"📊 Estatísticas: {metadata['total_rows']} registros em {len(tables)} tabelas")
-        
         return archive_path
     
-    async def create_incremental_backup(self, days: int = 1):
-        """Cria backup incremental dos últimos dias"""
+    def _select(self, table: str, columns: str = "*", count=None):
+        query = self.supabase.client.table(table).select(columns, count=count)
+        # O estado dos incrementais não entra no backup (mudaria a cada execução)
+        if table == "settings":
+            query = query.neq("key", WATERMARK_SETTING_KEY)
+        return query
+    
+    def _count_rows(self, table: str, key: str, up_to=None) -> int:
+        """count="exact" até a última chave exportada (linhas novas depois dela não contam)"""
+        query = self._select(table, key, count="exact")
+        if up_to is not None:
+            query = query.lte(key, up_to)
+        response = query.limit(1).execute()
+        return response.count or 0
+    
+    async def create_incremental_backup(self, workers: int = DEFAULT_BACKUP_WORKERS, page_size: int = DEFAULT_BACKUP_PAGE_SIZE):
+        """
+        Cria backup incremental: exatamente as linhas alteradas desde o
+        backup anterior da cadeia (watermark (coluna de alteração, chave)
+        por tabela) e as remoções registradas em backup_tombstones.
+        Sem backup anterior disponível, cria um completo.
+        """
+        state = self._load_watermarks()
+        parent = state.get("backup")
+        if not parent or self._find_archive(parent) is None:
+            print("⚠️  Nenhum backup anterior na cadeia; criando backup completo")
+            return await self.create_full_backup(workers, page_size)
+        
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         backup_name = f"backup_incremental_{timestamp}"
-        backup_path = self.backup_dir / backup_name
-        backup_path.mkdir(exist_ok=True)
+        backup_path = self._staging_dir(backup_name)
         
-        cutoff_date = (datetime.now() - timedelta(days=days)).isoformat()
+        upper_bound = self._watermark_upper_bound()
+        print(f"🔄 Criando backup incremental: {backup_name} (desde {parent})")
         
-        print(f"🔄 Criando backup incremental (últimos {days} dias)...")
+        sources = {table: (key, INCREMENTAL_COLUMNS[table]) for table, key in BACKUP_TABLES.items()}
+        sources[TOMBSTONES_TABLE] = ("id", "deleted_at")
+        semaphore = asyncio.Semaphore(max(1, workers))
         
-        # Backup apenas de produtos recentes
-        try:
-            response = self.supabase.client.table("products")\
-                .select("*")\
-                .gte("created_at", cutoff_date)\
-                .execute()
-            
-            if response.data:
-                products_file = backup_path / "products_recent.json"
-                with open(products_file, 'w', encoding='utf-8') as f:
-                    json.dump(response.data, f, ensure_ascii=False, indent=2)
-                
-                print(f"  ✅ Produtos recentes: {len(response.data)} registros")
-            else:
-                print("  📭 Nenhum produto recente")
-                
-        except Exception as e:
-            print(f"  ❌ Erro ao buscar produtos recentes: {e}")
+        async def export(table: str, key: str, column: str):
+            async with semaphore:
+                since = state.get("tables", {}).get(table) or {}
+                try:
+                    return table, await asyncio.to_thread(
+                        self._export_changes, table, key, column, since, upper_bound, backup_path, page_size
+                    )
+                except Exception as e:
+                    print(f"    ❌ Erro em {table}: {e}")
+                    return table, {"error": str(e)}
+        
+        results = await asyncio.gather(*(export(table, key, column) for table, (key, column) in sources.items()))
+        backup_data = {table: info for table, info in results if "error" not in info}
+        errors = {table: info["error"] for table, info in results if "error" in info}
         
-        # Backup de estatísticas recentes
+        changed_rows = sum(info["rows"] for table, info in backup_data.items() if table != TOMBSTONES_TABLE)
+        deleted_rows = backup_data.get(TOMBSTONES_TABLE, {}).get("rows", 0)
+        
+        if not changed_rows and not deleted_rows and not errors:
+            if backup_path:
+                import shutil
+                shutil.rmtree(backup_path)
+            print("📭 Nenhuma alteração desde o último backup")
+            return None
+        
+        for table, info in backup_data.items():
+            if info["rows"]:
+                print(f"  ✅ {table}: {info['rows']} registros")
+        
+        metadata = {
+            "backup_type": "incremental",
+            "format": self._format,
+            "timestamp": timestamp,
+            "parent": parent,
+            "base": state.get("base"),
+            "upper_bound": upper_bound,
+            "tables": backup_data,
+            "errors": errors,
+            "total_rows": changed_rows,
+            "deleted_rows": deleted_rows,
+            "stored_size": sum(info["stored_size"] for info in backup_data.values()),
+            "version": "2.1.0",
+            "created_by": "AfiliadoHub Backup Manager"
+        }
+        
+        archive_path = self._store_backup(backup_name, backup_path, metadata)
+        
+        # Tabelas com erro mantêm o watermark antigo e entram no próximo incremental
+        tables = dict(state.get("tables", {}))
+        for table, info in backup_data.items():
+            tables[table] = info["to"]
+        self._save_watermarks({"backup": backup_name, "base": state.get("base"), "tables": tables})
+        
+        print(f"✅ Backup incremental criado: {archive_path}")
+        print(f"📊 {changed_rows} alterações e {deleted_rows} remoções")
+        
+        return archive_path
+    
+    def _export_changes(
+        self,
+        table: str,
+        key: str,
+        column: str,
+        since: dict,
+        upper_bound: str,
+        backup_path: Path,
+        page_size: int
+    ) -> dict:
+        """Grava as linhas com (coluna, chave) > watermark e coluna <= upper_bound"""
+        started = time.monotonic()
+        
+        def query():
+            builder = self._select(table).lte(column, upper_bound)
+            # Watermark só com instante (vindo de um backup completo): estritamente depois dele
+            if since.get("ts") and since.get("key") is None:
+                builder = builder.gt(column, since["ts"])
+            return builder
+        
+        start_after = (since["ts"], since["key"]) if since.get("ts") and since.get("key") is not None else None
+        
+        info, last_row = self._write_pages(
+            table, key,
+            keyset_paginate(query, key=key, order_column=column, page_size=page_size, start_after=start_after),
+            backup_path
+        )
+        
+        info.update({
+            "column": column,
+            "from": since or None,
+            "to": {"ts": last_row[column], "key": last_row[key]} if last_row else {"ts": since.get("ts"), "key": since.get("key")},
+            "seconds": round(time.monotonic() - started, 2)
+        })
+        return info
+    
+    @staticmethod
+    def _watermark_upper_bound() -> str:
+        return (datetime.now(timezone.utc) - timedelta(seconds=WATERMARK_LAG_SECONDS)).isoformat()
+    
+    def _load_watermarks(self) -> dict:
+        response = self.supabase.client.table("settings")\
+            .select("value")\
+            .eq("key", WATERMARK_SETTING_KEY)\
+            .execute()
+        
+        rows = response.data or []
+        value = rows[0]["value"] if rows else {}
+        return json.loads(value) if isinstance(value, str) else dict(value or {})
+    
+    def _save_watermarks(self, state: dict):
+        self.supabase.client.table("settings").upsert({
+            "key": WATERMARK_SETTING_KEY,
+            "value": state,
+            "description": "Watermarks dos backups incrementais",
+            "updated_at": datetime.now().isoformat()
+        }).execute()
+    
+    def _prune_tombstones(self, before: str):
+        """Remoções anteriores ao último backup completo não são mais necessárias"""
         try:
-            response = self.supabase.client.table("product_stats")\
-                .select("*")\
-                .gte("last_sent", cutoff_date)\
+            self.supabase.client.table(TOMBSTONES_TABLE)\
+                .delete(returning="minimal")\
+                .lt("deleted_at", before)\
                 .execute()
-            
-            if response.data:
-                stats_file = backup_path / "stats_recent.json"
-                with open(stats_file, 'w', encoding='utf-8') as f:
-                    json.dump(response.data, f, ensure_ascii=False, indent=2)
-                
-                print(f"  ✅ Estatísticas recentes: {len(response.data)} registros")
-                
         except Exception as e:
-            print(f"  ❌ Erro ao buscar estatísticas: {e}")
-        
-        # Compacta backup
-        if any(backup_path.iterdir()):
-            archive_path = self._compress_backup(backup_path)
-            print(f"✅ Backup incremental criado: {archive_path}")
-            
-            # Remove diretório temporário
-            import shutil
-            shutil.rmtree(backup_path)
-            
-            return archive_path
-        else:
-            print("📭 Nenhum dado para backup incremental")
-            shutil.rmtree(backup_path)
-            return None
+            print(f"  ⚠️  Não foi possível limpar {TOMBSTONES_TABLE}: {e}")
     
-    def _compress_backup(self, backup_path: Path) -> Path:
-        """Compacta o diretório de backup"""
+    def _compress_backup(self, backup_path: Path, compress: bool = True) -> Path:
+        """Compacta o diretório de backup (compress=False só empacota em .tar)"""
         import tarfile
         
-        archive_name = f"{backup_path.name}.tar.gz"
+        archive_name = f"{backup_path.name}.tar.gz" if compress else f"{backup_path.name}.tar"
         archive_path = self.backup_dir / archive_name
         
-        with tarfile.open(archive_path, "w:gz") as tar:
+        with tarfile.open(archive_path, "w:gz" if compress else "w") as tar:
             tar.add(backup_path, arcname=backup_path.name)
         
         return archive_path
     
+    def _backup_files(self) -> list:
+        return [
+            *self.backup_dir.glob(f"*{MANIFEST_SUFFIX}"),
+            *self.backup_dir.glob("*.tar.gz"),
+            *self.backup_dir.glob("*.tar")
+        ]
+    
     async def list_backups(self):
         """Lista backups disponíveis"""
         backups = []
         
-        for file in self.backup_dir.glob("*.tar.gz"):
+        for file in self._backup_files():
             stat = file.stat()
             
             # Extrai informações do nome
-            name_parts = file.stem.split('_')
+            name_parts = file.name.split('.')[0].split('_')
             backup_type = name_parts[1] if len(name_parts) > 1 else "unknown"
-            timestamp_str = name_parts[2] if len(name_parts) > 2 else ""
+            timestamp_str = "".join(name_parts[2:4])
             
             try:
                 timestamp = datetime.strptime(timestamp_str, "%Y%m%d%H%M%S")
             except:
                 timestamp = datetime.fromtimestamp(stat.st_mtime)
             
+            # Manifesto: só os chunks que este backup gravou (os demais são compartilhados)
+            size = stat.st_size
+            if file.name.endswith(MANIFEST_SUFFIX):
+                size += self._read_metadata(file).get("stored_size", 0)
+            
             backups.append({
                 "name": file.name,
                 "type": backup_type,
-                "size_mb": stat.st_size / (1024 * 1024),
+                "size_mb": size / (1024 * 1024),
                 "created": timestamp,
                 "path": file
             })
         
         return sorted(backups, key=lambda x: x["created"], reverse=True)
     
-    async def restore_backup(self, backup_file: Path, restore_type: str = "all"):
-        """Restaura um backup"""
-        print(f"🔄 Restaurando backup: {backup_file.name}")
-        
-        # Extrai backup
-        extract_dir = self.backup_dir / backup_file.stem
-        import tarfile
-        with tarfile.open(backup_file, "r:gz") as tar:
-            tar.extractall(extract_dir)
-        
-        # Encontra arquivos JSON
-        json_files = list(extract_dir.rglob("*.json"))
+    # ==================== CADEIA COMPLETO + INCREMENTAIS ====================
+    
+    def _find_archive(self, name: str):
+        for suffix in (MANIFEST_SUFFIX, ".tar", ".tar.gz"):
+            path = self.backup_dir / f"{name}{suffix}"
+            if path.exists():
+                return path
+        return None
+    
+    @staticmethod
+    def _read_metadata(archive: Path) -> dict:
+        if archive.name.endswith(MANIFEST_SUFFIX):
+            with open(archive, "r", encoding="utf-8") as f:
+                return json.load(f)
+        
+        name = archive.name.split(".")[0]
+        with tarfile.open(archive, "r:*") as tar:
+            return json.load(tar.extractfile(f"{name}/metadata.json"))
+    
+    @staticmethod
+    def _open_archive(archive: Path):
+        """tarfile aberto; manifestos leem direto do ChunkStore"""
+        if archive.name.endswith(MANIFEST_SUFFIX):
+            import contextlib
+            return contextlib.nullcontext()
+        return tarfile.open(archive, "r:*")
+    
+    def backup_chain(self, backup_file: Path) -> list:
+        """[(arquivo, metadata)] do backup completo até `backup_file`, na ordem de aplicação"""
+        chain = []
+        archive = backup_file
+        while True:
+            metadata = self._read_metadata(archive)
+            chain.append((archive, metadata))
+            if metadata.get("backup_type") != "incremental" or "format" not in metadata:
+                break
+            
+            parent = self._find_archive(metadata["parent"])
+            if parent is None:
+                raise FileNotFoundError(f"Backup anterior da cadeia não encontrado: {metadata['parent']}")
+            archive = parent
         
-        restored_tables = 0
-        restored_rows = 0
+        chain.reverse()
+        return chain
+    
+    # ==================== RESTAURAÇÃO ====================
+    
+    async def restore_backup(
+        self,
+        backup_file: Path,
+        tables: list = None,
+        workers: int = DEFAULT_RESTORE_WORKERS,
+        batch_size: int = DEFAULT_RESTORE_BATCH_SIZE,
+        fresh: bool = False,
+        verify: bool = True
+    ):
+        """
+        Restaura o estado de `backup_file` sem apagar nada antes.
+        
+        As linhas saem do arquivo em streaming e entram por upsert na chave
+        da tabela, com até `workers` lotes em paralelo. Em uma cadeia, o
+        backup completo é aplicado primeiro e cada incremental reaplica as
+        remoções (backup_tombstones) e as linhas alteradas. O progresso fica
+        em <backup>.restore.json: uma restauração interrompida continua do
+        último lote confirmado (fresh=True ignora o checkpoint). No fim,
+        contagens e checksums por tabela são conferidos contra o banco.
+        """
+        metadata = self._read_metadata(backup_file)
+        chain = self.backup_chain(backup_file) if "format" in metadata else [(backup_file, metadata)]
+        
+        checkpoint_path = self.backup_dir / f"{backup_file.name.split('.')[0]}.restore.json"
+        checkpoint = {} if fresh else self._load_restore_checkpoint(checkpoint_path)
+        if checkpoint:
+            print(f"♻️  Retomando restauração ({checkpoint_path.name})")
+        checkpoint.setdefault("archives", {})
+        checkpoint.setdefault("started_at", datetime.now().isoformat())
+        save = lambda: self._save_restore_checkpoint(checkpoint_path, checkpoint)
+        
+        print(f"🔄 Restaurando {backup_file.name}: cadeia de {len(chain)} backup(s), {workers} lotes em paralelo")
+        
+        # Estado final esperado por tabela: chave -> digest da linha
+        expected = {}
+        columns = {}
+        applied = {}
+        deleted = 0
+        
+        for archive, archive_metadata in chain:
+            name = archive.name.split(".")[0]
+            progress = checkpoint["archives"].setdefault(name, {})
+            print(f"  📦 {name} ({archive_metadata.get('backup_type', 'unknown')})")
+            
+            with self._open_archive(archive) as tar:
+                members = self._restore_members(tar, name, archive_metadata)
+                
+                if TOMBSTONES_TABLE in members:
+                    deleted += self._apply_tombstones(
+                        tar, members.pop(TOMBSTONES_TABLE), tables, expected,
+                        batch_size, apply=not progress.get(TOMBSTONES_TABLE, {}).get("done")
+                    )
+                    progress[TOMBSTONES_TABLE] = {"done": True}
+                    save()
+                
+                for table, member in members.items():
+                    if tables and table not in tables:
+                        continue
+                    
+                    key = BACKUP_TABLES.get(table, "id")
+                    table_progress = progress.setdefault(table, {"rows": 0, "done": False})
+                    rows = await self._restore_table(
+                        tar, member, table, key, table_progress,
+                        expected.setdefault(table, {}), columns.setdefault(table, set()),
+                        workers, batch_size, save
+                    )
+                    applied[table] = applied.get(table, 0) + rows
+                    print(f"    ✅ {table}: {rows} registros aplicados")
+        
+        verification = {}
+        if verify:
+            print("  🔍 Conferindo contagens e checksums...")
+            for table, digests in expected.items():
+                key = BACKUP_TABLES.get(table, "id")
+                verification[table] = await asyncio.to_thread(
+                    self._verify_table, table, key, digests, columns[table]
+                )
+                result = verification[table]
+                icon = "✅" if result["verified"] else "❌"
+                print(
+                    f"    {icon} {table}: {result['matched']}/{result['expected']} iguais"
+                    f" | faltando {result['missing']} | divergentes {result['mismatched']}"
+                    f" | extras no banco {result['extra']}"
+                )
+        
+        verified = all(result["verified"] for result in verification.values())
+        checkpoint_path.unlink(missing_ok=True)
+        
+        print(f"✅ Restauração concluída: {sum(applied.values())} registros aplicados, {deleted} remoções")
+        if verify and not verified:
+            print("⚠️  Banco diverge do backup em alguma tabela; veja a verificação")
         
-        for json_file in json_files:
-            if json_file.name == "metadata.json":
+        return {
+            "backup_file": backup_file.name,
+            "chain": [archive.name for archive, _ in chain],
+            "tables": applied,
+            "deleted": deleted,
+            "verification": verification,
+            "verified": verified if verify else None
+        }
+    
+    @staticmethod
+    def _restore_members(tar, name: str, metadata: dict) -> dict:
+        """tabela -> membro do tar, em ordem de restauração (products antes dos dependentes)"""
+        if "format" in metadata:
+            # Lista de chunks (manifesto) ou membro do tar
+            found = {
+                table: [chunk["hash"] for chunk in info["chunks"]] if "chunks" in info else f"{name}/{info['file']}"
+                for table, info in metadata.get("tables", {}).items()
+            }
+        else:
+            # Formato antigo: <tabela>.json / <tabela>_recent.json
+            found = {
+                Path(member.name).name.split(".")[0].replace("_recent", ""): member.name
+                for member in tar.getmembers()
+                if member.isfile() and member.name.endswith(".json") and not member.name.endswith("metadata.json")
+            }
+        
+        order = [TOMBSTONES_TABLE, *BACKUP_TABLES]
+        return dict(sorted(found.items(), key=lambda item: order.index(item[0]) if item[0] in order else len(order)))
+    
+    async def _restore_table(
+        self,
+        tar,
+        member: str,
+        table: str,
+        key: str,
+        progress: dict,
+        expected: dict,
+        columns: set,
+        workers: int,
+        batch_size: int,
+        save
+    ) -> int:
+        """
+        Upsert do membro em lotes paralelos. `progress["rows"]` só avança
+        até o último lote confirmado sem lacunas antes dele; as linhas já
+        confirmadas são relidas apenas para compor o checksum.
+        """
+        skip = float("inf") if progress["done"] else progress["rows"]
+        semaphore = asyncio.Semaphore(max(1, workers))
+        finished = {}
+        tasks = []
+        applied = 0
+        offset = 0
+        
+        async def upload(start: int, rows: list):
+            try:
+                await asyncio.to_thread(self._upsert_batch, table, key, rows)
+            finally:
+                semaphore.release()
+            
+            finished[start] = start + len(rows)
+            while progress["rows"] in finished:
+                progress["rows"] = finished.pop(progress["rows"])
+            save()
+        
+        for batch in self._read_member_batches(tar, member, batch_size):
+            for row in batch:
+                expected[str(row[key])] = _row_digest(row)
+                columns.update(row)
+            
+            start, offset = offset, offset + len(batch)
+            if offset <= skip:
                 continue
             
-            table_name = json_file.stem.replace('_recent', '')
+            pending = batch[max(0, skip - start):]
+            await semaphore.acquire()
+            
+            # Um lote falhou de vez: para de enviar e deixa o checkpoint no último confirmado
+            if any(task.done() and task.exception() for task in tasks):
+                semaphore.release()
+                break
             
-            if restore_type == "all" or table_name in restore_type:
-                print(f"  📋 Restaurando {table_name}...")
+            tasks.append(asyncio.create_task(upload(max(start, skip), pending)))
+            applied += len(pending)
+        
+        # Espera os lotes em andamento antes de propagar uma falha (checkpoint mais adiantado)
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+        
+        progress["done"] = True
+        save()
+        return applied
+    
+    def _upsert_batch(self, table: str, key: str, rows: list, attempts: int = 3):
+        for attempt in range(attempts):
+            try:
+                self.supabase.client.table(table)\
+                    .upsert(rows, on_conflict=key, returning="minimal")\
+                    .execute()
+                return
+            except Exception as e:
+                if attempt == attempts - 1:
+                    raise
+                print(f"    ⚠️  {table}: lote falhou ({e}), tentando de novo")
+                time.sleep(2 ** attempt)
+    
+    def _apply_tombstones(self, tar, member: str, tables: list, expected: dict, batch_size: int, apply: bool = True) -> int:
+        deleted = 0
+        for batch in self._read_member_batches(tar, member, batch_size):
+            by_table = {}
+            for tombstone in batch:
+                table = tombstone["table_name"]
+                if table in BACKUP_TABLES and (not tables or table in tables):
+                    by_table.setdefault(table, []).append(tombstone["row_key"])
+                    expected.get(table, {}).pop(str(tombstone["row_key"]), None)
+            
+            for table, keys in by_table.items():
+                if apply:
+                    for i in range(0, len(keys), 200):
+                        self.supabase.client.table(table)\
+                            .delete(returning="minimal")\
+                            .in_(BACKUP_TABLES[table], keys[i:i + 200])\
+                            .execute()
+                deleted += len(keys)
+        return deleted
+    
+    def _verify_table(self, table: str, key: str, expected: dict, columns: set) -> dict:
+        """Compara cada linha do banco com o digest esperado (só as colunas presentes no backup)"""
+        seen = set()
+        mismatched = 0
+        extra = 0
+        db_checksum = 0
+        
+        for page in keyset_paginate(lambda: self.supabase.client.table(table).select("*"), key=key):
+            for row in page:
+                row_key = str(row[key])
+                if row_key not in expected:
+                    extra += 1
+                    continue
                 
-                try:
-                    with open(json_file, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                    
-                    if data:
-                        # Remove dados existentes se for backup completo
-                        if "_recent" not in json_file.stem:
-                            self.supabase.client.table(table_name).delete().neq("id", 0).execute()
-                        
-                        # Insere em lotes
-                        batch_size = 1000
-                        for i in range(0, len(data), batch_size):
-                            batch = data[i:i + batch_size]
-                            self.supabase.client.table(table_name).insert(batch).execute()
-                        
-                        restored_tables += 1
-                        restored_rows += len(data)
-                        
-                        print(f"    ✅ {table_name}: {len(data)} registros")
-                        
-                except Exception as e:
-                    print(f"    ❌ Erro ao restaurar {table_name}: {e}")
-        
-        # Limpa diretório extraído
-        import shutil
-        shutil.rmtree(extract_dir)
+                seen.add(row_key)
+                digest = _row_digest({column: row.get(column) for column in columns})
+                db_checksum = (db_checksum + digest) % 2 ** 64
+                if digest != expected[row_key]:
+                    mismatched += 1
         
-        print(f"✅ Restauração concluída: {restored_rows} registros em {restored_tables} tabelas")
+        missing = len(expected) - len(seen)
+        checksum = sum(expected.values()) % 2 ** 64
         
         return {
-            "tables": restored_tables,
-            "rows": restored_rows,
-            "backup_file": backup_file.name
+            "expected": len(expected),
+            "matched": len(seen) - mismatched,
+            "missing": missing,
+            "mismatched": mismatched,
+            "extra": extra,
+            "checksum": f"{checksum:016x}",
+            "db_checksum": f"{db_checksum:016x}",
+            "verified": not missing and not mismatched
         }
     
+    @staticmethod
+    def _load_restore_checkpoint(path: Path) -> dict:
+        if not path.exists():
+            return {}
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    
+    @staticmethod
+    def _save_restore_checkpoint(path: Path, checkpoint: dict):
+        # Escreve ao lado e troca: um checkpoint pela metade nunca é lido
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_path, path)
+    
+    def _read_member_batches(self, tar, member, batch_size: int):
+        if isinstance(member, list):
+            rows = self.chunks.iter_rows(member)
+            while True:
+                batch = list(itertools.islice(rows, batch_size))
+                if not batch:
+                    return
+                yield batch
+        
+        if member.endswith(".json"):
+            data = json.load(tar.extractfile(member))
+            for i in range(0, len(data), batch_size):
+                yield data[i:i + batch_size]
+            return
+        
+        with gzip.open(tar.extractfile(member), "rt", encoding="utf-8") as f:
+            yield from _batched_lines(f, batch_size)
+    
     async def cleanup_old_backups(self, keep_last: int = 10, max_age_days: int = 30):
-        """Remove backups antigos"""
+        """Remove backups antigos e os chunks que nenhum backup restante usa"""
         backups = await self.list_backups()
         
         if len(backups) <= keep_last:
             print(f"📭 Apenas {len(backups)} backups, mantendo todos")
-            return 0
-        
-        # Filtra backups antigos
-        cutoff_date = datetime.now() - timedelta(days=max_age_days)
-        old_backups = [
-            b for b in backups[keep_last:]
-            if b["created"] < cutoff_date
-        ]
+            old_backups = []
+        else:
+            # Filtra backups antigos (mantém os que a cadeia incremental atual ainda usa)
+            cutoff_date = datetime.now() - timedelta(days=max_age_days)
+            in_chain = await asyncio.to_thread(self._current_chain_names)
+            old_backups = [
+                b for b in backups[keep_last:]
+                if b["created"] < cutoff_date and b["name"].split(".")[0] not in in_chain
+            ]
         
         # Remove backups
         removed_count = 0
@@ -290,8 +829,51 @@ class BackupManager:
             except Exception as e:
                 print(f"  ❌ Erro ao remover {backup['name']}: {e}")
         
-        print(f"✅ {removed_count} backups antigos removidos")
+        if (self.backup_dir / "chunks").exists():
+            collected = await asyncio.to_thread(self._collect_chunks)
+            print(f"  🧹 {collected['removed']} chunks sem referência ({collected['bytes'] / (1024 * 1024):.2f} MB)")
+        
+        if old_backups:
+            print(f"✅ {removed_count} backups antigos removidos")
         return removed_count
+    
+    def _collect_chunks(self) -> dict:
+        """GC do ChunkStore: referências = chunks de todos os manifestos restantes"""
+        referenced = set()
+        for manifest in self.backup_dir.glob(f"*{MANIFEST_SUFFIX}"):
+            for info in self._read_metadata(manifest).get("tables", {}).values():
+                referenced.update(chunk["hash"] for chunk in info.get("chunks", []))
+        return self.chunks.gc(referenced, CHUNK_GC_GRACE_SECONDS)
+    
+    def _current_chain_names(self) -> set:
+        try:
+            latest = self._find_archive(self._load_watermarks().get("backup", ""))
+            return {archive.name.split(".")[0] for archive, _ in self.backup_chain(latest)} if latest else set()
+        except Exception as e:
+            print(f"  ⚠️  Cadeia incremental indisponível: {e}")
+            return set()
+
+
+def _row_digest(row: dict) -> int:
+    """Hash de 64 bits da linha; somado por tabela, não depende da ordem"""
+    payload = json.dumps(
+        {column: value for column, value in row.items() if column not in CHECKSUM_IGNORED_COLUMNS},
+        sort_keys=True, separators=(",", ":"), default=str
+    )
+    return int.from_bytes(hashlib.blake2b(payload.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def _batched_lines(f, batch_size: int):
+    """Lotes de objetos de um arquivo NDJSON aberto"""
+    batch = []
+    for line in f:
+        if line.strip():
+            batch.append(json.loads(line))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
 async def main():
     """Função principal"""
@@ -303,22 +885,26 @@ async def main():
         choices=["create", "create-incremental", "list", "restore", "cleanup"],
         help="Ação a executar"
     )
-    parser.add_argument("--days", type=int, default=1, help="Dias para backup incremental")
     parser.add_argument("--file", help="Arquivo de backup para restaurar")
     parser.add_argument("--type", choices=["all", "products", "stats"], default="all", 
                        help="Tipo de dados para restaurar")
     parser.add_argument("--keep", type=int, default=10, help="Backups a manter no cleanup")
     parser.add_argument("--max-age", type=int, default=30, help="Idade máxima em dias para cleanup")
+    parser.add_argument("--workers", type=int, help="Tabelas exportadas (ou lotes restaurados) em paralelo")
+    parser.add_argument("--page-size", type=int, default=DEFAULT_BACKUP_PAGE_SIZE, help="Linhas por página na exportação")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_RESTORE_BATCH_SIZE, help="Linhas por lote na restauração")
+    parser.add_argument("--fresh", action="store_true", help="Ignora o checkpoint de uma restauração interrompida")
+    parser.add_argument("--no-verify", action="store_true", help="Não confere contagens e checksums após restaurar")
     
     args = parser.parse_args()
     
     backup_manager = BackupManager()
     
     if args.action == "create":
-        await backup_manager.create_full_backup()
+        await backup_manager.create_full_backup(args.workers or DEFAULT_BACKUP_WORKERS, args.page_size)
     
     elif args.action == "create-incremental":
-        await backup_manager.create_incremental_backup(args.days)
+        await backup_manager.create_incremental_backup(args.workers or DEFAULT_BACKUP_WORKERS, args.page_size)
     
     elif args.action == "list":
         backups = await backup_manager.list_backups()
@@ -346,7 +932,13 @@ async def main():
         # In automation mode, we skip confirmation or assume yes carefully. 
         # For now, keeping logic but commenting out interactive input to avoid blocking, 
         # assuming user runs this manually.
-        await backup_manager.restore_backup(backup_file, args.type)
+        tables = {"all": None, "products": ["products"], "stats": ["product_stats"]}[args.type]
+        result = await backup_manager.restore_backup(
+            backup_file, tables, args.workers or DEFAULT_RESTORE_WORKERS, args.batch_size,
+            fresh=args.fresh, verify=not args.no_verify
+        )
+        if result["verified"] is False:
+            sys.exit(1)
 
     
     elif args.action == "cleanup":
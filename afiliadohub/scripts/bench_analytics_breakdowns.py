@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Benchmark das análises por loja/categoria do AdvancedAnalytics
+
+Compara o laço antigo (uma máscara booleana por loja/categoria) com o
+groupby único memoizado, em um DataFrame sintético.
+
+Uso: python scripts/bench_analytics_breakdowns.py [--rows 500000] [--categories 400]
+"""
+import os
+import sys
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+# O pacote api cria o cliente Supabase ao ser importado; nenhuma consulta é feita aqui
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "benchmark")
+
+from api.handlers.advanced_analytics import AdvancedAnalytics
+
+STORES = ["shopee", "aliexpress", "amazon", "temu", "shein", "magalu", "mercado_livre"]
+
+
+def build_frame(rows: int, categories: int, seed: int = 42) -> pd.DataFrame:
+    """Gera produtos sintéticos já com estatísticas e vendas"""
+    rng = np.random.default_rng(seed)
+
+    return pd.DataFrame({
+        "id": np.arange(rows),
+        "name": "Produto",
+        "store": rng.choice(STORES, rows),
+        "category": rng.choice([f"categoria_{i}" for i in range(categories)], rows),
+        "current_price": rng.uniform(5, 5000, rows).round(2),
+        "discount_percentage": rng.integers(0, 80, rows),
+        "view_count": rng.integers(0, 1000, rows),
+        "click_count": rng.integers(0, 100, rows),
+        "telegram_send_count": rng.integers(0, 10, rows),
+        "sales_count": rng.integers(0, 5, rows),
+        "sale_amount": rng.uniform(0, 500, rows).round(2)
+    })
+
+
+def legacy_breakdowns(df: pd.DataFrame):
+    """Implementação anterior (O(n·k)), mantida aqui apenas para comparação"""
+    by_store = {}
+    for store in df['store'].unique():
+        store_df = df[df['store'] == store]
+        by_store[store] = {
+            "product_count": len(store_df),
+            "avg_price": store_df['current_price'].mean(),
+            "total_views": store_df['view_count'].sum(),
+            "total_clicks": store_df['click_count'].sum(),
+            "total_sales": store_df['sales_count'].sum(),
+            "total_revenue": store_df['sale_amount'].sum(),
+            "click_through_rate": (store_df['click_count'].sum() / store_df['view_count'].sum() * 100) if store_df['view_count'].sum() > 0 else 0
+        }
+
+    by_category = {}
+    for category in df['category'].dropna().unique():
+        cat_df = df[df['category'] == category]
+        by_category[category] = {
+            "product_count": len(cat_df),
+            "avg_price": cat_df['current_price'].mean(),
+            "total_views": cat_df['view_count'].sum(),
+            "total_clicks": cat_df['click_count'].sum(),
+            "avg_discount": cat_df['discount_percentage'].mean()
+        }
+
+    # O gráfico por loja recalculava a análise
+    for store in df['store'].unique():
+        df[df['store'] == store]['sale_amount'].sum()
+
+    return by_store, by_category
+
+
+def vectorized_breakdowns(df: pd.DataFrame):
+    analytics = AdvancedAnalytics()
+    by_store = analytics._analyze_by_store(df)
+    by_category = analytics._analyze_by_category(df)
+    analytics._group_metrics(df, 'store')  # gráfico por loja (memoizado)
+    return by_store, by_category
+
+
+def timed(func, df, repeat: int):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(df)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de análises por loja/categoria")
+    parser.add_argument("--rows", type=int, default=500_000)
+    parser.add_argument("--categories", type=int, default=400)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    df = build_frame(args.rows, args.categories)
+    print(f"📊 {args.rows:,} linhas, {len(STORES)} lojas, {args.categories} categorias")
+
+    legacy_time, (legacy_store, legacy_cat) = timed(legacy_breakdowns, df, args.repeat)
+    new_time, (new_store, new_cat) = timed(vectorized_breakdowns, df, args.repeat)
+
+    # Confere que os resultados batem
+    for expected, got in ((legacy_store, new_store), (legacy_cat, new_cat)):
+        assert set(expected) == set(got), "grupos diferentes"
+        for key, metrics in expected.items():
+            for metric, value in metrics.items():
+                assert np.isclose(value, got[key][metric]), f"{key}.{metric}: {value} != {got[key][metric]}"
+
+    print(f"  Laço por grupo : {legacy_time * 1000:9.1f} ms")
+    print(f"  groupby único  : {new_time * 1000:9.1f} ms")
+    print(f"  Ganho          : {legacy_time / new_time:9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Benchmark do armazenamento de backups: NDJSON gzip em tar x chunks zstd
+
+Simula dois backups completos seguidos (mesmo caminho de escrita do
+BackupManager, sem banco): entre eles uma fração dos produtos muda de
+preço, alguns são removidos e product_logs recebe linhas novas no fim.
+Mede tempo de escrita e bytes gravados em cada backup.
+
+Uso: python scripts/bench_backup_storage.py [--products 200000] [--logs 1000000] [--changed 0.01]
+"""
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+# O pacote api cria o cliente Supabase ao ser importado; nenhuma consulta é feita aqui
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "benchmark")
+
+from backup import BackupManager
+
+STORES = ["shopee", "aliexpress", "amazon", "temu", "shein", "magalu", "mercado_livre"]
+
+
+def make_product(i: int, price_shift: float = 0) -> dict:
+    return {
+        "id": i,
+        "name": f"Produto de teste número {i}",
+        "store": STORES[i % len(STORES)],
+        "category": f"categoria_{i % 40}",
+        "current_price": round(5 + (i * 7.31) % 4995 + price_shift, 2),
+        "original_price": round(10 + (i * 9.17) % 5990, 2),
+        "discount_percentage": i % 80,
+        "affiliate_link": f"https://s.example.com/{i}",
+        "is_active": bool(i % 5),
+        "created_at": f"2026-10-{1 + i % 28:02d}T12:{i % 60:02d}:00+00:00",
+        "updated_at": f"2026-10-{1 + i % 28:02d}T12:{i % 60:02d}:00+00:00"
+    }
+
+
+def make_log(i: int) -> dict:
+    return {
+        "id": i,
+        "product_id": i % 50000,
+        "change_type": "price_change",
+        "old_price": round(10 + (i * 3.7) % 990, 2),
+        "new_price": round(10 + (i * 5.3) % 990, 2),
+        "created_at": f"2026-10-{1 + i % 28:02d}T{i % 24:02d}:{i % 60:02d}:00+00:00"
+    }
+
+
+def pages(rows, page_size: int = 1000):
+    for start in range(0, len(rows), page_size):
+        yield rows[start:start + page_size]
+
+
+def run_backup(manager: BackupManager, tables: dict, name: str):
+    backup_path = manager._staging_dir(name)
+    start = time.perf_counter()
+    stored = 0
+    for table, rows in tables.items():
+        info, _ = manager._write_pages(table, "id", pages(rows), backup_path)
+        stored += info["stored_size"]
+    elapsed = time.perf_counter() - start
+    if backup_path:
+        shutil.rmtree(backup_path)
+    return elapsed, stored
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark tar+gzip x chunks zstd nos backups")
+    parser.add_argument("--products", type=int, default=200_000)
+    parser.add_argument("--logs", type=int, default=1_000_000)
+    parser.add_argument("--changed", type=float, default=0.01, help="fração de produtos alterados entre os backups")
+    parser.add_argument("--new-logs", type=float, default=0.02, help="fração de logs novos entre os backups")
+    parser.add_argument("--chunk-rows", type=int, default=1000)
+    args = parser.parse_args()
+
+    random.seed(42)
+    products = [make_product(i) for i in range(args.products)]
+    logs = [make_log(i) for i in range(args.logs)]
+    day1 = {"products": products, "product_logs": logs}
+
+    changed = set(random.sample(range(args.products), int(args.products * args.changed)))
+    removed = set(random.sample(range(args.products), max(1, args.products // 1000)))
+    day2 = {
+        "products": [make_product(i, 1.0 if i in changed else 0) for i in range(args.products) if i not in removed],
+        "product_logs": logs + [make_log(i) for i in range(args.logs, args.logs + int(args.logs * args.new_logs))]
+    }
+
+    total_rows = sum(len(rows) for rows in day1.values())
+    print(f"📊 {args.products:,} produtos + {args.logs:,} logs ({total_rows:,} linhas)")
+    print(f"   entre backups: {len(changed):,} produtos alterados, {len(removed):,} removidos, "
+          f"{len(day2['product_logs']) - args.logs:,} logs novos\n")
+    print(f"{'armazenamento':16} {'backup 1':>10} {'MB gravados':>12} {'backup 2':>10} {'MB gravados':>12}")
+
+    for storage in ["tar", "chunks"]:
+        workdir = Path(tempfile.mkdtemp())
+        try:
+            manager = BackupManager(storage=storage, chunk_rows=args.chunk_rows)
+            manager.backup_dir = workdir
+
+            first = run_backup(manager, day1, "backup_full_1")
+            second = run_backup(manager, day2, "backup_full_2")
+            print(
+                f"{storage:16} {first[0]:>9.2f}s {first[1] / 1e6:>12.2f}"
+                f" {second[0]:>9.2f}s {second[1] / 1e6:>12.2f}"
+            )
+        finally:
+            shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
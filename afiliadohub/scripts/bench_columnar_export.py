@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Benchmark dos formatos de exportação: CSV x Parquet x Arrow IPC
+
+Grava o mesmo conjunto de páginas de produtos em cada formato (mesmo
+caminho de escrita usado pela API) e mede tempo de escrita, tamanho do
+arquivo e tempo de leitura para um DataFrame tipado.
+
+Uso: python scripts/bench_columnar_export.py [--rows 500000] [--page-size 1000]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+# O pacote api cria o cliente Supabase ao ser importado; nenhuma consulta é feita aqui
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "benchmark")
+
+from api.handlers.export_stream import EXPORT_SOURCES, csv_chunks
+from api.handlers.export_columnar import ColumnarExportWriter
+
+STORES = ["shopee", "aliexpress", "amazon", "temu", "shein", "magalu", "mercado_livre"]
+
+
+def product_pages(rows: int, page_size: int):
+    """Páginas no formato devolvido pelo PostgREST"""
+    for start in range(0, rows, page_size):
+        yield [
+            {
+                "id": f"{i:08x}-0000-4000-8000-000000000000",
+                "name": f"Produto de teste número {i}",
+                "store": STORES[i % len(STORES)],
+                "category": f"categoria_{i % 40}",
+                "current_price": round(5 + (i * 7.31) % 4995, 2),
+                "original_price": round(10 + (i * 9.17) % 5990, 2),
+                "discount_percentage": i % 80,
+                "coupon_code": None if i % 3 else f"CUPOM{i % 100}",
+                "affiliate_link": f"https://s.example.com/{i}",
+                "is_active": bool(i % 5),
+                "created_at": f"2026-10-{1 + i % 28:02d}T12:{i % 60:02d}:00+00:00"
+            }
+            for i in range(start, min(start + page_size, rows))
+        ]
+
+
+def write_csv(path, rows, page_size):
+    columns = list(EXPORT_SOURCES["products"]["columns"])
+    with open(path, "wb") as f:
+        for chunk in csv_chunks(product_pages(rows, page_size), columns):
+            f.write(chunk)
+
+
+def write_columnar(format):
+    def write(path, rows, page_size):
+        writer = ColumnarExportWriter("products", format, path)
+        try:
+            for page in product_pages(rows, page_size):
+                writer.write_page(page)
+        finally:
+            writer.close()
+    return write
+
+
+def read_csv(path):
+    # Tipagem equivalente à dos formatos colunares
+    return pd.read_csv(path, parse_dates=["created_at"], dtype={"store": "category", "category": "category"})
+
+
+def read_parquet(path):
+    return pq.read_table(path).to_pandas()
+
+
+def read_arrow(path):
+    with pa.memory_map(str(path)) as source:
+        return ipc.open_file(source).read_all().to_pandas()
+
+
+FORMATS = {
+    "csv": (write_csv, read_csv),
+    "parquet": (write_columnar("parquet"), read_parquet),
+    "arrow": (write_columnar("arrow"), read_arrow)
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark CSV x Parquet x Arrow")
+    parser.add_argument("--rows", type=int, default=500_000)
+    parser.add_argument("--page-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    print(f"📦 {args.rows:,} produtos, páginas de {args.page_size}")
+    print(f"  {'formato':8} | {'escrita':>9} | {'tamanho':>10} | {'leitura':>9}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, (write, read) in FORMATS.items():
+            path = Path(tmp) / f"products.{name}"
+
+            start = time.perf_counter()
+            write(path, args.rows, args.page_size)
+            write_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            frame = read(path)
+            read_time = time.perf_counter() - start
+
+            assert len(frame) == args.rows, f"{name}: {len(frame)} linhas lidas"
+            size = path.stat().st_size / 2**20
+            print(f"  {name:8} | {write_time:8.2f}s | {size:7.1f} MiB | {read_time:8.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Benchmark da exportação Excel do ReportExporter
+
+Compara o caminho antigo (pandas + openpyxl, todas as linhas em memória)
+com o modo streaming (xlsxwriter constant_memory, páginas geradas sob
+demanda). Mede tempo e pico de memória Python (tracemalloc).
+
+Uso: python scripts/bench_excel_export.py [--rows 100000] [--page-size 1000]
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import tracemalloc
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+# O pacote api cria o cliente Supabase ao ser importado; nenhuma consulta é feita aqui
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "benchmark")
+
+from api.handlers.export_reports import ReportExporter
+
+STORES = ["shopee", "aliexpress", "amazon", "temu", "shein", "magalu", "mercado_livre"]
+
+SUMMARY = {"total_products": 0, "avg_price": 123.45, "total_clicks": 9876}
+BY_STORE = {store: {"product_count": 100, "total_revenue": 1000.0} for store in STORES}
+
+
+def product_row(i: int) -> dict:
+    return {
+        "id": f"00000000-0000-0000-0000-{i:012d}",
+        "name": f"Produto de teste número {i}",
+        "store": STORES[i % len(STORES)],
+        "category": f"categoria_{i % 40}",
+        "current_price": round(5 + (i * 7.31) % 4995, 2),
+        "original_price": round(10 + (i * 9.17) % 5990, 2),
+        "discount_percentage": i % 80,
+        "coupon_code": None,
+        "affiliate_link": f"https://s.example.com/{i}",
+        "is_active": bool(i % 5),
+        "created_at": "2026-10-01T12:00:00+00:00"
+    }
+
+
+def product_pages(rows: int, page_size: int):
+    """Simula as páginas lidas do banco, sem materializar tudo"""
+    for start in range(0, rows, page_size):
+        yield [product_row(i) for i in range(start, min(start + page_size, rows))]
+
+
+def run_openpyxl(rows: int, page_size: int):
+    data = {"summary": SUMMARY, "products": [product_row(i) for i in range(rows)], "by_store": BY_STORE}
+    content = asyncio.run(ReportExporter().export_to_excel(data, "bench", engine="openpyxl"))
+    return len(content)
+
+
+def run_streaming(rows: int, page_size: int):
+    fd, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    try:
+        ReportExporter().write_excel_streaming(
+            path,
+            {"summary": SUMMARY, "by_store": BY_STORE},
+            {"Produtos": product_pages(rows, page_size)}
+        )
+        return os.path.getsize(path)
+    finally:
+        os.remove(path)
+
+
+def measure(func, rows: int, page_size: int):
+    start = time.perf_counter()
+    size = func(rows, page_size)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    func(rows, page_size)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return elapsed, peak, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de exportação Excel")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--page-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    print(f"📊 {args.rows:,} produtos, páginas de {args.page_size}")
+
+    results = {
+        "openpyxl (pandas)": measure(run_openpyxl, args.rows, args.page_size),
+        "xlsxwriter stream": measure(run_streaming, args.rows, args.page_size)
+    }
+
+    for name, (elapsed, peak, size) in results.items():
+        print(f"  {name:18}: {elapsed:7.2f} s | pico {peak / 2**20:8.1f} MiB | arquivo {size / 2**20:6.1f} MiB")
+
+    old, new = results["openpyxl (pandas)"], results["xlsxwriter stream"]
+    print(f"  Ganho: {old[0] / new[0]:.1f}x tempo, {old[1] / new[1]:.1f}x memória")
+
+
+if __name__ == "__main__":
+    main()
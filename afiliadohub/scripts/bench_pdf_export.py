@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Benchmark da exportação PDF do ReportExporter
+
+Compara a renderização do catálogo como uma única tabela (abordagem
+ingênua, sem limite de linhas) com o renderizador paginado (blocos de
+tabela com cabeçalho repetido e estilos compartilhados). Mede tempo, pico
+de memória Python (tracemalloc) e número de páginas.
+
+Uso: python scripts/bench_pdf_export.py [--rows 10000]
+"""
+import io
+import os
+import re
+import sys
+import time
+import argparse
+import tracemalloc
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+# O pacote api cria o cliente Supabase ao ser importado; nenhuma consulta é feita aqui
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "benchmark")
+
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import inch
+from reportlab.platypus import SimpleDocTemplate, Table
+
+from api.handlers.export_reports import ReportExporter, PRODUCTS_TABLE_STYLE
+
+STORES = ["shopee", "aliexpress", "amazon", "temu", "shein", "magalu", "mercado_livre"]
+
+
+def build_products(rows: int):
+    return [
+        {
+            "id": f"{i:08x}-0000-0000-0000-000000000000",
+            "name": f"Produto de teste número {i}",
+            "store": STORES[i % len(STORES)],
+            "current_price": round(5 + (i * 7.31) % 4995, 2),
+            "discount_percentage": i % 80
+        }
+        for i in range(rows)
+    ]
+
+
+def render_single_table(products) -> bytes:
+    """Todo o catálogo em uma Table só (o ReportLab re-divide a tabela a cada página)"""
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=72, leftMargin=72, topMargin=72, bottomMargin=72)
+
+    data = [['ID', 'Nome', 'Loja', 'Preço', 'Desconto']] + [
+        [p['id'][:8], p['name'][:30], p['store'], f"R$ {p['current_price']:,.2f}", f"{p['discount_percentage']}%"]
+        for p in products
+    ]
+    doc.build([Table(data, colWidths=[0.8*inch, 2.7*inch, inch, inch, inch], repeatRows=1, style=PRODUCTS_TABLE_STYLE)])
+    return buffer.getvalue()
+
+
+def render_paginated(products) -> bytes:
+    buffer = io.BytesIO()
+    ReportExporter().write_pdf(buffer, {"products": products}, "benchmark")
+    return buffer.getvalue()
+
+
+def count_pages(content: bytes) -> int:
+    return len(re.findall(rb"/Type /Page\b", content))
+
+
+def measure(func, products):
+    start = time.perf_counter()
+    content = func(products)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    func(products)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return elapsed, peak, count_pages(content)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de exportação PDF")
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--skip-single", action="store_true", help="Não roda a tabela única (lenta)")
+    args = parser.parse_args()
+
+    products = build_products(args.rows)
+    print(f"📄 {args.rows:,} produtos")
+
+    results = {}
+    if not args.skip_single:
+        results["tabela única"] = measure(render_single_table, products)
+    results["paginado"] = measure(render_paginated, products)
+
+    for name, (elapsed, peak, pages) in results.items():
+        print(f"  {name:13}: {elapsed:7.2f} s | pico {peak / 2**20:7.1f} MiB | {pages} páginas")
+
+    if len(results) == 2:
+        old, new = results["tabela única"], results["paginado"]
+        print(f"  Ganho: {old[0] / new[0]:.1f}x tempo, {old[1] / new[1]:.1f}x memória")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Cache HTTP em disco para os scrapers
+
+Cada resposta fica em <raiz>/<2 primeiros hex>/<sha256>.cache, onde o hash
+é o da requisição (método, URL e parâmetros ordenados): uma linha JSON com
+os metadados (ETag, Last-Modified, data de gravação) seguida do corpo.
+Dentro do TTL a resposta é servida sem rede; depois disso vira uma
+requisição condicional (If-None-Match / If-Modified-Since) e um 304 só
+renova a entrada. O diretório é limitado em bytes: ao passar do limite,
+as entradas usadas há mais tempo (mtime, atualizado a cada acerto) saem.
+"""
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+DEFAULT_CACHE_DIR = os.getenv("SHOPEE_CACHE_DIR", ".cache/shopee")
+DEFAULT_CACHE_TTL = float(os.getenv("SHOPEE_CACHE_TTL", "3600"))
+DEFAULT_CACHE_MAX_MB = float(os.getenv("SHOPEE_CACHE_MAX_MB", "500"))
+CACHE_SUFFIX = ".cache"
+
+
+class CacheEntry:
+    def __init__(self, path: Path, meta: Dict[str, Any], body: bytes):
+        self.path = path
+        self.meta = meta
+        self.body = body
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.meta["stored_at"]
+
+    def conditional_headers(self) -> Dict[str, str]:
+        headers = {}
+        if self.meta.get("etag"):
+            headers["If-None-Match"] = self.meta["etag"]
+        if self.meta.get("last_modified"):
+            headers["If-Modified-Since"] = self.meta["last_modified"]
+        return headers
+
+
+class HttpCache:
+    """Respostas GET em disco, com TTL e limite de tamanho"""
+
+    def __init__(self, root: str = DEFAULT_CACHE_DIR, ttl: float = DEFAULT_CACHE_TTL, max_mb: float = DEFAULT_CACHE_MAX_MB):
+        self.root = Path(root)
+        self.ttl = ttl
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.stats = {"hits": 0, "revalidated": 0, "misses": 0, "stored": 0, "rejected": 0, "evicted": 0}
+        self._size = sum(path.stat().st_size for path in self._entries()) if self.root.exists() else 0
+
+    @staticmethod
+    def key(url: str, params: Optional[Dict] = None, method: str = "GET") -> str:
+        query = sorted((str(k), str(v)) for k, v in (params or {}).items())
+        return hashlib.sha256(json.dumps([method, url, query]).encode("utf-8")).hexdigest()
+
+    def path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}{CACHE_SUFFIX}"
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        """Entrada gravada (fresca ou não); None se não existe ou está ilegível"""
+        path = self.path(key)
+        try:
+            with open(path, "rb") as f:
+                meta = json.loads(f.readline())
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+        return CacheEntry(path, meta, body)
+
+    def is_fresh(self, entry: CacheEntry) -> bool:
+        return entry.age < self.ttl
+
+    def hit(self, entry: CacheEntry):
+        """Resposta servida do cache sem rede"""
+        self.stats["hits"] += 1
+        self._touch(entry.path)
+
+    def revalidated(self, entry: CacheEntry, headers) -> CacheEntry:
+        """304: mesmo corpo, validadores e data de gravação renovados"""
+        self.stats["revalidated"] += 1
+        meta = dict(entry.meta, stored_at=time.time())
+        meta["etag"] = headers.get("ETag") or meta.get("etag")
+        meta["last_modified"] = headers.get("Last-Modified") or meta.get("last_modified")
+        self._write(entry.path, meta, entry.body)
+        return CacheEntry(entry.path, meta, entry.body)
+
+    def put(self, key: str, url: str, body: bytes, headers) -> bool:
+        """
+        Grava a resposta 200; respostas com Cache-Control: no-store não
+        entram. Se o corpo é cacheável (não é erro nem bloqueio) quem decide
+        é o chamador, antes de chamar put.
+        """
+        if "no-store" in headers.get("Cache-Control", "").lower():
+            return False
+
+        meta = {
+            "url": url,
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "stored_at": time.time()
+        }
+        self._write(self.path(key), meta, body)
+        self.stats["stored"] += 1
+
+        if self._size > self.max_bytes:
+            self.evict()
+        return True
+
+    def evict(self, target: float = 0.9):
+        """Remove as entradas menos usadas até ficar em `target` do limite"""
+        entries = []
+        for path in self._entries():
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        self._size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if self._size <= self.max_bytes * target:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            self._size -= size
+            self.stats["evicted"] += 1
+
+    def clear(self):
+        for path in self._entries():
+            path.unlink()
+        self._size = 0
+
+    def _write(self, path: Path, meta: Dict[str, Any], body: bytes):
+        previous = path.stat().st_size if path.exists() else 0
+        data = json.dumps(meta).encode("utf-8") + b"\n" + body
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        self._size += len(data) - previous
+
+    def _touch(self, path: Path):
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _entries(self):
+        return self.root.glob(f"*/*{CACHE_SUFFIX}")
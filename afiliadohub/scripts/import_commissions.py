@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Importa o relatório de vendas de afiliados e registra as comissões em lote
+
+Uso: python scripts/import_commissions.py vendas.csv [--chunk-size 500] [--show-errors]
+
+CSV: product_id, sale_amount, user_id (opcional), sold_at (opcional)
+"""
+import sys
+import asyncio
+import argparse
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from api.handlers.commission import CommissionSystem, parse_sales_csv, BULK_CHUNK_SIZE
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Importação de comissões em lote")
+    parser.add_argument("csv_file", help="CSV com as vendas")
+    parser.add_argument("--chunk-size", type=int, default=BULK_CHUNK_SIZE)
+    parser.add_argument("--show-errors", action="store_true", help="Lista as linhas com erro")
+    args = parser.parse_args()
+
+    path = Path(args.csv_file)
+    if not path.exists():
+        print(f"❌ Arquivo não encontrado: {path}")
+        sys.exit(1)
+
+    sales = parse_sales_csv(path.read_bytes())
+    print(f"📥 {len(sales)} vendas lidas de {path.name}")
+
+    result = await CommissionSystem().calculate_commissions_bulk(sales, chunk_size=args.chunk_size)
+
+    if "error" in result:
+        print(f"❌ Erro: {result['error']}")
+        sys.exit(1)
+
+    print(f"✅ {result['inserted']} comissões registradas (R$ {result['total_commission']:.2f})")
+
+    if result["failed"]:
+        print(f"⚠️  {result['failed']} linhas com erro")
+        if args.show_errors:
+            for row in result["results"]:
+                if not row["success"]:
+                    # +2: cabeçalho e numeração a partir de 1
+                    print(f"  linha {row['row'] + 2}: {row['error']}")
+
+    sys.exit(0 if result["success"] else 2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Harness do motor de preços contra uma loja falsa local
+
+Sobe um servidor aiohttp que imita as páginas de cada loja (API de item da
+Shopee, HTML da Amazon e do AliExpress, JSON-LD genérico), com ETag,
+latência e erros configuráveis. Roda o PriceRefreshEngine em duas passadas
+(sem banco) e confere:
+  - os preços extraídos batem com os da loja;
+  - a segunda passada revalida com If-None-Match (304) e só detecta as
+    mudanças feitas no servidor;
+  - concorrência e taxa por loja respeitam os limites.
+
+Uso: python scripts/price_refresh_harness.py [--products 2000] [--concurrency 8] [--rate 100]
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import zlib
+from collections import Counter, defaultdict
+from pathlib import Path
+
+from aiohttp import web
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+# O pacote api cria o cliente Supabase ao ser importado; nenhuma consulta é feita aqui
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "harness")
+
+from api.handlers.price_refresh import PriceRefreshEngine
+
+STORES = ["shopee", "aliexpress", "amazon", "magalu", "mercado_livre"]
+
+
+def brl(value: float) -> str:
+    return "R$ " + f"{value:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+
+class FakeStorefront:
+    """Loja falsa: preço determinístico por (produto, época)"""
+
+    def __init__(self, change_percent: int, latency: float, error_rate: float):
+        self.epoch = 0
+        self.change_percent = change_percent
+        self.latency = latency
+        self.error_rate = error_rate
+        self.active = Counter()
+        self.max_active = Counter()
+        self.requests = defaultdict(list)
+
+    def price(self, product_id: str) -> float:
+        seed = zlib.crc32(product_id.encode())
+        changes = self.epoch if seed % 100 < self.change_percent else 0
+        return round(20 + seed % 5000 + changes * 7.5, 2)
+
+    async def _serve(self, request: web.Request, store: str, product_id: str, render) -> web.Response:
+        self.active[store] += 1
+        self.max_active[store] = max(self.max_active[store], self.active[store])
+        self.requests[store].append(time.monotonic())
+        try:
+            await asyncio.sleep(random.uniform(0, 2 * self.latency))
+
+            if random.random() < self.error_rate:
+                return web.Response(status=500)
+
+            price = self.price(product_id)
+            etag = f'"{store}-{product_id}-{int(price * 100)}"'
+            if request.headers.get("If-None-Match") == etag:
+                return web.Response(status=304, headers={"ETag": etag})
+
+            body, content_type = render(price)
+            return web.Response(text=body, content_type=content_type, headers={"ETag": etag})
+        finally:
+            self.active[store] -= 1
+
+    async def shopee(self, request):
+        product_id = f"{request.query['shopid']}-{request.query['itemid']}"
+        return await self._serve(request, "shopee", product_id, lambda price: (
+            f'{{"data": {{"price": {int(price * 100000)}, "price_before_discount": {int(price * 1.3 * 100000)}}}}}',
+            "application/json"
+        ))
+
+    async def amazon(self, request):
+        return await self._serve(request, "amazon", request.match_info["id"], lambda price: (
+            '<html><body><span class="a-price aok-align-center" data-a-size="xl">'
+            f'<span class="a-offscreen">{brl(price)}</span></span>'
+            '<span class="a-price a-text-price" data-a-strike="true">'
+            f'<span class="a-offscreen">{brl(price * 1.2)}</span></span></body></html>',
+            "text/html"
+        ))
+
+    async def aliexpress(self, request):
+        return await self._serve(request, "aliexpress", request.match_info["id"], lambda price: (
+            f'<html><script>window.runParams = {{"priceModule": {{"minActivityAmount": {{"value": {price}}}, '
+            f'"minAmount": {{"value": {round(price * 1.5, 2)}}}}}}};</script></html>',
+            "text/html"
+        ))
+
+    async def generic(self, request):
+        store = request.match_info["store"]
+        return await self._serve(request, store, request.match_info["id"], lambda price: (
+            '<html><head><script type="application/ld+json">'
+            f'{{"@type": "Product", "offers": {{"@type": "Offer", "price": "{price:.2f}", "priceCurrency": "BRL"}}}}'
+            '</script></head></html>',
+            "text/html"
+        ))
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/api/v4/item/get", self.shopee)
+        app.router.add_get("/dp/{id}", self.amazon)
+        app.router.add_get("/item/{id}.html", self.aliexpress)
+        app.router.add_get("/{store}/p/{id}", self.generic)
+        return app
+
+
+def build_products(base_url: str, count: int):
+    products = []
+    for i in range(count):
+        store = STORES[i % len(STORES)]
+        if store == "shopee":
+            product_id, link = f"{1000 + i % 7}-{i}", f"{base_url}/product/{1000 + i % 7}/{i}"
+        elif store == "amazon":
+            product_id = f"B{i:09d}"
+            link = f"{base_url}/dp/{product_id}"
+        elif store == "aliexpress":
+            product_id, link = str(i), f"{base_url}/item/{i}.html"
+        else:
+            product_id, link = str(i), f"{base_url}/{store}/p/{i}"
+
+        products.append({
+            "id": product_id,
+            "name": f"Produto {i}",
+            "store": store,
+            "affiliate_link": link,
+            "current_price": 0,
+            "price_etag": None,
+            "price_last_modified": None
+        })
+    return products
+
+
+def apply_in_memory(results):
+    """Equivalente em memória de apply_results (atualiza preço e validadores)"""
+    for result in results:
+        product = result["product"]
+        product["price_etag"] = result["etag"]
+        product["price_last_modified"] = result["last_modified"]
+        if result["status"] == "changed":
+            product["current_price"] = round(result["current_price"], 2)
+
+
+async def run_pass(name, engine, products, storefront):
+    storefront.max_active.clear()
+    storefront.requests.clear()
+
+    start = time.perf_counter()
+    results = await engine.check_products(products)
+    elapsed = time.perf_counter() - start
+
+    statuses = Counter(result["status"] for result in results)
+    print(f"\n▶️ {name}: {len(results)} produtos em {elapsed:.2f}s ({len(results) / elapsed * 3600:,.0f}/h)")
+    print(f"   status: {dict(statuses)}")
+    return results, statuses
+
+
+def check_limits(engine, storefront) -> bool:
+    ok = True
+    for store in STORES:
+        limits = engine._limits(store)
+        times = storefront.requests[store]
+        span = times[-1] - times[0] if len(times) > 1 else 0
+        rate = (len(times) - 1) / span if span else 0
+        within = storefront.max_active[store] <= limits["concurrency"] and rate <= limits["rate"] * 1.1
+        ok &= within
+        print(
+            f"   {store:14} concorrência máx {storefront.max_active[store]}/{int(limits['concurrency'])}"
+            f" | taxa {rate:6.1f}/{limits['rate']:.0f} req/s {'[OK]' if within else '[ERRO]'}"
+        )
+    return ok
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Harness do motor de preços com loja falsa")
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=8, help="requisições simultâneas por loja")
+    parser.add_argument("--rate", type=float, default=100, help="requisições por segundo por loja")
+    parser.add_argument("--latency", type=float, default=0.02, help="latência média da loja (s)")
+    parser.add_argument("--change-percent", type=int, default=10, help="%% de produtos que mudam de preço")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    storefront = FakeStorefront(args.change_percent, args.latency, args.error_rate)
+    runner = web.AppRunner(storefront.app())
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    base_url = f"http://127.0.0.1:{port}"
+
+    limits = {store: {"concurrency": args.concurrency, "rate": args.rate} for store in STORES + ["default"]}
+    engine = PriceRefreshEngine(store_limits=limits)
+    products = build_products(base_url, args.products)
+    ok = True
+
+    try:
+        results, statuses = await run_pass("Passada 1 (sem validadores)", engine, products, storefront)
+        ok &= check_limits(engine, storefront)
+
+        wrong = [
+            r for r in results
+            if r["status"] == "changed" and abs(r["current_price"] - storefront.price(r["product"]["id"])) >= 0.01
+        ]
+        if wrong:
+            ok = False
+            print(f"   [ERRO] {len(wrong)} preços extraídos diferentes da loja")
+        apply_in_memory(results)
+
+        # Muda preços no servidor e revalida
+        storefront.epoch += 1
+        expected = {p["id"] for p in products if abs(p["current_price"] - storefront.price(p["id"])) >= 0.01}
+        results, statuses = await run_pass("Passada 2 (condicional)", engine, products, storefront)
+        ok &= check_limits(engine, storefront)
+
+        changed = {r["product"]["id"] for r in results if r["status"] == "changed"}
+        failed = {r["product"]["id"] for r in results if r["status"] == "failed"}
+        if changed != expected - failed:
+            ok = False
+            print(f"   [ERRO] mudanças detectadas {len(changed)} != esperadas {len(expected - failed)}")
+        else:
+            print(f"   [OK] {len(changed)} mudanças detectadas, {statuses['not_modified']} revalidados com 304")
+    finally:
+        await runner.cleanup()
+
+    print("\n✅ Harness OK" if ok else "\n❌ Harness com falhas")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
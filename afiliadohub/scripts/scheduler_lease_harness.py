@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Harness da eleição de líder do agendador com várias réplicas no mesmo processo
+
+Sobe N agendadores com um MemoryLeaseStore compartilhado (como réplicas
+com a tabela scheduler_leases) e o estado das tarefas num
+SettingsStateStore por nó sobre a mesma linha de settings (ou, com
+--state-backend sqlite, num SQLiteStateStore compartilhado) e registra cada execução de uma tarefa leader_only e de uma
+tarefa local (leader_only=False). Provoca três falhas no líder:
+  - partição: o líder perde acesso ao store de leases e depois volta;
+  - queda: o líder morre sem liberar o lease (assume outro após o TTL);
+  - parada: o líder para normalmente e libera o lease.
+E confere:
+  - a tarefa leader_only nunca roda duas vezes no mesmo intervalo (nem em
+    dois nós ao mesmo tempo) e não fica parada mais que o TTL além do
+    intervalo;
+  - o líder isolado para de disparar antes de outro nó assumir;
+  - após cada falha outro nó assume;
+  - a tarefa local roda em todos os nós vivos;
+  - o estado persistido é o último disparo do líder (seguidores com uma
+    cópia antiga não o sobrescrevem) e não inclui a tarefa local.
+
+Uso: python scripts/scheduler_lease_harness.py [--nodes 3] [--interval 0.3] [--ttl 1.5] [--state-backend settings]
+"""
+import os
+import sys
+import time
+import logging
+import asyncio
+import argparse
+import tempfile
+import shutil
+import threading
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+# O pacote api cria o cliente Supabase ao ser importado; nenhuma consulta é feita aqui
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "harness")
+
+from api.utils.scheduler import Scheduler, LEASE_NAME
+from api.utils.scheduler_lease import MemoryLeaseStore
+from api.utils.scheduler_store import SQLiteStateStore, SettingsStateStore
+
+logging.getLogger("api.utils.scheduler").setLevel(logging.ERROR)
+
+
+class PartitionedLeaseStore:
+    """Visão de um nó sobre o store compartilhado; `down` simula a partição"""
+
+    def __init__(self, store: MemoryLeaseStore):
+        self.store = store
+        self.down = False
+
+    def _check(self):
+        if self.down:
+            raise ConnectionError("store de leases inacessível")
+
+    def acquire(self, name: str, owner: str, ttl: float) -> bool:
+        self._check()
+        return self.store.acquire(name, owner, ttl)
+
+    def release(self, name: str, owner: str):
+        self._check()
+        self.store.release(name, owner)
+
+    def holder(self, name: str):
+        self._check()
+        return self.store.holder(name)
+
+
+class SharedSettingsStateStore(SettingsStateStore):
+    """SettingsStateStore com a linha de settings num dict compartilhado entre os nós"""
+
+    def __init__(self, row: dict, lock: threading.Lock):
+        self.row = row
+        self.lock = lock
+
+    def _read(self):
+        with self.lock:
+            return dict(self.row)
+
+    def _merge(self, task_id: str, last_run: str):
+        # Mesma regra da função merge_scheduler_state: só a chave, e só se for mais nova
+        with self.lock:
+            current = self.row.get(task_id)
+            if current is None or datetime.fromisoformat(current) < datetime.fromisoformat(last_run):
+                self.row[task_id] = last_run
+
+
+class HarnessScheduler(Scheduler):
+    """Agendador só com as tarefas do harness"""
+
+    def __init__(self, runs: list, dispatched: list, interval: float, **kwargs):
+        super().__init__(**kwargs)
+        self.runs = runs
+        self.dispatched = dispatched
+        self.interval = interval
+
+    async def schedule_default_tasks(self):
+        await self.schedule_task("leader_tick", self.leader_tick, interval_minutes=self.interval / 60)
+        await self.schedule_task("local_tick", self.local_tick, interval_minutes=self.interval / 60, leader_only=False)
+
+    async def leader_tick(self):
+        self.runs.append(("leader_tick", self.node_id, time.monotonic()))
+        self.dispatched.append(self.tasks["leader_tick"]["last_run"])
+        await asyncio.sleep(self.interval / 10)
+
+    async def local_tick(self):
+        self.runs.append(("local_tick", self.node_id, time.monotonic()))
+
+    def crash(self):
+        """Morre sem liberar o lease nem cancelar de forma ordenada"""
+        self.running = False
+        for task in [self._loop_task, self._heartbeat_task, *self._running_tasks]:
+            if task is not None:
+                task.cancel()
+
+
+async def wait_leader(nodes, timeout: float):
+    """Nó que se considera líder (None se nenhum assumir dentro do timeout)"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        leaders = [node for node in nodes if node.running and node.is_leader]
+        if len(leaders) == 1:
+            return leaders[0]
+        await asyncio.sleep(0.05)
+    return None
+
+
+async def wait_takeover(runs, node_id: str, after: float, timeout: float):
+    """Primeira execução leader_only de outro nó depois de `after` (None se não vier)"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        for name, owner, at in runs:
+            if name == "leader_tick" and owner != node_id and at > after:
+                return owner, at
+        await asyncio.sleep(0.05)
+    return None
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Harness da eleição de líder do agendador")
+    parser.add_argument("--nodes", type=int, default=3, help="agendadores (mínimo 3: duas falhas são definitivas)")
+    parser.add_argument("--interval", type=float, default=0.3, help="intervalo das tarefas (s)")
+    parser.add_argument("--ttl", type=float, default=1.5, help="TTL do lease (s)")
+    parser.add_argument("--state-backend", choices=["settings", "sqlite"], default="settings",
+                        help="settings: um store por nó sobre a mesma linha (como SCHEDULER_STATE_BACKEND=settings)")
+    parser.add_argument("--settle", type=float, default=3.0, help="tempo observado entre falhas (s)")
+    args = parser.parse_args()
+
+    if args.nodes < 3:
+        parser.error("--nodes precisa ser pelo menos 3")
+
+    state_dir = tempfile.mkdtemp(prefix="scheduler-harness-")
+    sqlite_store = SQLiteStateStore(os.path.join(state_dir, "state.db"))
+    settings_row, settings_lock = {}, threading.Lock()
+    lease_store = MemoryLeaseStore()
+    runs = []
+    dispatched = []
+    nodes = [
+        HarnessScheduler(
+            runs,
+            dispatched,
+            args.interval,
+            state_store=(
+                SharedSettingsStateStore(settings_row, settings_lock)
+                if args.state_backend == "settings" else sqlite_store
+            ),
+            lease_store=PartitionedLeaseStore(lease_store),
+            node_id=f"nó-{i}",
+            lease_ttl=args.ttl
+        )
+        for i in range(args.nodes)
+    ]
+    checks = {}
+    started = time.monotonic()
+
+    try:
+        for node in nodes:
+            await node.start()
+
+        leader = await wait_leader(nodes, args.ttl)
+        checks["um líder na subida"] = leader is not None and lease_store.holder(LEASE_NAME) == leader.node_id
+        print(f"\n▶️ {args.nodes} nós, líder inicial: {leader.node_id if leader else None}")
+        await asyncio.sleep(args.settle)
+
+        # Partição: o líder continua vivo mas não renova o lease
+        isolated = leader
+        isolated.lease_store.down = True
+        cut_at = time.monotonic()
+        leader = await wait_leader([n for n in nodes if n is not isolated], args.ttl * 3)
+        takeover = await wait_takeover(runs, isolated.node_id, cut_at, args.ttl * 3)
+        checks["partição: outro nó assume"] = leader is not None and takeover is not None
+        print(f"▶️ partição de {isolated.node_id}: assumiu {leader.node_id if leader else None}"
+              f" em {(takeover[1] - cut_at) if takeover else float('nan'):.2f}s")
+
+        await asyncio.sleep(args.ttl)
+        isolated.lease_store.down = False
+        heal_at = time.monotonic()
+        last_isolated = max(
+            (at for name, owner, at in runs if name == "leader_tick" and owner == isolated.node_id and at < heal_at),
+            default=0
+        )
+        checks["partição: isolado para antes da troca"] = takeover is not None and last_isolated < takeover[1]
+        await asyncio.sleep(args.settle)
+        checks["partição: isolado volta como seguidor"] = not isolated.is_leader and lease_store.holder(LEASE_NAME) == leader.node_id
+
+        # Queda: o lease só é liberado quando expira
+        crashed = leader
+        crashed.crash()
+        crash_at = time.monotonic()
+        leader = await wait_leader([n for n in nodes if n is not crashed], args.ttl * 3)
+        takeover = await wait_takeover(runs, crashed.node_id, crash_at, args.ttl * 3)
+        checks["queda: outro nó assume"] = leader is not None and takeover is not None
+        print(f"▶️ queda de {crashed.node_id}: assumiu {leader.node_id if leader else None}"
+              f" em {(takeover[1] - crash_at) if takeover else float('nan'):.2f}s")
+        await asyncio.sleep(args.settle)
+
+        # Parada normal: libera o lease e outro nó assume no próximo heartbeat
+        stopped = leader
+        await stopped.stop()
+        stop_at = time.monotonic()
+        alive = [n for n in nodes if n is not crashed and n is not stopped]
+        leader = await wait_leader(alive, args.ttl * 3)
+        takeover = await wait_takeover(runs, stopped.node_id, stop_at, args.ttl * 3)
+        checks["parada: outro nó assume antes do TTL"] = takeover is not None and takeover[1] - stop_at < args.ttl
+        print(f"▶️ parada de {stopped.node_id}: assumiu {leader.node_id if leader else None}"
+              f" em {(takeover[1] - stop_at) if takeover else float('nan'):.2f}s")
+        await asyncio.sleep(args.settle)
+    finally:
+        for node in nodes:
+            if node.running:
+                await node.stop()
+        persisted = nodes[0].state_store.load()
+        shutil.rmtree(state_dir)
+
+    elapsed = time.monotonic() - started
+    leader_runs = sorted(at for name, _, at in runs if name == "leader_tick")
+    gaps = [b - a for a, b in zip(leader_runs, leader_runs[1:])]
+    per_node = Counter(owner for name, owner, _ in runs if name == "leader_tick")
+    local_nodes = {owner for name, owner, _ in runs if name == "local_tick"}
+
+    print(f"\n   leader_tick: {len(leader_runs)} execuções em {elapsed:.1f}s (esperadas ~{elapsed / args.interval:.0f}), por nó {dict(per_node)}")
+    print(f"   intervalo entre execuções: mín {min(gaps):.3f}s, máx {max(gaps):.3f}s")
+    print(f"   estado persistido ({args.state_backend}): {persisted}")
+
+    # Folga de agendamento do laço; a troca de líder por queda custa até TTL + um heartbeat
+    checks["nunca duas vezes no mesmo intervalo"] = min(gaps) >= args.interval * 0.9
+    checks["sem buraco maior que intervalo + TTL"] = max(gaps) <= args.interval + args.ttl * 4 / 3 + 0.2
+    checks["tarefa local em todos os nós"] = local_nodes == {node.node_id for node in nodes}
+    checks["estado persistido = último disparo do líder"] = (
+        persisted.get("leader_tick") == max(dispatched) and "local_tick" not in persisted
+    )
+
+    for check, passed in checks.items():
+        print(f"   {'[OK]' if passed else '[ERRO]'} {check}")
+
+    ok = all(checks.values())
+    print("\n✅ Harness OK" if ok else "\n❌ Harness com falhas")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Harness do crawl da Shopee contra uma API de busca falsa local
+
+Sobe um servidor aiohttp que imita /api/v4/search/search_items: cada
+palavra-chave tem um número determinístico de resultados, itens se repetem
+entre palavras (para exercitar a deduplicação) e há latência, erros 500 e
+429 com Retry-After e bloqueios anti-bot (200 com `error` e sem
+`items`) configuráveis. Roda o ShopeeScraper.crawl e confere:
+  - todos os itens esperados chegam, uma única vez por (shop_id, itemid);
+  - concorrência e taxa respeitam os limites;
+  - páginas além do fim de uma palavra só são buscadas se já estavam em voo.
+Com --cache, repete o crawl com um HttpCache temporário: a segunda passada
+(dentro do TTL) só vai à rede por páginas que a primeira não buscou e a
+terceira (TTL 0) recebe 304 em toda página que já estava no cache; uma
+quarta, só com bloqueios, não grava nada no cache.
+
+Uso: python scripts/shopee_crawl_harness.py [--keywords 20] [--pages 5] [--concurrency 8] [--rate 50] [--cache]
+"""
+import sys
+import time
+import logging
+import random
+import asyncio
+import argparse
+import zlib
+import shutil
+import tempfile
+from pathlib import Path
+
+from aiohttp import web
+
+sys.path.append(str(Path(__file__).parent))
+
+from shopee_scraper import ShopeeScraper
+from http_cache import HttpCache
+
+logging.getLogger("aiohttp.access").setLevel(logging.WARNING)
+
+ITEM_POOL = 5000
+
+
+class FakeSearchApi:
+    """Busca falsa: resultados determinísticos por (palavra-chave, offset)"""
+
+    def __init__(self, latency: float, error_rate: float, throttle_rate: float, block_rate: float = 0.0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.block_rate = block_rate
+        self.active = 0
+        self.max_active = 0
+        self.requests = []
+        self.beyond_end = 0
+        self.not_modified = 0
+
+    @staticmethod
+    def total_results(keyword: str) -> int:
+        return 40 + zlib.crc32(keyword.encode()) % 300
+
+    @staticmethod
+    def item(keyword: str, index: int) -> dict:
+        itemid = (zlib.crc32(keyword.encode()) + index * 7) % ITEM_POOL
+        return {
+            "item_basic": {
+                "itemid": itemid,
+                "shopid": itemid % 97,
+                "name": f"Item {itemid}",
+                "price": (10 + itemid % 500) * 100000,
+                "price_before_discount": (15 + itemid % 500) * 100000,
+                "images": [f"img{itemid}"],
+                "item_rating": {"rating_star": 4.5, "rating_count": [1, 0, 0, 0, 1]}
+            }
+        }
+
+    def expected(self, keywords, pages: int, page_size: int) -> set:
+        keys = set()
+        for keyword in keywords:
+            for index in range(min(self.total_results(keyword), pages * page_size)):
+                basic = self.item(keyword, index)["item_basic"]
+                keys.add((basic["shopid"], basic["itemid"]))
+        return keys
+
+    async def search(self, request: web.Request) -> web.Response:
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        self.requests.append(time.monotonic())
+        try:
+            await asyncio.sleep(random.uniform(0, 2 * self.latency))
+
+            roll = random.random()
+            if roll < self.throttle_rate:
+                return web.Response(status=429, headers={"Retry-After": "1"})
+            if roll < self.throttle_rate + self.error_rate:
+                return web.Response(status=500)
+            if roll < self.throttle_rate + self.error_rate + self.block_rate:
+                # Como a Shopee bloqueia: status 200, sem itens
+                return web.json_response({"error": 90309999, "is_customized": False, "is_login": False})
+
+            keyword = request.query["keyword"]
+            offset = int(request.query["newest"])
+            limit = int(request.query["limit"])
+            total = self.total_results(keyword)
+
+            etag = f'"{zlib.crc32(keyword.encode())}-{offset}-{limit}"'
+            if request.headers.get("If-None-Match") == etag:
+                self.not_modified += 1
+                return web.Response(status=304, headers={"ETag": etag})
+            # offset == total é inevitável (última página cheia): só ela revela o fim
+            if offset > total:
+                self.beyond_end += 1
+
+            items = [self.item(keyword, i) for i in range(offset, min(offset + limit, total))]
+            return web.json_response({"items": items, "total_count": total}, headers={"ETag": etag})
+        finally:
+            self.active -= 1
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/api/v4/search/search_items", self.search)
+        return app
+
+
+async def crawl(base_url: str, keywords, args, concurrency: int, rate: float, cache: HttpCache = None):
+    start = time.perf_counter()
+    async with ShopeeScraper(base_url=base_url, concurrency=concurrency, rate=rate, cache=cache) as scraper:
+        products = [product async for product in scraper.crawl(keywords, args.pages, args.page_size)]
+    return products, scraper.stats, time.perf_counter() - start
+
+
+async def check_cache(api: FakeSearchApi, base_url: str, keywords, args, expected: set) -> bool:
+    """Três passadas com o mesmo cache: fria, dentro do TTL e com TTL 0 (revalidação)"""
+    # Sem falhas simuladas: toda página precisa chegar ao cache na primeira passada
+    error_rate, throttle_rate, block_rate = api.error_rate, api.throttle_rate, api.block_rate
+    api.error_rate = api.throttle_rate = api.block_rate = 0
+    cache_dir = tempfile.mkdtemp()
+    ok = True
+
+    try:
+        cache = HttpCache(cache_dir, ttl=3600)
+        passes = []
+        for name, ttl in [("cache frio", 3600), ("cache fresco", 3600), ("revalidação", 0)]:
+            cache.ttl = ttl
+            api.requests.clear()
+            api.not_modified = 0
+            before = dict(cache.stats)
+            products, stats, elapsed = await crawl(base_url, keywords, args, args.concurrency, args.rate, cache)
+            delta = {k: v - before[k] for k, v in cache.stats.items()}
+            keys = {(p["shop_id"], p["product_id"]) for p in products}
+            passes.append({"requests": len(api.requests), "not_modified": api.not_modified, "cache": delta, "keys": keys})
+            print(f"\n▶️ {name}: {len(products)} produtos em {elapsed:.2f}s | {len(api.requests)} requisições, {api.not_modified} x 304")
+            print(f"   {cache.stats}")
+
+        # Só bloqueios, com o cache vazio: nenhum deve ser gravado nem virar fim de palavra
+        cache.clear()
+        cache.ttl = 3600
+        api.block_rate = 1
+        before = dict(cache.stats)
+        products, stats, elapsed = await crawl(base_url, keywords, args, args.concurrency, args.rate, cache)
+        blocked = {k: v - before[k] for k, v in cache.stats.items()}
+        print(f"\n▶️ bloqueios: {len(products)} produtos, {stats['failed_pages']} páginas falhas | {cache.stats}")
+
+        cold, fresh, revalidated = passes
+        # Páginas além do fim em voo variam entre passadas: essas são misses legítimos
+        checks = {
+            "passada fria completa": cold["keys"] == expected and cold["cache"]["stored"] == cold["requests"],
+            "passada fresca sem rede": fresh["requests"] == fresh["cache"]["misses"] and fresh["cache"]["hits"] > 0
+                and fresh["keys"] == expected,
+            "revalidação com 304": revalidated["not_modified"] == revalidated["cache"]["revalidated"] > 0
+                and revalidated["requests"] == revalidated["not_modified"] + revalidated["cache"]["misses"]
+                and revalidated["cache"]["hits"] == 0 and revalidated["keys"] == expected,
+            "bloqueios fora do cache": blocked["stored"] == 0 and blocked["rejected"] == stats["failed_pages"] > 0
+                and not products
+        }
+        for check, passed in checks.items():
+            print(f"   {'[OK]' if passed else '[ERRO]'} {check}")
+        ok = all(checks.values())
+    finally:
+        api.error_rate, api.throttle_rate, api.block_rate = error_rate, throttle_rate, block_rate
+        shutil.rmtree(cache_dir)
+
+    return ok
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Harness do crawl da Shopee com API falsa")
+    parser.add_argument("--keywords", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument("--page-size", type=int, default=60)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=50, help="requisições por segundo")
+    parser.add_argument("--latency", type=float, default=0.05, help="latência média da API (s)")
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    parser.add_argument("--throttle-rate", type=float, default=0.01, help="fração de respostas 429")
+    parser.add_argument("--block-rate", type=float, default=0.01, help="fração de bloqueios anti-bot (200 sem itens)")
+    parser.add_argument("--compare", action="store_true", help="roda também sequencial (1 requisição por vez)")
+    parser.add_argument("--cache", action="store_true", help="confere o cache HTTP (passada fria, fresca e revalidada)")
+    args = parser.parse_args()
+
+    api = FakeSearchApi(args.latency, args.error_rate, args.throttle_rate, args.block_rate)
+    runner = web.AppRunner(api.app())
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    base_url = f"http://127.0.0.1:{port}"
+
+    keywords = [f"palavra {i}" for i in range(args.keywords)]
+    expected = api.expected(keywords, args.pages, args.page_size)
+    runs = [("paralelo", args.concurrency)] + ([("sequencial", 1)] if args.compare else [])
+    ok = True
+
+    try:
+        for name, concurrency in runs:
+            api.max_active = 0
+            api.requests.clear()
+            api.beyond_end = 0
+
+            products, stats, elapsed = await crawl(base_url, keywords, args, concurrency, args.rate)
+            keys = [(p["shop_id"], p["product_id"]) for p in products]
+
+            span = api.requests[-1] - api.requests[0] if len(api.requests) > 1 else 0
+            rate = (len(api.requests) - 1) / span if span else 0
+
+            print(f"\n▶️ {name}: {len(products)} produtos únicos em {elapsed:.2f}s ({stats['pages'] / elapsed:.1f} páginas/s)")
+            print(f"   {stats}")
+            print(
+                f"   concorrência máx {api.max_active}/{concurrency} | taxa {rate:.1f}/{args.rate:.0f} req/s"
+                f" | páginas além do fim {api.beyond_end}"
+            )
+
+            checks = {
+                "sem duplicados": len(keys) == len(set(keys)),
+                "todos os itens esperados": set(keys) == expected or stats["failed_pages"] > 0,
+                "concorrência": api.max_active <= concurrency,
+                "taxa": rate <= args.rate * 1.1,
+                # Só as páginas já em voo quando a palavra acabou
+                "páginas além do fim": api.beyond_end <= concurrency
+            }
+            for check, passed in checks.items():
+                print(f"   {'[OK]' if passed else '[ERRO]'} {check}")
+            ok &= all(checks.values())
+
+        if args.cache:
+            ok &= await check_cache(api, base_url, keywords, args, expected)
+    finally:
+        await runner.cleanup()
+
+    print("\n✅ Harness OK" if ok else "\n❌ Harness com falhas")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
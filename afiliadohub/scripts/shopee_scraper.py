@@ -1,66 +1,311 @@
 #!/usr/bin/env python3
 """
 Scraper automático da Shopee para atualizar produtos diariamente
+
+As buscas viram tarefas (palavra-chave, página) consumidas por um número
+limitado de workers, com token bucket para a taxa de requisições, pool de
+conexões reaproveitado e novas tentativas com backoff. Os produtos saem
+em streaming por crawl(), já sem duplicados por (shop_id, itemid), e
+vão direto para a tabela products pelo ShopeeProductSink (mesmo upsert em
+lote do importador de CSV), sem arquivo intermediário. Buscas e detalhes
+passam por um HttpCache em disco: respostas dentro do TTL não vão à rede
+e as vencidas são revalidadas com ETag / Last-Modified.
 """
 
+import os
+import sys
+import time
+import random
 import asyncio
 import aiohttp
 import json
 from datetime import datetime
+from pathlib import Path
 import pandas as pd
-from typing import Dict, List, Optional
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
 import logging
 
+from http_cache import HttpCache, DEFAULT_CACHE_DIR, DEFAULT_CACHE_TTL
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+SHOPEE_BASE_URL = os.getenv("SHOPEE_BASE_URL", "https://shopee.com.br")
+DEFAULT_CONCURRENCY = int(os.getenv("SHOPEE_CONCURRENCY", "8"))
+DEFAULT_RATE = float(os.getenv("SHOPEE_RATE", "4"))
+DEFAULT_PAGES = int(os.getenv("SHOPEE_PAGES", "3"))
+DEFAULT_PAGE_SIZE = int(os.getenv("SHOPEE_PAGE_SIZE", "60"))
+DEFAULT_MAX_RETRIES = int(os.getenv("SHOPEE_MAX_RETRIES", "3"))
+DEFAULT_TIMEOUT = float(os.getenv("SHOPEE_TIMEOUT", "20"))
+DEFAULT_SINK_BATCH_SIZE = int(os.getenv("SHOPEE_SINK_BATCH_SIZE", "500"))
+
+REQUEST_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
+    "Accept": "application/json"
+}
+
+
+class TokenBucket:
+    """Token bucket assíncrono (taxa em requisições por segundo)"""
+    
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+    
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+    
+    def pause(self, seconds: float):
+        """Suspende as requisições (429 / Retry-After)"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
 class ShopeeScraper:
-    def __init__(self, api_key: str = None):
-        self.base_url = "https://shopee.com.br"
+    def __init__(
+        self,
+        api_key: str = None,
+        base_url: str = None,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        rate: float = DEFAULT_RATE,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        timeout: float = DEFAULT_TIMEOUT,
+        cache: Optional[HttpCache] = None
+    ):
+        self.base_url = (base_url or SHOPEE_BASE_URL).rstrip("/")
         self.api_key = api_key
         self.session = None
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.limiter = TokenBucket(rate)
+        self.cache = cache
+        self.stats = {"requests": 0, "retries": 0, "pages": 0, "failed_pages": 0, "items": 0, "duplicates": 0}
     
     async def __aenter__(self):
-        self.session = aiohttp.ClientSession()
+        # Conexões mantidas vivas e limitadas à concorrência do crawl
+        self.session = aiohttp.ClientSession(
+            headers=REQUEST_HEADERS,
+            timeout=aiohttp.ClientTimeout(total=self.timeout, connect=min(10, self.timeout)),
+            connector=aiohttp.TCPConnector(
+                limit=self.concurrency,
+                limit_per_host=self.concurrency,
+                ttl_dns_cache=300,
+                keepalive_timeout=60
+            )
+        )
         return self
     
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         if self.session:
             await self.session.close()
     
-    async def search_products(self, keyword: str, limit: int = 50) -> List[Dict]:
-        """Busca produtos por palavra-chave"""
-        try:
-            # URL da API de busca da Shopee
-            url = f"{self.base_url}/api/v4/search/search_items"
-            
-            params = {
-                "by": "relevancy",
-                "keyword": keyword,
-                "limit": limit,
-                "newest": 0,
-                "order": "desc",
-                "page_type": "search",
-                "scenario": "PAGE_GLOBAL_SEARCH",
-                "version": 2
-            }
-            
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
-                "Referer": f"{self.base_url}/search?keyword={keyword}"
-            }
+    async def _request_json(
+        self,
+        url: str,
+        params: Dict,
+        headers: Dict,
+        cacheable: Optional[Callable[[Any], bool]] = None
+    ) -> Optional[Dict]:
+        """
+        GET com token bucket e novas tentativas (backoff exponencial com
+        jitter). Com cache, uma resposta fresca volta sem requisição e uma
+        vencida vira requisição condicional. Só vão para o cache (e só são
+        servidas dele) as respostas que `cacheable` aceita: a Shopee devolve
+        bloqueios anti-bot e erros com status 200.
+        """
+        key = entry = None
+        if self.cache:
+            key = self.cache.key(url, params)
+            entry = self.cache.get(key)
+            if entry:
+                try:
+                    cached = json.loads(entry.body)
+                except ValueError:
+                    cached = entry = None
+                if entry and cacheable and not cacheable(cached):
+                    entry = None
+            if entry and self.cache.is_fresh(entry):
+                self.cache.hit(entry)
+                return cached
+            if entry:
+                headers = {**headers, **entry.conditional_headers()}
+            else:
+                self.cache.stats["misses"] += 1
+        
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.stats["retries"] += 1
+                await asyncio.sleep(min(30, 0.5 * 2 ** attempt) * random.uniform(0.5, 1.5))
             
-            async with self.session.get(url, params=params, headers=headers) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    return self._parse_search_results(data)
-                else:
-                    logger.error(f"Erro na busca: {response.status}")
-                    return []
+            await self.limiter.acquire()
+            self.stats["requests"] += 1
+            try:
+                async with self.session.get(url, params=params, headers=headers) as response:
+                    if response.status == 200:
+                        body = await response.read()
+                        data = json.loads(body)
+                        if self.cache:
+                            if cacheable is None or cacheable(data):
+                                self.cache.put(key, url, body, response.headers)
+                            else:
+                                self.cache.stats["rejected"] += 1
+                        return data
                     
-        except Exception as e:
-            logger.error(f"Erro ao buscar produtos: {e}")
-            return []
+                    if response.status == 304 and entry:
+                        return json.loads(self.cache.revalidated(entry, response.headers).body)
+                    
+                    if response.status in (429, 503):
+                        retry_after = response.headers.get("Retry-After", "")
+                        self.limiter.pause(float(retry_after) if retry_after.isdigit() else 10)
+                        continue
+                    
+                    if response.status >= 500:
+                        continue
+                    
+                    logger.error(f"Erro HTTP {response.status} em {url}")
+                    return None
+            
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                logger.warning(f"Falha em {url} (tentativa {attempt + 1}): {e or type(e).__name__}")
+        
+        logger.error(f"Desistindo de {url} após {self.max_retries + 1} tentativas")
+        return None
+    
+    async def _search_page(self, keyword: str, limit: int, page: int):
+        """(itens brutos na página, produtos) ou None se a página falhou"""
+        params = {
+            "by": "relevancy",
+            "keyword": keyword,
+            "limit": limit,
+            "newest": page * limit,
+            "order": "desc",
+            "page_type": "search",
+            "scenario": "PAGE_GLOBAL_SEARCH",
+            "version": 2
+        }
+        headers = {"Referer": f"{self.base_url}/search?keyword={keyword}"}
+        
+        data = await self._request_json(
+            f"{self.base_url}/api/v4/search/search_items", params, headers, cacheable=self._is_search_result
+        )
+        # Bloqueio ou erro não é página vazia: conta como falha em vez de encerrar a palavra
+        if data is None or not self._is_search_result(data):
+            return None
+        return len(data.get("items") or []), self._parse_search_results(data)
+    
+    @staticmethod
+    def _is_search_result(data: Any) -> bool:
+        """Busca de verdade: sem `error` e com `items` (nulo no fim dos resultados)"""
+        return (
+            isinstance(data, dict)
+            and not data.get("error")
+            and "items" in data
+            and isinstance(data["items"], (list, type(None)))
+        )
+    
+    @staticmethod
+    def _is_product_details(data: Any) -> bool:
+        """Detalhes de verdade: sem `error` e com o objeto `data`"""
+        return isinstance(data, dict) and not data.get("error") and isinstance(data.get("data"), dict)
+    
+    async def search_products(self, keyword: str, limit: int = 50, page: int = 0) -> List[Dict]:
+        """Busca produtos por palavra-chave (uma página)"""
+        result = await self._search_page(keyword, limit, page)
+        return result[1] if result else []
+    
+    async def crawl(
+        self,
+        keywords: List[str],
+        pages: int = DEFAULT_PAGES,
+        page_size: int = DEFAULT_PAGE_SIZE
+    ) -> AsyncIterator[Dict]:
+        """
+        Produtos únicos de todas as (palavra-chave, página), na ordem em que
+        chegam. As páginas são enfileiradas por profundidade (página 0 de
+        todas as palavras primeiro) e uma palavra cuja página veio
+        incompleta não tem as seguintes buscadas.
+        """
+        tasks = asyncio.Queue()
+        for page in range(pages):
+            for keyword in keywords:
+                tasks.put_nowait((keyword, page))
+        
+        results = asyncio.Queue(maxsize=self.concurrency * 2)
+        exhausted: Dict[str, int] = {}
+        done = object()
+        
+        async def worker():
+            while True:
+                try:
+                    keyword, page = tasks.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                if page >= exhausted.get(keyword, pages):
+                    continue
+                
+                result = await self._search_page(keyword, page_size, page)
+                if result is None:
+                    self.stats["failed_pages"] += 1
+                    continue
+                
+                raw_count, products = result
+                self.stats["pages"] += 1
+                if raw_count < page_size:
+                    exhausted[keyword] = min(exhausted.get(keyword, pages), page + 1)
+                
+                for product in products:
+                    product["search_keyword"] = keyword
+                await results.put(products)
+        
+        async def run_workers():
+            # Cancelamento (consumidor parou) não chega aqui: CancelledError não é Exception
+            try:
+                await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+            except Exception as e:
+                await results.put(e)
+            await results.put(done)
+        
+        runner = asyncio.create_task(run_workers())
+        seen = set()
+        try:
+            while True:
+                products = await results.get()
+                if products is done:
+                    break
+                if isinstance(products, Exception):
+                    raise products
+                
+                for product in products:
+                    key = (product.get("shop_id"), product.get("product_id"))
+                    self.stats["items"] += 1
+                    if key[1] is None or key in seen:
+                        self.stats["duplicates"] += 1
+                        continue
+                    seen.add(key)
+                    yield product
+        finally:
+            # Consumidor parou antes do fim: não deixa workers presos na fila cheia
+            runner.cancel()
+            try:
+                await runner
+            except asyncio.CancelledError:
+                pass
     
     def _parse_search_results(self, data: Dict) -> List[Dict]:
         """Parse dos resultados da busca"""
@@ -92,8 +337,7 @@ class ShopeeScraper:
                         "shop_rating": item_basic.get("shop_rating", 0),
                         "shop_response_rate": item_basic.get("shopee_verified", False),
                         "has_lowest_price_guarantee": item_basic.get("has_lowest_price_guarantee", False),
-                        "show_discount": item_basic.get("show_discount", ""),
-                        "raw_data": json.dumps(item_basic)
+                        "show_discount": item_basic.get("show_discount", "")
                     }
                     
                     # Calcula desconto
@@ -113,7 +357,7 @@ class ShopeeScraper:
                     logger.warning(f"Erro ao parse produto: {e}")
                     continue
             
-            logger.info(f"Parseados {len(products)} produtos")
+            logger.debug(f"Parseados {len(products)} produtos")
             return products
             
         except Exception as e:
@@ -128,30 +372,17 @@ class ShopeeScraper:
     
     async def get_product_details(self, product_id: int, shop_id: int) -> Optional[Dict]:
         """Busca detalhes específicos de um produto"""
-        try:
-            url = f"{self.base_url}/api/v4/item/get"
-            
-            params = {
-                "itemid": product_id,
-                "shopid": shop_id
-            }
-            
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
-                "Referer": f"{self.base_url}/product/{shop_id}/{product_id}"
-            }
-            
-            async with self.session.get(url, params=params, headers=headers) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    return self._parse_product_details(data)
-                else:
-                    logger.error(f"Erro nos detalhes: {response.status}")
-                    return None
-                    
-        except Exception as e:
-            logger.error(f"Erro ao buscar detalhes: {e}")
-            return None
+        url = f"{self.base_url}/api/v4/item/get"
+        
+        params = {
+            "itemid": product_id,
+            "shopid": shop_id
+        }
+        
+        headers = {"Referer": f"{self.base_url}/product/{shop_id}/{product_id}"}
+        
+        data = await self._request_json(url, params, headers, cacheable=self._is_product_details)
+        return self._parse_product_details(data) if self._is_product_details(data) else None
     
     def _parse_product_details(self, data: Dict) -> Optional[Dict]:
         """Parse dos detalhes do produto"""
@@ -183,37 +414,49 @@ class ShopeeScraper:
             logger.error(f"Erro no parse de detalhes: {e}")
             return None
     
-    async def update_daily_products(self, categories: List[str] = None):
-        """Atualiza produtos diariamente de categorias específicas"""
+    async def update_daily_products(
+        self,
+        categories: List[str] = None,
+        pages: int = DEFAULT_PAGES,
+        page_size: int = DEFAULT_PAGE_SIZE,
+        output: str = "db"
+    ) -> Dict:
+        """
+        Atualiza produtos diariamente de categorias específicas
+        
+        output="db" grava em products à medida que as páginas chegam;
+        output="csv" mantém o arquivo shopee_products_<timestamp>.csv.
+        """
         if categories is None:
             categories = ["smartphone", "notebook", "fone", "relogio", "tenis"]
         
-        all_products = []
-        
-        for category in categories:
-            logger.info(f"Buscando produtos da categoria: {category}")
-            products = await self.search_products(category, limit=100)
-            all_products.extend(products)
-            
-            # Aguarda para não sobrecarregar
-            await asyncio.sleep(2)
-        
-        # Remove duplicados
-        unique_products = []
-        seen_ids = set()
+        logger.info(
+            f"Buscando {len(categories)} palavras-chave x {pages} páginas "
+            f"({self.concurrency} em paralelo, {self.limiter.rate:g} req/s) -> {output}"
+        )
+        started = time.monotonic()
         
-        for product in all_products:
-            pid = product.get("product_id")
-            if pid and pid not in seen_ids:
-                seen_ids.add(pid)
-                unique_products.append(product)
+        result = {}
+        if output == "csv":
+            unique_products = [product async for product in self.crawl(categories, pages, page_size)]
+            result["file"] = self._save_to_csv(unique_products)
+            result["unique"] = len(unique_products)
+        else:
+            sink = ShopeeProductSink(base_url=self.base_url)
+            async for product in self.crawl(categories, pages, page_size):
+                await sink.add(product)
+            await sink.close()
+            result.update(sink.stats)
         
-        logger.info(f"Total de produtos únicos encontrados: {len(unique_products)}")
+        elapsed = time.monotonic() - started
+        logger.info(
+            f"Total de produtos únicos encontrados: {result.get('unique', 0)} em {elapsed:.1f}s "
+            f"({self.stats['pages']} páginas, {self.stats['duplicates']} duplicados, "
+            f"{self.stats['retries']} novas tentativas, {self.stats['failed_pages']} páginas com falha)"
+        )
         
-        # Salva em CSV
-        self._save_to_csv(unique_products)
-        
-        return unique_products
+        result.update({"crawl": dict(self.stats), "elapsed_seconds": round(elapsed, 2)})
+        return result
     
     def _save_to_csv(self, products: List[Dict]):
         """Salva produtos em CSV"""
@@ -241,23 +484,126 @@ class ShopeeScraper:
         
         return filename
 
+class ShopeeProductSink:
+    """
+    Grava produtos do crawl na tabela products
+    
+    Cada item vira uma linha no formato do importador de CSV (link
+    normalizado, preço/desconto, imagem, categoria = palavra-chave) e os
+    lotes passam por SupabaseManager.bulk_insert_products (upsert por
+    affiliate_link).
+    """
+    
+    def __init__(self, batch_size: int = DEFAULT_SINK_BATCH_SIZE, base_url: str = None):
+        # Importado aqui: o crawl em si (e a saída CSV) não precisa do banco
+        sys.path.append(str(Path(__file__).parent.parent))
+        from api.utils.supabase_client import get_supabase_manager
+        from api.utils.link_processor import normalize_link
+        
+        self.supabase = get_supabase_manager()
+        self.normalize_link = normalize_link
+        self.batch_size = batch_size
+        self.base_url = (base_url or SHOPEE_BASE_URL).rstrip("/")
+        self.stats = {"unique": 0, "written": 0, "skipped": 0, "errors": 0}
+        self._batch: List[Dict] = []
+        self._seen_links = set()
+    
+    def to_product(self, item: Dict) -> Optional[Dict]:
+        """Item parseado da busca -> linha de products (None se não tiver nome/preço)"""
+        if not item.get("name") or not item.get("price"):
+            return None
+        
+        affiliate_link = self.normalize_link(item["affiliate_link"])
+        if affiliate_link in self._seen_links:
+            return None
+        self._seen_links.add(affiliate_link)
+        
+        current_price = round(float(item["price"]), 2)
+        original_price = round(float(item["original_price"]), 2) if item.get("original_price") else None
+        if original_price is not None and original_price <= current_price:
+            original_price = None
+        
+        keyword = item.get("search_keyword")
+        brand = (item.get("brand") or "").strip().lower()
+        
+        return {
+            "store": "shopee",
+            "name": item["name"][:500],
+            "affiliate_link": affiliate_link,
+            # Formato que o motor de preços reconhece (/product/<shop>/<item>)
+            "original_link": f"{self.base_url}/product/{item['shop_id']}/{item['product_id']}",
+            "current_price": current_price,
+            "original_price": original_price,
+            "discount_percentage": item.get("discount_percentage"),
+            "category": keyword[:100] if keyword else None,
+            "image_url": item["images"][0] if item.get("images") else None,
+            "tags": [tag for tag in dict.fromkeys([keyword, brand]) if tag],
+            "is_active": True
+        }
+    
+    async def add(self, item: Dict):
+        product = self.to_product(item)
+        if product is None:
+            self.stats["skipped"] += 1
+            return
+        
+        self.stats["unique"] += 1
+        self._batch.append(product)
+        if len(self._batch) >= self.batch_size:
+            await self.flush()
+    
+    async def flush(self):
+        if not self._batch:
+            return
+        
+        batch, self._batch = self._batch, []
+        result = await self.supabase.bulk_insert_products(batch, batch_size=self.batch_size)
+        self.stats["written"] += result["inserted"]
+        self.stats["errors"] += result["errors"]
+        
+        if result["errors"]:
+            logger.error(f"[ERRO] Lote de {len(batch)} produtos não gravado: {result['error_messages'][-1]}")
+        else:
+            logger.info(f"[OK] {self.stats['written']} produtos gravados")
+    
+    async def close(self):
+        await self.flush()
+
+
 async def main():
     """Função principal"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Scraper da Shopee")
+    parser.add_argument("keywords", nargs="*", help="Palavras-chave (padrão: lista interna)")
+    parser.add_argument("--pages", type=int, default=DEFAULT_PAGES, help="Páginas por palavra-chave")
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE, help="Itens por página")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Requisições simultâneas")
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE, help="Requisições por segundo")
+    parser.add_argument("--output", choices=["db", "csv"], default="db", help="Grava em products (db) ou em CSV")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="Diretório do cache HTTP")
+    parser.add_argument("--cache-ttl", type=float, default=DEFAULT_CACHE_TTL, help="Segundos em que uma resposta vale sem revalidar")
+    parser.add_argument("--no-cache", action="store_true", help="Sempre busca na rede")
+    args = parser.parse_args()
+    
     logger.info("🚀 Iniciando scraper da Shopee...")
     
     # Configurações
-    KEYWORDS = [
+    KEYWORDS = args.keywords or [
         "smartphone", "notebook", "fone bluetooth", "smartwatch",
         "airfryer", "geladeira", "tv", "monitor", "mouse", "teclado"
     ]
     
-    async with ShopeeScraper() as scraper:
-        products = await scraper.update_daily_products(KEYWORDS)
-        
-        logger.info(f"✅ Scraping concluído! {len(products)} produtos encontrados.")
+    cache = None if args.no_cache else HttpCache(args.cache_dir, ttl=args.cache_ttl)
+    
+    async with ShopeeScraper(concurrency=args.concurrency, rate=args.rate, cache=cache) as scraper:
+        result = await scraper.update_daily_products(KEYWORDS, args.pages, args.page_size, args.output)
         
-        # Aqui você pode integrar com o banco de dados
-        # await save_to_database(products)
+        logger.info(f"✅ Scraping concluído! {result.get('unique', 0)} produtos encontrados.")
+        if args.output == "db":
+            logger.info(f"💾 {result['written']} gravados, {result['errors']} com erro, {result['skipped']} ignorados")
+        if cache:
+            logger.info(f"🗄️ Cache HTTP: {cache.stats}")
 
 if __name__ == "__main__":
     asyncio.run(main())
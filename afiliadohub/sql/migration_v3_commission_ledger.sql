@@ -0,0 +1,138 @@
+-- Livro-razão de comissões (somente inserção) e saldos correntes
+-- Os saldos por loja e por usuário são atualizados por triggers a cada
+-- comissão registrada ou mudança de status (pending -> approved -> paid).
+
+CREATE TABLE IF NOT EXISTS public.commission_ledger (
+    id BIGSERIAL PRIMARY KEY,
+    commission_id TEXT NOT NULL,
+    store VARCHAR(50) NOT NULL DEFAULT '',
+    user_id TEXT,
+    entry_type VARCHAR(20) NOT NULL,          -- accrual | transition
+    from_status VARCHAR(20),
+    to_status VARCHAR(20) NOT NULL,
+    sale_amount NUMERIC(14, 2) DEFAULT 0,
+    amount NUMERIC(14, 2) NOT NULL,
+    created_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_commission_ledger_commission ON public.commission_ledger(commission_id);
+CREATE INDEX IF NOT EXISTS idx_commission_ledger_store ON public.commission_ledger(store, created_at);
+CREATE INDEX IF NOT EXISTS idx_commission_ledger_user ON public.commission_ledger(user_id, created_at);
+
+-- Saldo por escopo: ('store', <loja>), ('user', <user_id>) e ('all', '')
+CREATE TABLE IF NOT EXISTS public.commission_balances (
+    scope VARCHAR(10) NOT NULL,
+    scope_id TEXT NOT NULL DEFAULT '',
+    pending NUMERIC(14, 2) DEFAULT 0,
+    approved NUMERIC(14, 2) DEFAULT 0,
+    paid NUMERIC(14, 2) DEFAULT 0,
+    cancelled NUMERIC(14, 2) DEFAULT 0,
+    total_sales NUMERIC(14, 2) DEFAULT 0,
+    sales_count INT DEFAULT 0,
+    updated_at TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (scope, scope_id)
+);
+
+-- Aplica um lançamento aos saldos de um escopo
+CREATE OR REPLACE FUNCTION apply_commission_balance(
+    p_scope VARCHAR, p_scope_id TEXT, p_from VARCHAR, p_to VARCHAR,
+    p_amount NUMERIC, p_sale NUMERIC, p_count INT
+)
+RETURNS VOID AS $$
+BEGIN
+    INSERT INTO public.commission_balances (scope, scope_id)
+    VALUES (p_scope, p_scope_id)
+    ON CONFLICT (scope, scope_id) DO NOTHING;
+
+    UPDATE public.commission_balances SET
+        pending = pending
+            + CASE WHEN p_to = 'pending' THEN p_amount ELSE 0 END
+            - CASE WHEN p_from = 'pending' THEN p_amount ELSE 0 END,
+        approved = approved
+            + CASE WHEN p_to = 'approved' THEN p_amount ELSE 0 END
+            - CASE WHEN p_from = 'approved' THEN p_amount ELSE 0 END,
+        paid = paid
+            + CASE WHEN p_to = 'paid' THEN p_amount ELSE 0 END
+            - CASE WHEN p_from = 'paid' THEN p_amount ELSE 0 END,
+        cancelled = cancelled
+            + CASE WHEN p_to = 'cancelled' THEN p_amount ELSE 0 END
+            - CASE WHEN p_from = 'cancelled' THEN p_amount ELSE 0 END,
+        total_sales = total_sales + p_sale,
+        sales_count = sales_count + p_count,
+        updated_at = NOW()
+    WHERE scope = p_scope AND scope_id = p_scope_id;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Trigger: cada comissão nova ou mudança de status gera um lançamento
+CREATE OR REPLACE FUNCTION commission_ledger_trigger()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_from VARCHAR := NULL;
+    v_type VARCHAR := 'accrual';
+    v_sale NUMERIC := 0;
+    v_count INT := 0;
+BEGIN
+    IF TG_OP = 'UPDATE' THEN
+        IF NEW.status IS NOT DISTINCT FROM OLD.status THEN
+            RETURN NEW;
+        END IF;
+        v_from := OLD.status;
+        v_type := 'transition';
+    ELSE
+        v_sale := COALESCE(NEW.sale_amount, 0);
+        v_count := 1;
+    END IF;
+
+    INSERT INTO public.commission_ledger (
+        commission_id, store, user_id, entry_type, from_status, to_status, sale_amount, amount
+    ) VALUES (
+        NEW.id::TEXT, COALESCE(NEW.store, ''), NEW.user_id::TEXT, v_type, v_from,
+        COALESCE(NEW.status, 'pending'), v_sale, COALESCE(NEW.commission_amount, 0)
+    );
+
+    PERFORM apply_commission_balance('all', '', v_from, COALESCE(NEW.status, 'pending'),
+                                     COALESCE(NEW.commission_amount, 0), v_sale, v_count);
+    PERFORM apply_commission_balance('store', COALESCE(NEW.store, ''), v_from, COALESCE(NEW.status, 'pending'),
+                                     COALESCE(NEW.commission_amount, 0), v_sale, v_count);
+    IF NEW.user_id IS NOT NULL THEN
+        PERFORM apply_commission_balance('user', NEW.user_id::TEXT, v_from, COALESCE(NEW.status, 'pending'),
+                                         COALESCE(NEW.commission_amount, 0), v_sale, v_count);
+    END IF;
+
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_commission_ledger ON public.commissions;
+CREATE TRIGGER trg_commission_ledger
+    AFTER INSERT OR UPDATE OF status ON public.commissions
+    FOR EACH ROW EXECUTE FUNCTION commission_ledger_trigger();
+
+-- Recalcula os saldos a partir das comissões existentes (carga inicial)
+CREATE OR REPLACE FUNCTION rebuild_commission_balances()
+RETURNS VOID AS $$
+BEGIN
+    DELETE FROM public.commission_balances;
+
+    INSERT INTO public.commission_balances (scope, scope_id, pending, approved, paid, cancelled, total_sales, sales_count)
+    SELECT scope, scope_id,
+        SUM(CASE WHEN status = 'pending' THEN commission_amount ELSE 0 END),
+        SUM(CASE WHEN status = 'approved' THEN commission_amount ELSE 0 END),
+        SUM(CASE WHEN status = 'paid' THEN commission_amount ELSE 0 END),
+        SUM(CASE WHEN status = 'cancelled' THEN commission_amount ELSE 0 END),
+        SUM(sale_amount),
+        COUNT(*)
+    FROM (
+        SELECT 'all' AS scope, '' AS scope_id, status, commission_amount, sale_amount FROM public.commissions
+        UNION ALL
+        SELECT 'store', COALESCE(store, ''), status, commission_amount, sale_amount FROM public.commissions
+        UNION ALL
+        SELECT 'user', user_id::TEXT, status, commission_amount, sale_amount FROM public.commissions
+        WHERE user_id IS NOT NULL
+    ) AS c
+    GROUP BY scope, scope_id;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT rebuild_commission_balances();
@@ -0,0 +1,101 @@
+-- Backups incrementais por watermark
+-- 1. updated_at mantido por trigger em toda tabela que sofre UPDATE, para que
+--    "alterado desde o último backup" seja confiável. Em products, uma checagem
+--    de preço sem mudança (só last_checked / validadores HTTP) não conta.
+-- 2. backup_tombstones registra as remoções (inclusive em cascata), que o
+--    backup incremental exporta e a restauração reaplica.
+
+ALTER TABLE public.product_stats ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ DEFAULT NOW();
+ALTER TABLE IF EXISTS public.commissions ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ DEFAULT NOW();
+
+CREATE OR REPLACE FUNCTION public.touch_updated_at()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.updated_at := NOW();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Colunas de controle da atualização de preços (apply_price_refresh): mudar
+-- só elas mantém o updated_at que o chamador mandou
+CREATE OR REPLACE FUNCTION public.touch_products_updated_at()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF (to_jsonb(NEW) - ARRAY['updated_at', 'last_checked', 'price_etag', 'price_last_modified'])
+       IS DISTINCT FROM
+       (to_jsonb(OLD) - ARRAY['updated_at', 'last_checked', 'price_etag', 'price_last_modified']) THEN
+        NEW.updated_at := NOW();
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_products_updated_at ON public.products;
+CREATE TRIGGER trg_products_updated_at
+    BEFORE UPDATE ON public.products
+    FOR EACH ROW EXECUTE FUNCTION public.touch_products_updated_at();
+
+DROP TRIGGER IF EXISTS trg_product_stats_updated_at ON public.product_stats;
+CREATE TRIGGER trg_product_stats_updated_at
+    BEFORE UPDATE ON public.product_stats
+    FOR EACH ROW EXECUTE FUNCTION public.touch_updated_at();
+
+DROP TRIGGER IF EXISTS trg_commissions_updated_at ON public.commissions;
+CREATE TRIGGER trg_commissions_updated_at
+    BEFORE UPDATE ON public.commissions
+    FOR EACH ROW EXECUTE FUNCTION public.touch_updated_at();
+
+DROP TRIGGER IF EXISTS trg_settings_updated_at ON public.settings;
+CREATE TRIGGER trg_settings_updated_at
+    BEFORE UPDATE ON public.settings
+    FOR EACH ROW EXECUTE FUNCTION public.touch_updated_at();
+
+-- Remoções
+CREATE TABLE IF NOT EXISTS public.backup_tombstones (
+    id BIGSERIAL PRIMARY KEY,
+    table_name TEXT NOT NULL,
+    row_key TEXT NOT NULL,
+    deleted_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_backup_tombstones_deleted ON public.backup_tombstones(deleted_at, id);
+
+-- TG_ARGV[0] = coluna chave da tabela
+CREATE OR REPLACE FUNCTION public.record_backup_tombstone()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO public.backup_tombstones (table_name, row_key)
+    VALUES (TG_TABLE_NAME, to_jsonb(OLD) ->> TG_ARGV[0]);
+    RETURN OLD;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_products_tombstone ON public.products;
+CREATE TRIGGER trg_products_tombstone
+    AFTER DELETE ON public.products
+    FOR EACH ROW EXECUTE FUNCTION public.record_backup_tombstone('id');
+
+DROP TRIGGER IF EXISTS trg_product_stats_tombstone ON public.product_stats;
+CREATE TRIGGER trg_product_stats_tombstone
+    AFTER DELETE ON public.product_stats
+    FOR EACH ROW EXECUTE FUNCTION public.record_backup_tombstone('product_id');
+
+DROP TRIGGER IF EXISTS trg_product_logs_tombstone ON public.product_logs;
+CREATE TRIGGER trg_product_logs_tombstone
+    AFTER DELETE ON public.product_logs
+    FOR EACH ROW EXECUTE FUNCTION public.record_backup_tombstone('id');
+
+DROP TRIGGER IF EXISTS trg_commissions_tombstone ON public.commissions;
+CREATE TRIGGER trg_commissions_tombstone
+    AFTER DELETE ON public.commissions
+    FOR EACH ROW EXECUTE FUNCTION public.record_backup_tombstone('id');
+
+DROP TRIGGER IF EXISTS trg_settings_tombstone ON public.settings;
+CREATE TRIGGER trg_settings_tombstone
+    AFTER DELETE ON public.settings
+    FOR EACH ROW EXECUTE FUNCTION public.record_backup_tombstone('key');
+
+DROP TRIGGER IF EXISTS trg_import_logs_tombstone ON public.import_logs;
+CREATE TRIGGER trg_import_logs_tombstone
+    AFTER DELETE ON public.import_logs
+    FOR EACH ROW EXECUTE FUNCTION public.record_backup_tombstone('id');
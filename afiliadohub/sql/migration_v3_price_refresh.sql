@@ -0,0 +1,52 @@
+-- Atualização de preços: validadores HTTP por produto e índice da fila de verificação
+-- price_etag / price_last_modified permitem requisições condicionais (304)
+-- e o índice parcial atende a busca "ativos mais desatualizados primeiro".
+
+ALTER TABLE public.products ADD COLUMN IF NOT EXISTS price_etag TEXT;
+ALTER TABLE public.products ADD COLUMN IF NOT EXISTS price_last_modified TEXT;
+
+CREATE INDEX IF NOT EXISTS idx_products_active_last_checked
+    ON public.products(last_checked)
+    WHERE is_active = TRUE;
+
+-- Grava o resultado de uma rodada em lote: só UPDATE (produto removido no meio
+-- da rodada não volta como linha parcial) e log apenas dos que ainda existem
+CREATE OR REPLACE FUNCTION public.apply_price_refresh(p_rows JSONB)
+RETURNS TABLE (updated INT, logged INT) AS $$
+BEGIN
+    RETURN QUERY
+    WITH x AS (
+        SELECT * FROM jsonb_to_recordset(p_rows) AS r(
+            id UUID,
+            current_price NUMERIC,
+            original_price NUMERIC,
+            discount_percentage INT,
+            price_etag TEXT,
+            price_last_modified TEXT,
+            last_checked TIMESTAMPTZ,
+            updated_at TIMESTAMPTZ,
+            old_price NUMERIC,
+            changed BOOLEAN
+        )
+    ), upd AS (
+        UPDATE public.products p SET
+            current_price = x.current_price,
+            original_price = x.original_price,
+            discount_percentage = x.discount_percentage,
+            price_etag = x.price_etag,
+            price_last_modified = x.price_last_modified,
+            last_checked = x.last_checked,
+            updated_at = x.updated_at
+        FROM x
+        WHERE p.id = x.id
+        RETURNING p.id, x.changed, x.old_price, x.current_price
+    ), logs AS (
+        INSERT INTO public.product_logs (product_id, old_price, new_price, change_type)
+        SELECT upd.id, upd.old_price, upd.current_price, 'price_change'
+        FROM upd
+        WHERE upd.changed
+        RETURNING 1
+    )
+    SELECT (SELECT COUNT(*) FROM upd)::INT, (SELECT COUNT(*) FROM logs)::INT;
+END;
+$$ LANGUAGE plpgsql;
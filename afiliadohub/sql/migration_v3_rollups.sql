@@ -0,0 +1,92 @@
+-- Rollups diários pré-agregados (por dia / loja / categoria)
+-- Mantidos incrementalmente pelo Scheduler (tarefa "daily_rollups")
+
+CREATE TABLE IF NOT EXISTS public.daily_rollups (
+    day DATE NOT NULL,
+    store VARCHAR(50) NOT NULL DEFAULT '',
+    category VARCHAR(100) NOT NULL DEFAULT '',
+    products_added INT DEFAULT 0,
+    price_changes INT DEFAULT 0,
+    telegram_sends INT DEFAULT 0,
+    sales_count INT DEFAULT 0,
+    sale_amount NUMERIC(14, 2) DEFAULT 0,
+    commission_amount NUMERIC(14, 2) DEFAULT 0,
+    updated_at TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (day, store, category)
+);
+
+CREATE INDEX IF NOT EXISTS idx_daily_rollups_store_day ON public.daily_rollups(store, day);
+
+-- Índices usados pela leitura incremental (watermark + chave)
+CREATE INDEX IF NOT EXISTS idx_product_logs_created ON public.product_logs(created_at, id);
+CREATE INDEX IF NOT EXISTS idx_product_stats_last_sent ON public.product_stats(last_sent, product_id);
+
+-- Comissões entram no rollup pela data de inserção: vendas importadas com
+-- sold_at antigo têm calculated_at atrás do watermark e nunca seriam lidas
+ALTER TABLE IF EXISTS public.commissions ADD COLUMN IF NOT EXISTS created_at TIMESTAMPTZ;
+UPDATE public.commissions SET created_at = calculated_at WHERE created_at IS NULL;
+ALTER TABLE IF EXISTS public.commissions ALTER COLUMN created_at SET DEFAULT NOW();
+CREATE INDEX IF NOT EXISTS idx_commissions_created ON public.commissions(created_at, id);
+
+-- Função RPC para somar deltas aos rollups (idempotente por chave dentro do lote)
+CREATE OR REPLACE FUNCTION merge_daily_rollups(p_rows JSONB)
+RETURNS VOID AS $$
+BEGIN
+    INSERT INTO public.daily_rollups AS r (
+        day, store, category, products_added, price_changes, telegram_sends,
+        sales_count, sale_amount, commission_amount, updated_at
+    )
+    SELECT
+        (x->>'day')::DATE,
+        COALESCE(x->>'store', ''),
+        COALESCE(x->>'category', ''),
+        COALESCE((x->>'products_added')::INT, 0),
+        COALESCE((x->>'price_changes')::INT, 0),
+        COALESCE((x->>'telegram_sends')::INT, 0),
+        COALESCE((x->>'sales_count')::INT, 0),
+        COALESCE((x->>'sale_amount')::NUMERIC, 0),
+        COALESCE((x->>'commission_amount')::NUMERIC, 0),
+        NOW()
+    FROM jsonb_array_elements(p_rows) AS x
+    ON CONFLICT (day, store, category) DO UPDATE SET
+        products_added = r.products_added + EXCLUDED.products_added,
+        price_changes = r.price_changes + EXCLUDED.price_changes,
+        telegram_sends = r.telegram_sends + EXCLUDED.telegram_sends,
+        sales_count = r.sales_count + EXCLUDED.sales_count,
+        sale_amount = r.sale_amount + EXCLUDED.sale_amount,
+        commission_amount = r.commission_amount + EXCLUDED.commission_amount,
+        updated_at = NOW();
+END;
+$$ LANGUAGE plpgsql;
+
+-- Série diária somada no banco (uma linha por dia, lojas/categorias somadas
+-- quando não filtradas); lida em páginas por dia, sem o corte de max-rows
+CREATE OR REPLACE FUNCTION get_daily_rollup_series(
+    p_start DATE,
+    p_end DATE,
+    p_store TEXT DEFAULT NULL,
+    p_category TEXT DEFAULT NULL
+)
+RETURNS TABLE (
+    day DATE,
+    products_added BIGINT,
+    price_changes BIGINT,
+    telegram_sends BIGINT,
+    sales_count BIGINT,
+    sale_amount NUMERIC,
+    commission_amount NUMERIC
+) AS $$
+    SELECT
+        r.day,
+        SUM(r.products_added),
+        SUM(r.price_changes),
+        SUM(r.telegram_sends),
+        SUM(r.sales_count),
+        SUM(r.sale_amount),
+        SUM(r.commission_amount)
+    FROM public.daily_rollups r
+    WHERE r.day BETWEEN p_start AND p_end
+      AND (p_store IS NULL OR r.store = p_store)
+      AND (p_category IS NULL OR r.category = p_category)
+    GROUP BY r.day;
+$$ LANGUAGE sql STABLE;
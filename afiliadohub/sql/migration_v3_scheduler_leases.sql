@@ -0,0 +1,59 @@
+-- Lease do agendador: garante que só uma réplica da API dispara as tarefas
+-- O dono renova o lease por heartbeat; se parar de renovar, o lease expira
+-- e outra réplica assume.
+
+CREATE TABLE IF NOT EXISTS public.scheduler_leases (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at TIMESTAMPTZ NOT NULL,
+    acquired_at TIMESTAMPTZ DEFAULT NOW(),
+    renewed_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- Adquire ou renova o lease em uma única instrução (sem corrida entre réplicas)
+CREATE OR REPLACE FUNCTION public.acquire_scheduler_lease(
+    p_name TEXT,
+    p_owner TEXT,
+    p_ttl_seconds INTEGER
+)
+RETURNS BOOLEAN AS $$
+DECLARE
+    v_owner TEXT;
+BEGIN
+    INSERT INTO public.scheduler_leases (name, owner, expires_at)
+    VALUES (p_name, p_owner, NOW() + make_interval(secs => p_ttl_seconds))
+    ON CONFLICT (name) DO UPDATE
+        SET owner = EXCLUDED.owner,
+            expires_at = EXCLUDED.expires_at,
+            acquired_at = CASE
+                WHEN scheduler_leases.owner = EXCLUDED.owner THEN scheduler_leases.acquired_at
+                ELSE NOW()
+            END,
+            renewed_at = NOW()
+        WHERE scheduler_leases.owner = EXCLUDED.owner
+           OR scheduler_leases.expires_at < NOW()
+    RETURNING owner INTO v_owner;
+
+    RETURN v_owner IS NOT NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Último disparo de uma tarefa no JSON de settings.scheduler_state
+-- Grava só a chave da tarefa e nunca volta no tempo: réplicas com uma cópia
+-- antiga do estado não desfazem o que o líder gravou
+CREATE OR REPLACE FUNCTION public.merge_scheduler_state(
+    p_key TEXT,
+    p_task_id TEXT,
+    p_last_run TIMESTAMP
+)
+RETURNS VOID AS $$
+BEGIN
+    INSERT INTO public.settings (key, value, description, updated_at)
+    VALUES (p_key, jsonb_build_object(p_task_id, p_last_run), 'Último disparo das tarefas do agendador', NOW())
+    ON CONFLICT (key) DO UPDATE
+        SET value = settings.value || EXCLUDED.value,
+            updated_at = NOW()
+        WHERE settings.value->>p_task_id IS NULL
+           OR (settings.value->>p_task_id)::TIMESTAMP < p_last_run;
+END;
+$$ LANGUAGE plpgsql;
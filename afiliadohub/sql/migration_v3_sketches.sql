@@ -0,0 +1,72 @@
+-- Sketches de métricas (HyperLogLog / Count-Min / Space-Saving) por dia e loja
+-- Gravados por cada processo da API (SketchRecorder.start no lifespan); payload em JSON serializado
+-- Uma linha por nó (node): cada réplica só reescreve as suas, a leitura mescla todas
+
+CREATE TABLE IF NOT EXISTS public.metric_sketches (
+    day DATE NOT NULL,
+    store VARCHAR(50) NOT NULL DEFAULT '',
+    metric VARCHAR(100) NOT NULL,
+    node VARCHAR(200) NOT NULL DEFAULT '',
+    payload JSONB NOT NULL,
+    updated_at TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (day, store, metric, node)
+);
+
+CREATE INDEX IF NOT EXISTS idx_metric_sketches_metric_day ON public.metric_sketches(metric, day);
+
+-- Instalações anteriores (chave sem node)
+ALTER TABLE public.metric_sketches ADD COLUMN IF NOT EXISTS node VARCHAR(200) NOT NULL DEFAULT '';
+ALTER TABLE public.metric_sketches DROP CONSTRAINT IF EXISTS metric_sketches_pkey;
+ALTER TABLE public.metric_sketches ADD PRIMARY KEY (day, store, metric, node);
+
+-- Linhas paradas de nós que sumiram (compactadas na linha node = '')
+CREATE INDEX IF NOT EXISTS idx_metric_sketches_idle ON public.metric_sketches(updated_at) WHERE node <> '';
+
+-- Compactação: grava os sketches mesclados na linha node = '' e apaga as
+-- linhas consumidas. Só aplica se nenhuma linha lida (consumidas e alvos)
+-- mudou desde a leitura; senão devolve FALSE e o próximo flush relê.
+CREATE OR REPLACE FUNCTION public.compact_metric_sketches(p_merged JSONB, p_consumed JSONB)
+RETURNS BOOLEAN AS $$
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('compact_metric_sketches'));
+
+    PERFORM 1
+    FROM public.metric_sketches s
+    JOIN jsonb_array_elements(p_consumed) c
+      ON s.day = (c->>'day')::DATE AND s.store = c->>'store'
+     AND s.metric = c->>'metric' AND s.node = c->>'node'
+    FOR UPDATE OF s;
+
+    IF EXISTS (
+        SELECT 1
+        FROM jsonb_array_elements(p_consumed) c
+        LEFT JOIN public.metric_sketches s
+          ON s.day = (c->>'day')::DATE AND s.store = c->>'store'
+         AND s.metric = c->>'metric' AND s.node = c->>'node'
+        WHERE s.updated_at IS DISTINCT FROM (c->>'updated_at')::TIMESTAMPTZ
+    ) OR EXISTS (
+        SELECT 1
+        FROM jsonb_array_elements(p_merged) m
+        LEFT JOIN public.metric_sketches s
+          ON s.day = (m->>'day')::DATE AND s.store = m->>'store'
+         AND s.metric = m->>'metric' AND s.node = ''
+        WHERE s.updated_at IS DISTINCT FROM (m->>'updated_at')::TIMESTAMPTZ
+    ) THEN
+        RETURN FALSE;
+    END IF;
+
+    INSERT INTO public.metric_sketches (day, store, metric, node, payload, updated_at)
+    SELECT (m->>'day')::DATE, m->>'store', m->>'metric', '', m->'payload', NOW()
+    FROM jsonb_array_elements(p_merged) m
+    ON CONFLICT (day, store, metric, node) DO UPDATE
+        SET payload = EXCLUDED.payload,
+            updated_at = NOW();
+
+    DELETE FROM public.metric_sketches s
+    USING jsonb_array_elements(p_consumed) c
+    WHERE s.day = (c->>'day')::DATE AND s.store = c->>'store'
+      AND s.metric = c->>'metric' AND s.node = c->>'node';
+
+    RETURN TRUE;
+END;
+$$ LANGUAGE plpgsql;